@@ -2,17 +2,21 @@
 
 #include <ESP8266WiFi.h>
 #include <ESP8266HTTPClient.h>
+#include <time.h>
 
 // WiFi Credentials
 const char* ssid = "YOUR_WIFI_SSID";
 const char* password = "YOUR_WIFI_PASSWORD";
 
-// Server URL
-const char* serverUrl = "http://YOUR_SERVER_IP:8000/api/bin/update/";
+// Server URL (the batch endpoint takes one or many readings)
+const char* serverUrl = "http://YOUR_SERVER_IP:8000/api/bin/update/batch/";
 
 // Bin ID
 String binId = "BIN001";
 
+// Send readings in the compact binary format instead of JSON
+const bool useBinaryPayload = true;
+
 // Pins
 const int trigPin = D1;
 const int echoPin = D2;
@@ -20,57 +24,117 @@ const int blueLED = D5;   // WiFi indicator
 const int greenLED = D6;  // Normal status
 const int redLED = D7;    // Bin full
 
+// Reporting: a reading is queued when the level moves by levelDelta,
+// crosses fullLevel, or nothing was queued for heartbeatInterval.
+// Queued readings are sent once the oldest has waited flushInterval,
+// a batch is full, or straight away when the bin turns full or empty.
+const int levelDelta = 5;                        // percent
+const int fullLevel = 75;                        // percent, matches the server
+const unsigned long sampleInterval = 5000;       // 5 seconds
+const unsigned long heartbeatInterval = 900000;  // 15 minutes
+const unsigned long flushInterval = 60000;       // 1 minute
+const int batchSize = 16;                        // readings per request
+
+// Retries back off exponentially with full jitter, so bins that lost
+// the server together don't come back together. After boot or a WiFi
+// reconnect the first send is spread over reconnectSpread.
+const unsigned long backoffMin = 2000;           // 2 seconds
+const unsigned long backoffMax = 300000;         // 5 minutes
+const unsigned long reconnectSpread = 30000;     // 30 seconds
+
+// Ring buffer of unsent readings, kept in RAM; the oldest reading is
+// overwritten once it is full (about 3 hours of changes at 1 a minute)
+struct Reading {
+  uint8_t level;
+  unsigned long takenAt;  // millis()
+};
+const int ringSize = 192;
+Reading ring[ringSize];
+int ringHead = 0;   // oldest unsent reading
+int ringCount = 0;
+unsigned long dropped = 0;
+
 // Variables
 long duration;
 int distance;
 int binHeight = 30;  // cm
 int currentLevel = 0;
-unsigned long lastUpdate = 0;
-const long updateInterval = 60000;  // 1 minute
+int lastQueuedLevel = -1;
+unsigned long lastQueued = 0;
+unsigned long lastSample = 0;
+unsigned long nextAttempt = 0;
+unsigned long backoff = backoffMin;
+bool urgent = false;
+bool wasConnected = false;
+
+// One client and HTTP session for every request, so the TCP connection
+// is kept alive between batches instead of reopened each time
+WiFiClient client;
+HTTPClient http;
+const char* collectedHeaders[] = {"Retry-After"};
 
 void setup() {
   Serial.begin(115200);
-  
+
   pinMode(trigPin, OUTPUT);
   pinMode(echoPin, INPUT);
   pinMode(blueLED, OUTPUT);
   pinMode(greenLED, OUTPUT);
   pinMode(redLED, OUTPUT);
-  
-  // Connect to WiFi
+
+  randomSeed(ESP.getChipId() ^ micros());
+
+  // Connect to WiFi in the background; readings are buffered until then
+  WiFi.mode(WIFI_STA);
+  WiFi.setAutoReconnect(true);
   WiFi.begin(ssid, password);
-  Serial.print("Connecting to WiFi");
-  
-  while (WiFi.status() != WL_CONNECTED) {
-    delay(500);
-    Serial.print(".");
-  }
-  
-  Serial.println("\nWiFi Connected!");
-  Serial.println(WiFi.localIP());
-  
-  digitalWrite(blueLED, HIGH);  // WiFi connected
+  Serial.println("Connecting to WiFi");
+
+  // UTC from NTP once online, to timestamp buffered readings
+  configTime(0, 0, "pool.ntp.org", "time.nist.gov");
+
+  http.setReuse(true);
+  http.setTimeout(10000);
+
   digitalWrite(greenLED, HIGH); // Normal status
 }
 
 void loop() {
   // Check WiFi connection
-  if (WiFi.status() == WL_CONNECTED) {
-    digitalWrite(blueLED, HIGH);
-  } else {
-    digitalWrite(blueLED, LOW);
+  bool connected = WiFi.status() == WL_CONNECTED;
+  if (connected && !wasConnected) {
+    Serial.print("WiFi Connected! ");
+    Serial.println(WiFi.localIP());
+    // Don't let a whole area of bins hit the server the moment WiFi returns
+    nextAttempt = millis() + random(reconnectSpread);
+  }
+  wasConnected = connected;
+  digitalWrite(blueLED, connected ? HIGH : LOW);
+
+  if (millis() - lastSample >= sampleInterval) {
+    lastSample = millis();
+    measureLevel();
+    queueIfChanged();
   }
-  
+
+  if (connected && ringCount > 0 && (long) (millis() - nextAttempt) >= 0 && sendDue()) {
+    sendBatch();
+  }
+
+  delay(100);
+}
+
+void measureLevel() {
   // Measure distance
   digitalWrite(trigPin, LOW);
   delayMicroseconds(2);
   digitalWrite(trigPin, HIGH);
   delayMicroseconds(10);
   digitalWrite(trigPin, LOW);
-  
+
   duration = pulseIn(echoPin, HIGH);
   distance = duration * 0.034 / 2;
-  
+
   // Calculate fill level percentage
   if (distance < binHeight) {
     currentLevel = map(distance, binHeight, 0, 0, 100);
@@ -78,50 +142,141 @@ void loop() {
   } else {
     currentLevel = 0;
   }
-  
+
   Serial.print("Distance: ");
   Serial.print(distance);
   Serial.print(" cm | Level: ");
   Serial.print(currentLevel);
   Serial.println("%");
-  
+
   // Update LED status
-  if (currentLevel >= 75) {
+  if (currentLevel >= fullLevel) {
     digitalWrite(greenLED, LOW);
     digitalWrite(redLED, HIGH);
   } else {
     digitalWrite(greenLED, HIGH);
     digitalWrite(redLED, LOW);
   }
-  
-  // Send data to server every minute
-  if (millis() - lastUpdate >= updateInterval) {
-    sendDataToServer();
-    lastUpdate = millis();
+}
+
+void queueIfChanged() {
+  bool first = lastQueuedLevel < 0;
+  bool crossed = !first && (currentLevel >= fullLevel) != (lastQueuedLevel >= fullLevel);
+  bool moved = first || abs(currentLevel - lastQueuedLevel) >= levelDelta;
+  bool heartbeat = millis() - lastQueued >= heartbeatInterval;
+  if (!(moved || crossed || heartbeat)) {
+    return;
+  }
+
+  if (ringCount == ringSize) {
+    ringHead = (ringHead + 1) % ringSize;
+    ringCount--;
+    dropped++;
+  }
+  Reading& reading = ring[(ringHead + ringCount) % ringSize];
+  reading.level = (uint8_t) currentLevel;
+  reading.takenAt = millis();
+  ringCount++;
+
+  // The first reading after boot goes out as soon as the reconnect jitter allows
+  urgent = urgent || crossed || first;
+  lastQueuedLevel = currentLevel;
+  lastQueued = millis();
+}
+
+bool sendDue() {
+  return urgent
+      || ringCount >= batchSize
+      || millis() - ring[ringHead].takenAt >= flushInterval;
+}
+
+// Unix time of a buffered reading, or 0 ("use the server's clock")
+// until NTP has synced
+uint32_t readingTime(const Reading& reading) {
+  time_t now = time(nullptr);
+  if (now < 1600000000) {
+    return 0;
   }
-  
-  delay(5000);  // Check every 5 seconds
+  return (uint32_t) (now - (millis() - reading.takenAt) / 1000);
 }
 
-void sendDataToServer() {
-  if (WiFi.status() == WL_CONNECTED) {
-    HTTPClient http;
-    WiFiClient client;
-    
-    http.begin(client, serverUrl);
+void sendBatch() {
+  int count = min(ringCount, batchSize);
+
+  http.begin(client, serverUrl);
+  http.collectHeaders(collectedHeaders, 1);
+
+  int httpCode;
+  if (useBinaryPayload) {
+    // Fixed layout, see codec.py: header 'SB' | version | id_len | count,
+    // then per reading bin_id | level | ts (0 = use server time).
+    static uint8_t payload[8 + batchSize * (50 + 5)];
+    uint8_t idLen = binId.length();
+    size_t len = 0;
+    payload[len++] = 'S';
+    payload[len++] = 'B';
+    payload[len++] = 1;       // version
+    payload[len++] = idLen;
+    payload[len++] = count;   // count (u32, little-endian)
+    payload[len++] = 0;
+    payload[len++] = 0;
+    payload[len++] = 0;
+    for (int i = 0; i < count; i++) {
+      const Reading& reading = ring[(ringHead + i) % ringSize];
+      uint32_t ts = readingTime(reading);
+      memcpy(payload + len, binId.c_str(), idLen);
+      len += idLen;
+      payload[len++] = reading.level;
+      payload[len++] = ts & 0xFF;
+      payload[len++] = (ts >> 8) & 0xFF;
+      payload[len++] = (ts >> 16) & 0xFF;
+      payload[len++] = (ts >> 24) & 0xFF;
+    }
+
+    http.addHeader("Content-Type", "application/x-smartbin");
+    httpCode = http.POST(payload, len);
+  } else {
     http.addHeader("Content-Type", "application/json");
-    
-    String jsonData = "{\"bin_id\":\"" + binId + "\",\"level\":" + String(currentLevel) + "}";
-    
-    int httpCode = http.POST(jsonData);
-    
-    if (httpCode > 0) {
-      String response = http.getString();
-      Serial.println("Server Response: " + response);
-    } else {
-      Serial.println("Error sending data");
+    String jsonData = "[";
+    for (int i = 0; i < count; i++) {
+      const Reading& reading = ring[(ringHead + i) % ringSize];
+      uint32_t ts = readingTime(reading);
+      jsonData += (i ? ",{" : "{");
+      jsonData += "\"bin_id\":\"" + binId + "\",\"level\":" + String(reading.level);
+      if (ts) {
+        jsonData += ",\"ts\":" + String(ts);
+      }
+      jsonData += "}";
     }
-    
-    http.end();
+    jsonData += "]";
+    httpCode = http.POST(jsonData);
   }
-}
\ No newline at end of file
+
+  bool retry = httpCode <= 0 || httpCode == 408 || httpCode == 429 || httpCode >= 500;
+  if (!retry) {
+    // Delivered, or rejected as malformed and not worth resending
+    if (httpCode >= 300) {
+      Serial.println("Batch rejected: " + String(httpCode));
+    }
+    String response = http.getString();
+    Serial.println("Server Response: " + response);
+    ringHead = (ringHead + count) % ringSize;
+    ringCount -= count;
+    urgent = false;
+    backoff = backoffMin;
+    nextAttempt = millis();
+  } else {
+    // Network error, or the server is overloaded (429/503 with Retry-After)
+    unsigned long wait = random(backoff + 1);
+    long retryAfter = http.header("Retry-After").toInt();
+    if (retryAfter > 0) {
+      wait = max(wait, (unsigned long) retryAfter * 1000 + random(backoffMin));
+    }
+    backoff = min(backoff * 2, backoffMax);
+    nextAttempt = millis() + wait;
+    Serial.println("Error sending data (" + String(httpCode) + "), retrying in " + String(wait / 1000) + " s");
+  }
+
+  // Keeps the connection open for the next batch since setReuse(true)
+  http.end();
+}
@@ -0,0 +1,247 @@
+"""Daily per-municipality analytics rollups.
+
+Two tables are kept current as work is done:
+
+- ``MunicipalityDailyStats`` counts collections collected (and the time
+  each took) and collections verified (and the revenue they credited).
+- ``MunicipalityDailyWaste`` counts collected recycler bookings, their kg
+  and payout per waste type.
+
+Each event is one ``F()`` update of one row, in the transaction that
+caused it:
+
+- a ``WasteCollection`` saved as collected counts on the day of
+  ``collected_at``
+- ``wallet.pay_collection`` calls ``record_verified`` on the day of the
+  credit
+- a ``RecyclerBooking`` saved as collected counts on its ``collection_date``
+
+Every payment in a municipality would update the same daily row, so
+verified collections go to one of ``VERIFIED_SHARDS`` rows of the day
+picked at random, as wallet credits do. The other events use shard 0.
+
+``summary`` answers from the rollups alone. It reads at most
+``VERIFIED_SHARDS`` rows per municipality per day, whatever the number of
+collections and bookings behind them.
+
+``aggregate_raw`` runs the same numbers as ad-hoc queries over the raw
+tables, and ``rebuild`` (the ``backfill_analytics`` command) uses it to
+recompute a date range.
+
+Time to collection is measured from the task's ``created_at``. Tasks are
+created when a bin is reported full, either by the scheduler or by a
+municipality user. Queryset ``update()`` calls skip signals, so callers
+that change statuses that way must record the event themselves.
+"""
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    MunicipalityDailyStats, MunicipalityDailyWaste, Recycler, RecyclerBooking, WalletTransaction, WasteCollection,
+)
+
+COLLECTED_STATUSES = ['collected', 'verified']
+
+STAT_FIELDS = ['collections_collected', 'collection_seconds', 'collections_verified', 'revenue']
+
+VERIFIED_SHARDS = getattr(settings, 'SMARTBIN_WALLET', {}).get('CREDIT_SHARDS', 8)
+
+
+def _add(model, keys, **increments):
+    rows = model.objects.filter(**keys)
+    changes = {field: F(field) + value for field, value in increments.items()}
+    if not rows.update(**changes):
+        model.objects.bulk_create([model(**keys)], ignore_conflicts=True)
+        rows.update(**changes)
+
+
+def _seconds(collection):
+    return max(0, int((collection.collected_at - collection.created_at).total_seconds()))
+
+
+def record_collected(collection):
+    _add(
+        MunicipalityDailyStats,
+        {'municipality_id': collection.municipality_id, 'day': timezone.localdate(collection.collected_at)},
+        collections_collected=1, collection_seconds=_seconds(collection),
+    )
+
+
+def record_verified(municipality_id, amount):
+    _add(
+        MunicipalityDailyStats,
+        {'municipality_id': municipality_id, 'day': timezone.localdate(), 'shard': random.randrange(VERIFIED_SHARDS)},
+        collections_verified=1, revenue=amount,
+    )
+
+
+def record_booking(booking):
+    municipality_id = Recycler.objects.filter(pk=booking.recycler_id).values_list('municipality_id', flat=True)[0]
+    _add(
+        MunicipalityDailyWaste,
+        {'municipality_id': municipality_id, 'day': booking.collection_date, 'waste_type_id': booking.waste_type_id},
+        bookings=1, weight=booking.weight, amount=booking.amount,
+    )
+
+
+@receiver(post_init, sender=WasteCollection)
+@receiver(post_init, sender=RecyclerBooking)
+def _remember_status(sender, instance, **kwargs):
+    instance._analytics_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=WasteCollection)
+def _collection_saved(sender, instance, **kwargs):
+    if instance.status == 'collected' and instance._analytics_status != 'collected' and instance.collected_at:
+        record_collected(instance)
+    instance._analytics_status = instance.status
+
+
+@receiver(post_save, sender=RecyclerBooking)
+def _booking_saved(sender, instance, **kwargs):
+    if instance.status == 'collected' and instance._analytics_status != 'collected':
+        record_booking(instance)
+    instance._analytics_status = instance.status
+
+
+def day_bounds(start, end):
+    """Datetimes spanning the local days ``start`` to ``end`` inclusive."""
+    begin = datetime.combine(start, dt_time.min)
+    finish = datetime.combine(end + timedelta(days=1), dt_time.min)
+    if settings.USE_TZ:
+        return timezone.make_aware(begin), timezone.make_aware(finish)
+    return begin, finish
+
+
+def aggregate_raw(start, end, municipality_ids=None):
+    """Compute the rollups for days ``start`` to ``end`` from the raw tables.
+
+    Returns ``(stats, waste)``: dicts keyed by ``(municipality_id, day)``
+    and ``(municipality_id, day, waste_type)``.
+    """
+    begin, finish = day_bounds(start, end)
+    collections = WasteCollection.objects.filter(
+        status__in=COLLECTED_STATUSES, collected_at__gte=begin, collected_at__lt=finish,
+    )
+    credits = WalletTransaction.objects.filter(
+        kind='collection_credit', created_at__gte=begin, created_at__lt=finish,
+    )
+    bookings = RecyclerBooking.objects.filter(status='collected', collection_date__gte=start, collection_date__lte=end)
+    if municipality_ids is not None:
+        collections = collections.filter(municipality_id__in=municipality_ids)
+        credits = credits.filter(municipality_id__in=municipality_ids)
+        bookings = bookings.filter(recycler__municipality_id__in=municipality_ids)
+
+    stats = {}
+
+    def row(key):
+        if key not in stats:
+            stats[key] = dict.fromkeys(STAT_FIELDS, 0)
+        return stats[key]
+
+    duration = ExpressionWrapper(F('collected_at') - F('created_at'), output_field=DurationField())
+    for item in (
+        collections.annotate(day=TruncDate('collected_at')).values('municipality_id', 'day')
+        .annotate(n=Count('id'), time=Sum(duration)).order_by()
+    ):
+        stats_row = row((item['municipality_id'], item['day']))
+        stats_row['collections_collected'] = item['n']
+        stats_row['collection_seconds'] = int(item['time'].total_seconds()) if item['time'] else 0
+    for item in (
+        credits.annotate(day=TruncDate('created_at')).values('municipality_id', 'day')
+        .annotate(n=Count('id'), revenue=Sum('amount')).order_by()
+    ):
+        stats_row = row((item['municipality_id'], item['day']))
+        stats_row['collections_verified'] = item['n']
+        stats_row['revenue'] = item['revenue']
+
+    waste = {
+        (item['recycler__municipality_id'], item['collection_date'], item['waste_type_id']): {
+            'bookings': item['n'], 'weight': item['weight'], 'amount': item['amount'],
+        }
+        for item in (
+            bookings.values('recycler__municipality_id', 'collection_date', 'waste_type_id')
+            .annotate(n=Count('id'), weight=Sum('weight'), amount=Sum('amount')).order_by()
+        )
+    }
+    return stats, waste
+
+
+def rebuild(start, end, municipality_ids=None):
+    """Replace the rollups for days ``start`` to ``end`` with ``aggregate_raw``. Returns rows written.
+
+    The old rows are deleted before the raw tables are read, in the same
+    transaction. The delete waits for increments that already updated a
+    row, so the aggregate counts their events, and locks the rows, so later
+    increments wait and then add to the new rows.
+    """
+    with transaction.atomic():
+        for model in (MunicipalityDailyStats, MunicipalityDailyWaste):
+            old = model.objects.filter(day__gte=start, day__lte=end)
+            if municipality_ids is not None:
+                old = old.filter(municipality_id__in=municipality_ids)
+            old.delete()
+        stats, waste = aggregate_raw(start, end, municipality_ids)
+        MunicipalityDailyStats.objects.bulk_create(
+            (MunicipalityDailyStats(municipality_id=m, day=day, **values) for (m, day), values in stats.items()),
+            batch_size=500,
+        )
+        MunicipalityDailyWaste.objects.bulk_create(
+            (
+                MunicipalityDailyWaste(municipality_id=m, day=day, waste_type_id=code, **values)
+                for (m, day, code), values in waste.items()
+            ),
+            batch_size=500,
+        )
+    return len(stats) + len(waste)
+
+
+def _totals(values):
+    collected = values['collections_collected'] or 0
+    return {
+        'collections_collected': collected,
+        'collections_verified': values['collections_verified'] or 0,
+        'revenue': values['revenue'] or Decimal(0),
+        'avg_hours_to_collection': round(values['collection_seconds'] / collected / 3600, 2) if collected else None,
+    }
+
+
+def summary(start, end, municipality_ids=None):
+    """Collections, revenue and recycling between days ``start`` and ``end``, from the rollups only."""
+    stats = MunicipalityDailyStats.objects.filter(day__gte=start, day__lte=end)
+    waste = MunicipalityDailyWaste.objects.filter(day__gte=start, day__lte=end)
+    if municipality_ids is not None:
+        stats = stats.filter(municipality_id__in=municipality_ids)
+        waste = waste.filter(municipality_id__in=municipality_ids)
+    sums = {field: Sum(field) for field in STAT_FIELDS}
+
+    days = [
+        {'day': item['day'], **_totals(item)}
+        for item in stats.values('day').annotate(**sums).order_by('day')
+    ]
+    municipalities = [
+        {'id': item['municipality_id'], 'name': item['municipality__name'], **_totals(item)}
+        for item in stats.values('municipality_id', 'municipality__name').annotate(**sums).order_by('municipality_id')
+    ]
+    recycled = {
+        item['waste_type_id']: {'bookings': item['bookings'], 'kg': item['kg'], 'amount': item['paid']}
+        for item in waste.values('waste_type_id')
+        .annotate(bookings=Sum('bookings'), kg=Sum('weight'), paid=Sum('amount')).order_by('waste_type_id')
+    }
+    return {
+        'start': start,
+        'end': end,
+        'totals': _totals(stats.aggregate(**sums)),
+        'recycled': recycled,
+        'days': days,
+        'municipalities': municipalities,
+    }
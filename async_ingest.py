@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .telemetry import record_history, store_levels
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Ingestion queue is full')
+        self.retry_after = retry_after
+
+
+def _write_batch(latest, superseded):
+    try:
+        found = store_levels(latest)
+        record_history(superseded)
+        return found
+    finally:
+        close_old_connections()
+
+
+class IngestQueue:
+    """Bounded asyncio queue drained by batched database workers.
+
+    ``put`` acks a reading without touching the database; ``workers``
+    background tasks pull up to ``batch_size`` readings at a time, keep
+    the newest reading per bin and write them in one bulk update; older
+    readings of the same bin only go to its history, as in the batch
+    endpoint. When the queue holds ``max_size`` readings, ``put`` raises
+    ``QueueFull`` with a retry-after estimate based on the recent drain
+    rate.
+
+    The queue lives on the server's event loop, so it only works under an
+    ASGI server; ``drain`` (run by ``IngestLifespan`` at shutdown) writes
+    what is still queued.
+    """
+
+    def __init__(self, max_size=10000, workers=4, batch_size=500, retry_after=5):
+        self.max_size = max_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retry_after = retry_after
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+        self._drain_rate = 0.0  # readings/sec, exponentially smoothed
+        self.counters = {'accepted': 0, 'rejected': 0, 'written': 0, 'batches': 0}
+
+    def put(self, bin_id, level, ts):
+        self._start()
+        try:
+            self._queue.put_nowait((bin_id, level, ts))
+        except asyncio.QueueFull:
+            self.counters['rejected'] += 1
+            raise QueueFull(self.estimate_retry_after())
+        self.counters['accepted'] += 1
+
+    async def drain(self):
+        """Wait for every queued reading to be written, then stop the workers."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        pending = self._queue.qsize()
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        self._loop, self._queue, self._tasks = None, None, []
+        if pending:
+            logger.info('Wrote %d queued bin readings before shutdown', pending)
+
+    def estimate_retry_after(self):
+        if self._drain_rate <= 0:
+            return self.retry_after
+        return max(1, min(60, math.ceil(self._queue.qsize() / self._drain_rate)))
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        stats['drain_rate'] = round(self._drain_rate, 1)
+        return stats
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # The queue and its workers belong to the loop serving requests
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            latest = {}
+            superseded = []
+            for bin_id, level, ts in batch:
+                if bin_id not in latest or ts >= latest[bin_id][1]:
+                    if bin_id in latest:
+                        superseded.append((bin_id, *latest[bin_id]))
+                    latest[bin_id] = (level, ts)
+                else:
+                    superseded.append((bin_id, level, ts))
+
+            start = time.monotonic()
+            try:
+                await sync_to_async(_write_batch, thread_sensitive=False)(latest, superseded)
+            except Exception:
+                logger.exception('Failed to write %d queued bin readings', len(batch))
+            else:
+                self.counters['written'] += len(latest)
+            finally:
+                self.counters['batches'] += 1
+                for _ in batch:
+                    queue.task_done()
+
+            rate = self.workers * len(batch) / max(time.monotonic() - start, 1e-6)
+            self._drain_rate = rate if not self._drain_rate else 0.8 * self._drain_rate + 0.2 * rate
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        config = getattr(settings, 'SMARTBIN_INGEST_QUEUE', {})
+        _queue = IngestQueue(
+            max_size=config.get('MAX_SIZE', 10000),
+            workers=config.get('WORKERS', 4),
+            batch_size=config.get('BATCH_SIZE', 500),
+            retry_after=config.get('RETRY_AFTER', 5),
+        )
+    return _queue
+
+
+class IngestLifespan:
+    """ASGI wrapper answering lifespan events, draining the queue at shutdown.
+
+    Django 3.2 rejects lifespan connections, so without it the server
+    stops with readings still queued::
+
+        application = IngestLifespan(EventStreamRouter(get_asgi_application()))
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await get_queue().drain()
+                except Exception:
+                    logger.exception('Failed to drain the ingestion queue')
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,10 @@
+"""End-to-end load testing on one machine.
+
+``data`` generates a synthetic dataset at a chosen scale, ``fleet``
+replays bin fill curves against the IoT endpoint, ``sessions`` scripts
+every role through its pages, and ``report`` records latency, throughput
+and database queries per URL name. ``manage.py run_benchmark`` runs them
+together in-process, so query counts are exact and no server is needed.
+The other ``bench_*`` commands run inside ``sandbox``, which rolls back
+everything they write.
+"""
@@ -0,0 +1,144 @@
+"""Synthetic municipalities, accounts, bins, collections and bookings."""
+from datetime import timedelta
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from ..models import (
+    CollectionAgent, Customer, Municipality, Recycler, RecyclerBooking, SmartBin, WalletTransaction,
+    WasteCollection, WasteType,
+)
+
+TAG = 'bench_'
+PASSWORD = 'bench-password'
+
+# Roughly Bengaluru; each municipality's bins sit within ~5 km of its depot
+ORIGIN = (12.97, 77.59)
+SPREAD = 0.05
+
+COLLECTION_STATUSES = ['pending', 'assigned', 'collected', 'verified']
+COLLECTION_WEIGHTS = [2, 3, 2, 3]
+BOOKING_STATUSES = ['pending', 'assigned', 'collected']
+
+
+def _users(prefix, n, password):
+    User.objects.bulk_create(User(username=f'{prefix}{i}', password=password) for i in range(n))
+    # bulk_create() does not return primary keys on every backend, so re-read rows
+    return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+def generate(municipalities=2, customers=200, agents=10, recyclers=3, collections=3, tag=TAG, rng=None):
+    """Create a dataset and return its rows grouped by role.
+
+    Per municipality: ``customers`` customers (one in ten awaiting
+    approval) with a bin each plus a tenth as many unlinked bins,
+    ``agents`` agents, ``recyclers`` recyclers, ``collections`` collections
+    per customer across every status and one recycler booking per
+    customer. Every user's password is ``PASSWORD``.
+    """
+    rng = rng or random.Random()
+    password = make_password(PASSWORD)
+    waste_types = list(WasteType.objects.filter(is_active=True).values_list('code', flat=True))
+    today = timezone.localdate()
+    dataset = {
+        'municipalities': [], 'customers': [], 'pending_customers': [], 'agents': [], 'recyclers': [],
+        'bins': [], 'unlinked_bins': [],
+    }
+
+    for m in range(municipalities):
+        prefix = f'{tag}m{m}_'
+        lat, lng = ORIGIN[0] + m * SPREAD * 4, ORIGIN[1]
+        municipality = Municipality.objects.create(
+            user=User.objects.create(username=f'{prefix}municipality', password=password),
+            name=f'Municipality {m}', area=f'Ward {m}', phone='0', address='Depot',
+            latitude=lat, longitude=lng,
+        )
+
+        Customer.objects.bulk_create(
+            Customer(user=u, municipality=municipality, phone='0', address='Street', wallet_balance=1000,
+                     is_approved=rng.random() >= 0.1)
+            for u in _users(f'{prefix}customer', customers, password)
+        )
+        CollectionAgent.objects.bulk_create(
+            CollectionAgent(user=u, municipality=municipality, phone='0', address='Yard',
+                            vehicle_number=f'KA-{m}-{i}', is_approved=True)
+            for i, u in enumerate(_users(f'{prefix}agent', agents, password))
+        )
+        Recycler.objects.bulk_create(
+            Recycler(user=u, municipality=municipality, company_name=f'Recycler {m}.{i}', phone='0',
+                     address='Plant', is_approved=True)
+            for i, u in enumerate(_users(f'{prefix}recycler', recyclers, password))
+        )
+        account_rows = list(Customer.objects.filter(municipality=municipality).order_by('id'))
+        agent_rows = list(CollectionAgent.objects.filter(municipality=municipality).order_by('id'))
+        recycler_rows = list(Recycler.objects.filter(municipality=municipality).order_by('id'))
+        customer_rows = [c for c in account_rows if c.is_approved]
+
+        def location():
+            return lat + rng.uniform(-SPREAD, SPREAD), lng + rng.uniform(-SPREAD, SPREAD)
+
+        def level():
+            # About a fifth of the bins start above the full threshold
+            return rng.randint(75, 100) if rng.random() < 0.2 else rng.randint(0, 74)
+
+        SmartBin.objects.bulk_create(
+            SmartBin(bin_id=f'{prefix}B{c.id}', municipality=municipality, customer=c,
+                     current_level=lvl, is_full=lvl >= 75, latitude=pos[0], longitude=pos[1])
+            for c in customer_rows
+            for lvl, pos in [(level(), location())]
+        )
+        SmartBin.objects.bulk_create(
+            SmartBin(bin_id=f'{prefix}U{i}', municipality=municipality, latitude=pos[0], longitude=pos[1])
+            for i in range(max(1, customers // 10))
+            for pos in [location()]
+        )
+        bins = {b.customer_id: b for b in SmartBin.objects.filter(municipality=municipality, customer__isnull=False)}
+
+        WasteCollection.objects.bulk_create(
+            (
+                WasteCollection(
+                    customer=c, bin=bins[c.id], municipality=municipality,
+                    collection_agent=None if status == 'pending' else rng.choice(agent_rows),
+                    collection_date=today + timedelta(days=rng.randint(-7, 7)),
+                    amount=municipality.collection_rate, status=status,
+                )
+                for c in customer_rows
+                for status in rng.choices(COLLECTION_STATUSES, COLLECTION_WEIGHTS, k=collections)
+            ),
+            batch_size=500,
+        )
+        if waste_types and recycler_rows:
+            RecyclerBooking.objects.bulk_create(
+                (
+                    RecyclerBooking(
+                        customer=c, recycler=rng.choice(recycler_rows), waste_type_id=rng.choice(waste_types),
+                        collection_agent=None if status == 'pending' else rng.choice(agent_rows),
+                        weight=rng.randint(1, 40), amount=rng.randint(20, 800),
+                        collection_date=today + timedelta(days=rng.randint(0, 14)), status=status,
+                    )
+                    for c in customer_rows
+                    for status in [rng.choice(BOOKING_STATUSES)]
+                ),
+                batch_size=500,
+            )
+
+        dataset['municipalities'].append(municipality)
+        dataset['customers'] += customer_rows
+        dataset['pending_customers'] += [c for c in account_rows if not c.is_approved]
+        dataset['agents'] += agent_rows
+        dataset['recyclers'] += recycler_rows
+        dataset['bins'] += list(bins.values())
+        dataset['unlinked_bins'] += list(SmartBin.objects.filter(municipality=municipality, customer=None))
+
+    dataset['admin'] = User.objects.create(username=f'{tag}admin', password=password,
+                                           is_staff=True, is_superuser=True)
+    return dataset
+
+
+def cleanup(tag=TAG):
+    """Delete everything ``generate`` created with ``tag``, and what the benchmark added to it."""
+    WalletTransaction.objects.filter(customer__user__username__startswith=tag).delete()
+    WalletTransaction.objects.filter(municipality__user__username__startswith=tag).delete()
+    User.objects.filter(username__startswith=tag).delete()
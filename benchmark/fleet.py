@@ -0,0 +1,48 @@
+"""Virtual bins that replay realistic fill curves against the IoT endpoint."""
+import json
+import math
+
+from django.urls import reverse
+
+
+class VirtualBin:
+    """A bin that fills faster in the daytime and is emptied soon after it gets full.
+
+    Each bin has its own base rate (percent per hour) and a level at
+    which its owner puts it out for collection.
+    """
+
+    def __init__(self, bin_id, level, rng):
+        self.bin_id = bin_id
+        self.level = float(level)
+        self.rng = rng
+        self.rate = rng.uniform(1.0, 5.0)
+        self.emptied_at = rng.uniform(85, 100)
+
+    def advance(self, hours, hour_of_day):
+        # Households produce most waste between 06:00 and 22:00
+        daytime = max(0.0, math.sin(math.pi * (hour_of_day - 6) / 16)) if 6 <= hour_of_day < 22 else 0.0
+        self.level += self.rate * (0.2 + 1.6 * daytime) * hours * self.rng.uniform(0.7, 1.3)
+        if self.level >= self.emptied_at:
+            self.level = self.rng.uniform(0, 5)
+        return min(100, int(self.level))
+
+
+def replay(recorder, client, bins, readings, step_minutes=15, start_hour=6):
+    """Post ``readings`` readings, one bin after another, to ``update_bin_status``.
+
+    Every pass over ``bins`` advances simulated time by ``step_minutes``,
+    so a long replay walks the fleet through whole days.
+    """
+    path = reverse('update_bin_status')
+    hours = step_minutes / 60
+    clock = start_hour
+    for n in range(readings):
+        bin = bins[n % len(bins)]
+        if n and n % len(bins) == 0:
+            clock = (clock + hours) % 24
+        level = bin.advance(hours, clock)
+        recorder.request(
+            client, 'post', 'update_bin_status', path,
+            data=json.dumps({'bin_id': bin.bin_id, 'level': level}), content_type='application/json',
+        )
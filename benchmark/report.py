@@ -0,0 +1,69 @@
+"""Per-endpoint latency, throughput and query counts."""
+from collections import defaultdict
+import threading
+import time
+
+from django.db import connection
+
+
+def percentile(samples, p):
+    """``p`` (0-1) percentile of ``samples`` in seconds, in milliseconds."""
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000 if samples else 0
+
+
+class Recorder:
+    """Time requests made through a test ``Client`` and count their queries.
+
+    Safe to share between worker threads: each thread's requests run on
+    its own database connection, which is what the execute wrapper counts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)   # url name -> [(seconds, queries, db seconds, status)]
+        self.started = time.perf_counter()
+
+    def request(self, client, method, name, path, **kwargs):
+        stats = {'queries': 0, 'db': 0.0}
+
+        def count(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['db'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = getattr(client, method)(path, **kwargs)
+            if response.streaming:
+                # Exports read their rows while streaming, after the view returns
+                for _ in response.streaming_content:
+                    pass
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[name].append((elapsed, stats['queries'], stats['db'], response.status_code))
+        return response
+
+    def write(self, stdout, title):
+        wall = time.perf_counter() - self.started
+        total = sum(len(rows) for rows in self.samples.values())
+        stdout.write(f'\n{title}: {total} requests in {wall:.1f}s ({total / wall if wall else 0:.1f} req/s)')
+        stdout.write(f'{"endpoint":<28}{"n":>6}{"req/s":>8}{"p50":>9}{"p95":>9}{"p99":>9}'
+                     f'{"queries":>9}{"max":>5}{"db ms":>8}{"errors":>8}')
+        for name in sorted(self.samples):
+            rows = self.samples[name]
+            latencies = [row[0] for row in rows]
+            queries = [row[1] for row in rows]
+            errors = sum(1 for row in rows if row[3] >= 400)
+            # Capacity of one worker: requests per second of time spent on this endpoint
+            rate = len(rows) / sum(latencies) if sum(latencies) else 0
+            stdout.write(
+                f'{name:<28}{len(rows):>6}{rate:>8.1f}'
+                f'{percentile(latencies, 0.5):>7.1f}ms{percentile(latencies, 0.95):>7.1f}ms'
+                f'{percentile(latencies, 0.99):>7.1f}ms'
+                f'{sum(queries) / len(rows):>9.1f}{max(queries):>5}'
+                f'{sum(row[2] for row in rows) / len(rows) * 1000:>8.2f}{errors:>8}'
+            )
@@ -0,0 +1,27 @@
+"""Throwaway benchmark runs against the configured database."""
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def sandbox():
+    """Run the block in a transaction that is always rolled back.
+
+    The test environment is installed for the duration, so the block can
+    make requests through a test ``Client``.
+    """
+    setup_test_environment()
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+    finally:
+        teardown_test_environment()
@@ -0,0 +1,175 @@
+"""Scripted sessions that walk each role through its pages.
+
+Together the scripts request every URL name in ``urls.py`` except those
+in ``SKIPPED``, which need an ASGI server (see ``manage.py
+loadtest_ingest`` and ``loadtest_events``). Pages whose template is not
+installed are skipped, and ``run_benchmark`` reports them as not covered.
+"""
+import json
+import uuid
+
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import codec
+from ..models import RecyclerBooking, SmartBin, WasteCollection
+from .data import PASSWORD, SPREAD
+
+SKIPPED = {
+    'update_bin_status_async': 'needs an ASGI server',
+    'full_bin_events': 'served by the ASGI event stream router',
+}
+
+
+def _installed(template):
+    try:
+        get_template(template)
+    except TemplateDoesNotExist:
+        return False
+    return True
+
+
+class Session:
+    def __init__(self, recorder, user=None):
+        self.recorder = recorder
+        self.client = Client(raise_request_exception=False)
+        if user is not None:
+            self.client.force_login(user)
+
+    def get(self, name, *args, template=None, data=None):
+        if template is None or _installed(template):
+            return self.recorder.request(self.client, 'get', name, reverse(name, args=args), data=data)
+
+    def post(self, name, *args, data=None, **kwargs):
+        return self.recorder.request(self.client, 'post', name, reverse(name, args=args), data=data, **kwargs)
+
+    def post_json(self, name, payload):
+        return self.post(name, data=json.dumps(payload), content_type='application/json')
+
+
+def visitor(recorder, dataset, rng):
+    session = Session(recorder)
+    session.get('home', template='home.html')
+    session.get('customer_register', template='register_customer.html')
+    session.get('login_view', template='login.html')
+    customer = rng.choice(dataset['customers'])
+    session.post('login_view', data={'username': customer.user.username, 'password': PASSWORD})
+    session.get('logout_view')
+
+
+def customer(recorder, dataset, rng):
+    customer = rng.choice(dataset['customers'])
+    session = Session(recorder, customer.user)
+    session.get('customer_dashboard', template='customer_dashboard.html')
+    session.get('customer_wallet', template='customer_wallet.html')
+    if _installed('customer_wallet.html'):
+        session.post('customer_wallet', data={'amount': rng.choice(['100', '250', '500']),
+                                              'idempotency_key': uuid.uuid4().hex})
+    session.get('recycler_quote', data={'waste_type': 'plastic', 'weight': rng.randint(1, 50)})
+    session.get('book_recycler', template='book_recycler.html')
+    recyclers = [r for r in dataset['recyclers'] if r.municipality_id == customer.municipality_id]
+    if recyclers:
+        session.post('book_recycler', data={
+            'recycler': rng.choice(recyclers).id, 'waste_type': 'plastic', 'weight': rng.randint(1, 40),
+            'collection_date': timezone.localdate().isoformat(),
+        })
+    session.get('link_bin', template='link_bin.html')
+    bin = SmartBin.objects.filter(customer=customer).values_list('bin_id', flat=True).first()
+    if bin:
+        session.get('bin_history', bin, data={'resolution': 'raw'})
+    collection = WasteCollection.objects.filter(customer=customer, status='collected').values_list('id', flat=True).first()
+    if collection:
+        session.get('verify_collection', collection)
+    session.get('customer_dashboard', template='customer_dashboard.html')
+
+
+def agent(recorder, dataset, rng):
+    agent = rng.choice(dataset['agents'])
+    session = Session(recorder, agent.user)
+    session.get('agent_dashboard', template='agent_dashboard.html')
+    depot = next(m for m in dataset['municipalities'] if m.id == agent.municipality_id)
+    session.post('agent_location', data={'latitude': depot.latitude + rng.uniform(-SPREAD, SPREAD),
+                                         'longitude': depot.longitude + rng.uniform(-SPREAD, SPREAD)})
+    task = WasteCollection.objects.filter(collection_agent=agent, status='assigned').select_related('bin').first()
+    if task is not None:
+        session.get('collect_waste', task.id, template='collect_waste.html')
+        session.post('collect_waste', task.id, data={'bin_id': task.bin.bin_id if task.bin else ''})
+    session.get('agent_dashboard', template='agent_dashboard.html')
+
+
+def municipality(recorder, dataset, rng):
+    municipality = rng.choice(dataset['municipalities'])
+    session = Session(recorder, municipality.user)
+    session.get('municipality_dashboard', template='municipality_dashboard.html')
+    session.get('municipality_forecast')
+    session.get('municipality_history')
+    session.get('analytics_summary')
+    session.get('export_records', 'collections', data={'format': rng.choice(['csv', 'jsonl'])})
+    session.get('recycler_quote', data={'waste_type': 'paper', 'weight': rng.randint(1, 50)})
+    session.get('nearby_bins', data={'latitude': municipality.latitude, 'longitude': municipality.longitude,
+                                     'radius_km': 2, 'full': 'on'})
+    session.get('full_bin_clusters', data={'cell_km': 1})
+
+    pending = [c for c in dataset['pending_customers'] if c.municipality_id == municipality.id]
+    if pending:
+        session.get('approve_customer', rng.choice(pending).id)
+    session.post_json('bulk_approve', {'customers': [c.id for c in pending[:20]]})
+
+    agents = [a.id for a in dataset['agents'] if a.municipality_id == municipality.id]
+    full = list(SmartBin.objects.filter(municipality=municipality, is_full=True, customer__isnull=False)
+                .values_list('id', flat=True)[:11])
+    today = timezone.localdate().isoformat()
+    if full:
+        session.get('nearest_agents', SmartBin.objects.get(id=full[0]).bin_id, data={'k': 3})
+        session.get('assign_collection_task', full[0], template='assign_task.html')
+        session.post('assign_collection_task', full[0], data={'agent_id': rng.choice(agents),
+                                                              'collection_date': today})
+    session.post_json('bulk_assign', {
+        'collection_date': today,
+        'assignments': [{'bin': bin, 'agent': rng.choice(agents)} for bin in full[1:]],
+    })
+    session.post('dispatch_routes', data={'collection_date': today})
+    session.get('municipality_dashboard', template='municipality_dashboard.html')
+
+
+def recycler(recorder, dataset, rng):
+    recycler = rng.choice(dataset['recyclers'])
+    session = Session(recorder, recycler.user)
+    session.get('recycler_dashboard', template='recycler_dashboard.html')
+    session.get('export_records', 'bookings')
+    booking = RecyclerBooking.objects.filter(recycler=recycler, status='pending').values_list('id', flat=True).first()
+    if booking:
+        session.get('assign_recycler_task', booking, template='assign_recycler_task.html')
+        agents = [a.id for a in dataset['agents'] if a.municipality_id == recycler.municipality_id]
+        session.post('assign_recycler_task', booking, data={'agent_id': rng.choice(agents)})
+
+
+def admin(recorder, dataset, rng):
+    session = Session(recorder, dataset['admin'])
+    session.get('admin_dashboard', template='admin_dashboard.html')
+    session.get('bin_buffer_stats')
+    session.get('dashboard_cache_stats')
+    session.get('prometheus_metrics')
+    session.get('analytics_summary')
+
+
+def gateway(recorder, dataset, rng):
+    """A gateway uploading one batch of readings in the binary format."""
+    session = Session(recorder)
+    bins = rng.sample(dataset['bins'], min(50, len(dataset['bins'])))
+    body = codec.encode_readings((bin.bin_id, rng.randint(0, 100), 0) for bin in bins)
+    session.post('update_bin_status_batch', data=body, content_type=codec.CONTENT_TYPE)
+
+
+ROLES = {
+    'visitor': visitor,
+    'customer': customer,
+    'agent': agent,
+    'municipality': municipality,
+    'recycler': recycler,
+    'admin': admin,
+    'gateway': gateway,
+}
@@ -0,0 +1,134 @@
+"""Bulk approval and task assignment for municipalities.
+
+Each operation runs a fixed number of queries however many ids it is
+given, inside one transaction, and returns a summary dict that lists
+what was done and why any id was skipped.
+"""
+from django.db import transaction
+
+from . import dashcache, events, pricing
+from .models import CollectionAgent, Customer, Recycler, SmartBin, WasteCollection
+from .routing import OPEN_STATUSES
+
+# Largest number of ids accepted in one bulk request
+BULK_MAX_IDS = 5000
+
+APPROVABLE = {
+    'customers': Customer,
+    'agents': CollectionAgent,
+    'recyclers': Recycler,
+}
+
+
+class BulkError(ValueError):
+    pass
+
+
+def clean_ids(values, name):
+    if not isinstance(values, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        raise BulkError(f'{name} must be a list of integer ids')
+    if len(values) > BULK_MAX_IDS:
+        raise BulkError(f'Too many {name} (max {BULK_MAX_IDS})')
+    return list(dict.fromkeys(values))
+
+
+def approve_accounts(municipality, ids_by_kind):
+    """Approve the given ``{'customers': [...], 'agents': [...], 'recyclers': [...]}`` ids.
+
+    Only accounts registered with ``municipality`` are touched. Costs two
+    queries per kind.
+    """
+    summary = {}
+    with transaction.atomic():
+        for kind, model in APPROVABLE.items():
+            ids = ids_by_kind.get(kind)
+            if not ids:
+                continue
+            current = dict(
+                model.objects.filter(municipality=municipality, id__in=ids).values_list('id', 'is_approved')
+            )
+            pending = [pk for pk, approved in current.items() if not approved]
+            if pending:
+                model.objects.filter(id__in=pending).update(is_approved=True)
+                dashcache.invalidate(f'municipality:{municipality.id}:accounts')
+                if model is Recycler:
+                    pricing.invalidate(municipality.id)
+            summary[kind] = {
+                'approved': sorted(pending),
+                'already_approved': sorted(pk for pk, approved in current.items() if approved),
+                'not_found': [pk for pk in ids if pk not in current],
+            }
+    return summary
+
+
+def assign_bins(municipality, assignments, collection_date):
+    """Create assigned WasteCollections for ``[(bin_pk, agent_pk), ...]``.
+
+    A bin is skipped if it isn't a linked bin of ``municipality``, already
+    has an open collection, or its agent isn't an approved agent of the
+    municipality. Assigned bins are marked not full, as a single
+    assignment does. Costs four queries plus the bulk_create batches.
+    """
+    skipped = []
+    with transaction.atomic():
+        bin_ids = [bin_pk for bin_pk, _ in assignments]
+        bins = {
+            bin.id: bin
+            for bin in SmartBin.objects.select_for_update()
+            .filter(municipality=municipality, id__in=bin_ids)
+            .only('id', 'bin_id', 'customer', 'current_level', 'is_full')
+        }
+        busy = set(
+            WasteCollection.objects
+            .filter(bin_id__in=list(bins), status__in=OPEN_STATUSES)
+            .values_list('bin_id', flat=True)
+        )
+        agents = set(
+            CollectionAgent.objects
+            .filter(municipality=municipality, is_approved=True, id__in={agent for _, agent in assignments})
+            .values_list('id', flat=True)
+        )
+
+        collections = []
+        seen = set()
+        for bin_pk, agent_pk in assignments:
+            bin = bins.get(bin_pk)
+            if bin is None or bin.customer_id is None:
+                reason = 'bin not found'
+            elif bin_pk in seen:
+                reason = 'bin listed more than once'
+            elif bin_pk in busy:
+                reason = 'bin already has an open collection'
+            elif agent_pk not in agents:
+                reason = 'agent not found or not approved'
+            else:
+                seen.add(bin_pk)
+                collections.append(WasteCollection(
+                    customer_id=bin.customer_id,
+                    bin_id=bin_pk,
+                    municipality=municipality,
+                    collection_agent_id=agent_pk,
+                    collection_date=collection_date,
+                    amount=municipality.collection_rate,
+                    status='assigned',
+                ))
+                continue
+            skipped.append({'bin': bin_pk, 'agent': agent_pk, 'reason': reason})
+
+        WasteCollection.objects.bulk_create(collections, batch_size=500)
+        dashcache.invalidate(
+            f'municipality:{municipality.id}:bins',
+            *(tag for c in collections for tag in dashcache.collection_tags(
+                municipality.id, c.customer_id, c.collection_agent_id)),
+        )
+        cleared = [bins[c.bin_id] for c in collections if bins[c.bin_id].is_full]
+        if cleared:
+            SmartBin.objects.filter(id__in=[bin.id for bin in cleared]).update(is_full=False)
+            events.publish_flips([
+                (municipality.id, bin.id, bin.bin_id, bin.current_level, False) for bin in cleared
+            ])
+
+    return {
+        'assigned': [{'bin': c.bin_id, 'agent': c.collection_agent_id} for c in collections],
+        'skipped': skipped,
+    }
@@ -0,0 +1,66 @@
+"""Compact fixed-layout binary format for SmartBin readings.
+
+A buffer is an 8-byte header followed by ``count`` fixed-size records,
+all little-endian::
+
+    header:  magic b'SB' | version u8 | id_len u8 | count u32
+    record:  bin_id (id_len bytes, NUL padded) | level u8 | ts u32
+
+``ts`` is Unix time in seconds; 0 means "use the server's clock" for
+devices without an RTC. With 8-byte bin ids a reading takes 13 bytes.
+"""
+import struct
+
+CONTENT_TYPE = 'application/x-smartbin'
+MAGIC = b'SB'
+VERSION = 1
+
+HEADER = struct.Struct('<2sBBI')
+
+
+class CodecError(ValueError):
+    pass
+
+
+def record_struct(id_len):
+    return struct.Struct(f'<{id_len}sBI')
+
+
+def encode_readings(readings, id_len=None):
+    """Encode ``(bin_id, level, ts)`` tuples into one buffer."""
+    readings = list(readings)
+    if id_len is None:
+        id_len = max((len(bin_id) for bin_id, _, _ in readings), default=1)
+    record = record_struct(id_len)
+    buf = bytearray(HEADER.size + record.size * len(readings))
+    HEADER.pack_into(buf, 0, MAGIC, VERSION, id_len, len(readings))
+    offset = HEADER.size
+    for bin_id, level, ts in readings:
+        record.pack_into(buf, offset, bin_id.encode('ascii'), level, int(ts or 0))
+        offset += record.size
+    return bytes(buf)
+
+
+def decode_readings(data):
+    """Decode a buffer into a list of ``(bin_id, level, ts)`` tuples.
+
+    Records are unpacked straight out of a ``memoryview`` of ``data``;
+    only the bin id strings are copied.
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise CodecError('Truncated header')
+    magic, version, id_len, count = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise CodecError('Unsupported binary format')
+    if id_len == 0:
+        raise CodecError('Invalid bin id length')
+
+    record = record_struct(id_len)
+    end = HEADER.size + record.size * count
+    if len(view) != end:
+        raise CodecError(f'Expected {count} readings of {record.size} bytes')
+    return [
+        (bin_id.rstrip(b'\0').decode('ascii'), level, ts)
+        for bin_id, level, ts in record.iter_unpack(view[HEADER.size:end])
+    ]
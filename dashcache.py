@@ -0,0 +1,169 @@
+"""Cached dashboard fragments.
+
+A fragment is a dict of querysets already evaluated by a view, stored in
+the ``SMARTBIN_DASHBOARD_CACHE['ALIAS']`` cache (local memory by default,
+Redis when configured). Each fragment depends on one or more tags such as
+``municipality:3:accounts`` or ``customer:42``. A tag's current
+generation is part of the fragment key, so invalidating a tag just gives
+it a new generation and every fragment built on it is missed from then
+on. Generations are time-based rather than counters, so an evicted tag
+can never come back to an old value and resurrect a stale fragment.
+
+Model ``post_save``/``post_delete`` signals invalidate the tags of the
+rows they touch (and of a row's previous owner when a foreign key
+changes). Bulk writes skip signals, so those code paths call
+``invalidate`` themselves. Fragments rebuilt within the replica lag of an
+invalidation read from the primary, so replica lag is never cached.
+"""
+from hashlib import md5
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+
+from . import database, metrics
+from .models import CollectionAgent, Customer, Municipality, Recycler, RecyclerBooking, SmartBin, WasteCollection
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SMARTBIN_DASHBOARD_CACHE', {})}
+
+
+def _cache():
+    return caches[_config()['ALIAS']]
+
+
+def _tag_key(tag):
+    return f'smartbin:tag:{tag}'
+
+
+def _count(fragment, outcome):
+    with _lock:
+        counts = _stats.setdefault(fragment, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+    metrics.count_cache(outcome == 'hits')
+
+
+def fetch(fragment, tags, build, vary=()):
+    """Return the cached result of ``build()`` for ``fragment``.
+
+    ``vary`` holds extra key parts such as paging cursors.
+    """
+    config = _config()
+    if not config['ENABLED']:
+        return build()
+    cache = _cache()
+
+    tag_keys = [_tag_key(tag) for tag in tags]
+    generations = cache.get_many(tag_keys)
+    missing = {key: time.time_ns() for key in tag_keys if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    parts = [fragment, *map(str, vary), *(str(generations[key]) for key in tag_keys)]
+    key = f'smartbin:fragment:{fragment}:{md5(":".join(parts).encode()).hexdigest()}'
+
+    value = cache.get(key)
+    if value is not None:
+        _count(fragment, 'hits')
+        return value
+    _count(fragment, 'misses')
+    if time.time_ns() - max(generations.values(), default=0) < database.replica_lag() * 1e9:
+        # A replica may not have the write behind this invalidation yet
+        with database.primary():
+            value = build()
+    else:
+        value = build()
+    cache.set(key, value, config['TIMEOUT'])
+    return value
+
+
+def invalidate(*tags):
+    """Give ``tags`` new generations once the current transaction commits."""
+    tags = {tag for tag in tags if tag}
+    if not tags or not _config()['ENABLED']:
+        return
+
+    def bump():
+        now = time.time_ns()
+        _cache().set_many({_tag_key(tag): now for tag in tags}, None)
+
+    transaction.on_commit(bump)
+
+
+def stats():
+    with _lock:
+        fragments = {name: dict(counts) for name, counts in _stats.items()}
+    hits = sum(c['hits'] for c in fragments.values())
+    misses = sum(c['misses'] for c in fragments.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'fragments': fragments,
+    }
+
+
+def _tag(template, pk):
+    return template.format(pk) if pk is not None else None
+
+
+def collection_tags(municipality_id=None, customer_id=None, agent_id=None):
+    """Tags of the dashboards that list a WasteCollection."""
+    return [
+        _tag('municipality:{}:collections', municipality_id),
+        _tag('customer:{}', customer_id),
+        _tag('agent:{}', agent_id),
+    ]
+
+
+def _tags_for(instance, get=getattr):
+    if isinstance(instance, WasteCollection):
+        return collection_tags(
+            get(instance, 'municipality_id'), get(instance, 'customer_id'), get(instance, 'collection_agent_id'),
+        )
+    if isinstance(instance, RecyclerBooking):
+        return [
+            _tag('customer:{}', get(instance, 'customer_id')),
+            _tag('recycler:{}', get(instance, 'recycler_id')),
+            _tag('agent:{}', get(instance, 'collection_agent_id')),
+        ]
+    if isinstance(instance, SmartBin):
+        return [_tag('municipality:{}:bins', get(instance, 'municipality_id'))]
+    if isinstance(instance, Municipality):
+        return ['municipalities']
+    # Customer, CollectionAgent, Recycler
+    role = {Customer: 'customer', CollectionAgent: 'agent', Recycler: 'recycler'}[type(instance)]
+    return [_tag('municipality:{}:accounts', get(instance, 'municipality_id')), _tag(role + ':{}', instance.pk)]
+
+
+def _loaded(instance, attr):
+    # Never trigger a query for a deferred field while a row is being loaded
+    return instance.__dict__.get(attr)
+
+
+def _remember_owner(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._dashcache_tags = _tags_for(instance, _loaded)
+
+
+def _row_changed(sender, instance, **kwargs):
+    invalidate(*_tags_for(instance), *getattr(instance, '_dashcache_tags', ()))
+
+
+for model in (Customer, CollectionAgent, Recycler, SmartBin, WasteCollection, RecyclerBooking, Municipality):
+    post_init.connect(_remember_owner, sender=model)
+    post_save.connect(_row_changed, sender=model)
+    post_delete.connect(_row_changed, sender=model)
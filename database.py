@@ -0,0 +1,117 @@
+"""Database routing and connection setup.
+
+With ``SMARTBIN_DATABASE['REPLICAS']`` set, ``ReplicaRouter`` sends the
+reads of views wrapped in ``replica_reads`` (the dashboards) to a random
+replica. Every other read and all writes, including IoT ingestion and the
+wallet, go to ``default``. Replicas lag the primary, so a client that has
+just written is pinned to the primary for ``REPLICA_LAG`` seconds by
+``PrimaryAfterWriteMiddleware``, and ``dashcache`` rebuilds a fragment
+from the primary while one of its tags is younger than that.
+
+SQLite connections are switched to WAL mode, so dashboard reads no longer
+block behind the IoT writer and vice versa.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'REPLICAS': [],
+    'REPLICA_LAG': 5,
+    'SQLITE_WAL': True,
+}
+
+PIN_COOKIE = 'smartbin_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('smartbin_replica_reads', default=False)
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SMARTBIN_DATABASE', {})}
+
+
+def replicas():
+    return [alias for alias in _config()['REPLICAS'] if alias in settings.DATABASES]
+
+
+def replica_lag():
+    """Seconds a replica may trail the primary, or 0 without replicas."""
+    return _config()['REPLICA_LAG'] if replicas() else 0
+
+
+@contextmanager
+def _reads(enabled):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def primary():
+    """Read from the primary inside the block, even in a ``replica_reads`` view."""
+    return _reads(False)
+
+
+def replica_reads(view):
+    """Let a read-only view's queries go to a replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES or not replicas():
+            return view(request, *args, **kwargs)
+        with _reads(True):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Reads inside a transaction must see its own writes
+        if _replica_reads.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            aliases = replicas()
+            if aliases:
+                return random.choice(aliases)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in _config()['REPLICAS']:
+            return False
+        return None
+
+
+class PrimaryAfterWriteMiddleware:
+    """Pin a client to the primary for ``REPLICA_LAG`` seconds after it writes."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and replicas():
+            response.set_cookie(PIN_COOKIE, '1', max_age=replica_lag(), httponly=True, samesite='Lax')
+        return response
+
+
+@receiver(connection_created)
+def _configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not _config()['SQLITE_WAL']:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        # Durable at checkpoints rather than every commit; safe in WAL mode
+        cursor.execute('PRAGMA synchronous=NORMAL')
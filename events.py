@@ -0,0 +1,249 @@
+"""Server-sent events for the municipality full-bin list.
+
+The ingestion path publishes a diff whenever a linked bin turns full or
+its level changes while full (``bin_full``, carrying the bin's table row)
+and whenever one stops being full (``bin_cleared``). ``EventHub`` fans it
+out to every connected dashboard of that municipality. Each event is
+encoded once and handed to each event loop with a single
+``call_soon_threadsafe``, so publishing from a request thread costs the
+same however many clients are connected. A client too slow to keep up is
+disconnected and resyncs from the snapshot sent on reconnect.
+
+The stream is served by ``EventStreamRouter``, a thin ASGI wrapper around
+the Django application (Django 3.2 cannot stream asynchronously from a
+view), at the URL named ``full_bin_events``::
+
+    application = EventStreamRouter(get_asgi_application())
+
+Publishers and subscribers must share a process, so run ingestion and the
+event stream on the same ASGI server.
+"""
+import asyncio
+from collections import defaultdict
+from http import cookies
+from importlib import import_module
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.http import HttpRequest
+from django.urls import reverse
+
+KEEPALIVE_SECONDS = 15
+QUEUE_SIZE = 256
+
+
+class EventHub:
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # municipality_id -> loop -> set of subscriber queues
+        self._subscribers = defaultdict(lambda: defaultdict(set))
+        self.counters = {'published': 0, 'delivered': 0, 'dropped_clients': 0}
+
+    def subscribe(self, municipality_id):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[municipality_id][loop].add(queue)
+        return queue
+
+    def unsubscribe(self, municipality_id, queue):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            loops = self._subscribers.get(municipality_id)
+            if loops is None:
+                return
+            loops[loop].discard(queue)
+            if not loops[loop]:
+                del loops[loop]
+            if not loops:
+                del self._subscribers[municipality_id]
+
+    def client_count(self):
+        with self._lock:
+            return sum(len(q) for loops in self._subscribers.values() for q in loops.values())
+
+    def publish(self, municipality_id, event, data):
+        """Send an event to every subscriber of a municipality; thread-safe."""
+        payload = format_event(event, data)
+        with self._lock:
+            targets = [
+                (loop, list(queues))
+                for loop, queues in self._subscribers.get(municipality_id, {}).items()
+            ]
+        self.counters['published'] += 1
+        for loop, queues in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queues, payload)
+            except RuntimeError:
+                pass  # loop closed
+
+    def _deliver(self, queues, payload):
+        for queue in queues:
+            try:
+                queue.put_nowait(payload)
+                self.counters['delivered'] += 1
+            except asyncio.QueueFull:
+                # Slow client: end its stream so it reconnects and resyncs
+                self.counters['dropped_clients'] += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+hub = EventHub()
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def publish_full(bins):
+    """Publish ``(municipality_id, row)`` for full bins after commit.
+
+    ``row`` has the fields of a snapshot row, so a dashboard can add a bin
+    that turned full, or update the level of one that stayed full, as is.
+    """
+    if not bins:
+        return
+
+    def send():
+        now = time.time()
+        for municipality_id, row in bins:
+            hub.publish(municipality_id, 'bin_full', {**row, 'ts': now})
+
+    transaction.on_commit(send)
+
+
+def publish_flips(flips):
+    """Publish ``(municipality_id, bin_pk, bin_id, level, is_full)`` flips after commit.
+
+    Bins that turn full should go through ``publish_full`` instead, whose
+    events carry the customer and address the dashboard shows.
+    """
+    if not flips:
+        return
+
+    def send():
+        now = time.time()
+        for municipality_id, bin_pk, bin_id, level, is_full in flips:
+            hub.publish(
+                municipality_id,
+                'bin_full' if is_full else 'bin_cleared',
+                {'id': bin_pk, 'bin_id': bin_id, 'level': level, 'ts': now},
+            )
+
+    transaction.on_commit(send)
+
+
+def stream_path():
+    """Path of the event stream, named ``full_bin_events`` in ``urls.py``."""
+    return reverse('full_bin_events')
+
+
+def _session_municipality(session_key):
+    try:
+        engine = import_module(settings.SESSION_ENGINE)
+        request = HttpRequest()
+        request.session = engine.SessionStore(session_key)
+        user = get_user(request)
+        if not user.is_authenticated or not hasattr(user, 'municipality'):
+            return None
+        return user.municipality.id
+    finally:
+        close_old_connections()
+
+
+def _full_bins_snapshot(municipality_id):
+    from .models import SmartBin
+    try:
+        return list(
+            SmartBin.objects
+            .filter(municipality_id=municipality_id, is_full=True, customer__isnull=False)
+            .order_by('id')
+            .values('id', 'bin_id', 'current_level', username=F('customer__user__username'),
+                    address=F('customer__address'))
+        )
+    finally:
+        close_old_connections()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class EventStreamRouter:
+    """ASGI app serving the event stream itself and passing the rest to Django."""
+
+    def __init__(self, application, hub=hub):
+        self.application = application
+        self.hub = hub
+        self.path = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and self.path is None:
+            self.path = stream_path()
+        if scope['type'] == 'http' and scope['path'] == self.path:
+            await self.stream(scope, receive, send)
+        else:
+            await self.application(scope, receive, send)
+
+    async def stream(self, scope, receive, send):
+        cookie = cookies.SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+        municipality_id = None
+        if morsel is not None:
+            municipality_id = await sync_to_async(_session_municipality, thread_sensitive=False)(morsel.value)
+        if municipality_id is None:
+            await send({'type': 'http.response.start', 'status': 403,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Forbidden'})
+            return
+
+        queue = self.hub.subscribe(municipality_id)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            snapshot = await sync_to_async(_full_bins_snapshot, thread_sensitive=False)(municipality_id)
+            await send({'type': 'http.response.body', 'body': format_event('snapshot', snapshot),
+                        'more_body': True})
+
+            disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, disconnected}, timeout=KEEPALIVE_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    getter.cancel()
+                    break
+                if getter in done:
+                    payload = getter.result()
+                    if payload is None:
+                        break
+                else:
+                    getter.cancel()
+                    payload = b': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': payload, 'more_body': True})
+            disconnected.cancel()
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            self.hub.unsubscribe(municipality_id, queue)
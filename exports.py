@@ -0,0 +1,202 @@
+"""Streaming CSV and JSON-lines exports for monthly statements.
+
+``stream`` returns a ``StreamingHttpResponse`` that reads its rows
+``CHUNK_SIZE`` at a time and sends them in pieces of about
+``FLUSH_BYTES``. Memory use therefore stays flat however many rows match.
+Each export reads ``values_list()`` tuples with the related names joined
+in, so no model instances are built and no per-row queries run.
+
+On PostgreSQL, ``iterator()`` reads through a server-side cursor. On
+SQLite it fetches one chunk at a time. mysqlclient buffers a whole
+result set on the client, so on MySQL the rows are paged by id instead,
+one indexed range scan per chunk.
+
+The rows are read after the view has returned, so the database alias is
+picked while the view runs. A ``replica_reads`` view therefore still
+streams from a replica. Django 3.2 iterates streaming responses
+synchronously, so serve exports from WSGI workers. Under an ASGI server
+the ORM refuses to run.
+"""
+import csv
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+import io
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+from .analytics import day_bounds
+from .history import unpack_samples
+from .models import BinLevelDay, RecyclerBooking, WalletTransaction, WasteCollection
+
+DEFAULTS = {
+    'CHUNK_SIZE': 2000,       # rows per fetch (a tenth as many packed reading days)
+    'FLUSH_BYTES': 64 * 1024, # bytes of output buffered per piece sent
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SMARTBIN_EXPORTS', {})}
+
+
+class Export:
+    """One exportable table.
+
+    ``columns`` are the ``values_list()`` lookups read, the first being the
+    primary key, and ``header`` names the output columns. The ``*_field``
+    arguments name the lookups the filters apply to, or None where a
+    filter doesn't apply.
+    """
+
+    def __init__(self, model, columns, date_field, datetime_field=False, status_field=None,
+                 municipality_field='municipality_id', recycler_field=None, header=None, chunk_divisor=1):
+        self.model = model
+        self.columns = columns
+        self.header = header or [name for name, _ in columns]
+        self.date_field = date_field
+        self.datetime_field = datetime_field
+        self.status_field = status_field
+        self.municipality_field = municipality_field
+        self.recycler_field = recycler_field
+        self.chunk_divisor = chunk_divisor
+
+    def queryset(self, start, end, municipality=None, recycler=None, status=None):
+        """The rows between days ``start`` and ``end`` inclusive; raises ValueError for a filter that doesn't apply."""
+        if self.datetime_field:
+            begin, finish = day_bounds(start, end)
+            rows = self.model.objects.filter(**{f'{self.date_field}__gte': begin, f'{self.date_field}__lt': finish})
+        else:
+            rows = self.model.objects.filter(**{f'{self.date_field}__gte': start, f'{self.date_field}__lte': end})
+        for value, field, name in [
+            (municipality, self.municipality_field, 'municipality'),
+            (recycler, self.recycler_field, 'recycler'),
+            (status, self.status_field, 'status'),
+        ]:
+            if value in (None, ''):
+                continue
+            if field is None:
+                raise ValueError(f'This export has no {name} filter')
+            rows = rows.filter(**{field: value})
+        return rows.values_list(*(lookup for _, lookup in self.columns))
+
+    def rows(self, row):
+        yield row
+
+
+class ReadingsExport(Export):
+    """Raw fill-level readings, one row per sample of each packed bin day."""
+
+    def rows(self, row):
+        _, bin_id, day, samples = row
+        midnight = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+        for secs, level in unpack_samples(samples):
+            yield bin_id, midnight + timedelta(seconds=secs), level
+
+
+EXPORTS = {
+    'collections': Export(
+        WasteCollection,
+        [
+            ('id', 'id'), ('municipality', 'municipality__name'), ('customer', 'customer__user__username'),
+            ('bin', 'bin__bin_id'), ('agent', 'collection_agent__user__username'),
+            ('collection_date', 'collection_date'), ('status', 'status'), ('amount', 'amount'),
+            ('created_at', 'created_at'), ('collected_at', 'collected_at'),
+        ],
+        date_field='collection_date', status_field='status',
+    ),
+    'bookings': Export(
+        RecyclerBooking,
+        [
+            ('id', 'id'), ('recycler', 'recycler__company_name'), ('customer', 'customer__user__username'),
+            ('agent', 'collection_agent__user__username'), ('waste_type', 'waste_type_id'), ('weight', 'weight'),
+            ('amount', 'amount'), ('collection_date', 'collection_date'), ('status', 'status'),
+            ('created_at', 'created_at'),
+        ],
+        date_field='collection_date', status_field='status',
+        municipality_field='recycler__municipality_id', recycler_field='recycler_id',
+    ),
+    'wallet': Export(
+        WalletTransaction,
+        [
+            ('id', 'id'), ('created_at', 'created_at'), ('kind', 'kind'), ('amount', 'amount'),
+            ('customer', 'customer__user__username'), ('municipality', 'municipality__name'),
+            ('collection', 'collection_id'),
+        ],
+        date_field='created_at', datetime_field=True, status_field='kind',
+    ),
+    'readings': ReadingsExport(
+        BinLevelDay,
+        [('id', 'id'), ('bin', 'bin__bin_id'), ('day', 'day'), ('samples', 'samples')],
+        date_field='day', header=['bin', 'ts', 'level'], chunk_divisor=10,
+    ),
+}
+
+
+def _fetch(queryset, chunk_size):
+    """Yield ``queryset``'s rows in id order, holding one chunk at a time."""
+    if connections[queryset.db].vendor != 'mysql':
+        yield from queryset.order_by('id').iterator(chunk_size=chunk_size)
+        return
+    after = 0
+    while True:
+        page = list(queryset.filter(id__gt=after).order_by('id')[:chunk_size])
+        yield from page
+        if len(page) < chunk_size:
+            return
+        after = page[-1][0]
+
+
+def _csv(header, rows, flush_bytes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl(header, rows, flush_bytes):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    pieces, size = [], 0
+    for row in rows:
+        line = encoder.encode(dict(zip(header, row)))
+        pieces.append(line)
+        size += len(line) + 1
+        if size >= flush_bytes:
+            yield '\n'.join(pieces) + '\n'
+            pieces, size = [], 0
+    if pieces:
+        yield '\n'.join(pieces) + '\n'
+
+
+def stream(name, format, start, end, **filters):
+    """A streaming response of export ``name`` between days ``start`` and ``end``.
+
+    ``filters`` are ``municipality``, ``recycler`` and ``status``. Raises
+    KeyError for an unknown export and ValueError for an unknown format or
+    a filter that doesn't apply.
+    """
+    export = EXPORTS[name]
+    if format not in FORMATS:
+        raise ValueError(f'Unknown format: {format}')
+    config = _config()
+    queryset = export.queryset(start, end, **filters)
+    # Pin the alias now: the rows are read after the view has returned
+    queryset = queryset.using(queryset.db)
+    chunk_size = max(1, config['CHUNK_SIZE'] // export.chunk_divisor)
+    rows = (out for row in _fetch(queryset, chunk_size) for out in export.rows(row))
+    encode = _csv if format == 'csv' else _jsonl
+
+    response = StreamingHttpResponse(encode(export.header, rows, config['FLUSH_BYTES']), content_type=FORMATS[format])
+    response['Content-Disposition'] = f'attachment; filename="{name}-{start}-{end}.{format}"'
+    return response
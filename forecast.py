@@ -0,0 +1,146 @@
+"""Predict when SmartBins become full from their fill-level history.
+
+Per-bin fill rates are fitted with one least-squares pass over the hourly
+rollups of a whole municipality at once: the samples of every bin are
+reduced to grouped sums with ``np.bincount`` instead of looping per bin.
+Only the samples since a bin was last emptied (a drop of ``RESET_DROP``
+points or more) take part in its fit.
+
+A municipality's forecast is cached in the dashboard cache for the hour
+of the rollup bucket it was fitted up to. A new forecast is only built
+once per hour, when the next bucket begins.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from . import dashcache
+from .models import BinLevelRollup, SmartBin
+from .telemetry import FULL_THRESHOLD
+
+LOOKBACK = timedelta(days=3)
+RESET_DROP = 20      # level drop that marks a bin as emptied
+MIN_RATE = 0.01      # level points per hour below which a bin is not filling
+
+
+def fit_fill_rates(bin_idx, hours, levels, n_bins, reset_drop=RESET_DROP):
+    """Fit a fill rate (level points per hour) for every bin at once.
+
+    ``bin_idx``, ``hours`` and ``levels`` are parallel arrays of samples
+    in time order; ``bin_idx`` holds values in ``range(n_bins)``.
+    ``hours`` should be relative to the start of the window to keep the
+    sums well conditioned. Bins with fewer than two usable samples get a
+    rate of 0.
+    """
+    # A stable sort by bin keeps each bin's samples in time order
+    order = np.argsort(bin_idx, kind='stable')
+    b = bin_idx[order]
+    x = hours[order].astype(np.float64)
+    y = levels[order].astype(np.float64)
+    if not len(b):
+        return np.zeros(n_bins)
+
+    # Split each bin's series at emptyings and keep only the last segment
+    new_bin = np.ones(len(b), dtype=bool)
+    new_bin[1:] = b[1:] != b[:-1]
+    emptied = np.zeros(len(b), dtype=bool)
+    emptied[1:] = (y[:-1] - y[1:]) >= reset_drop
+    segment = np.cumsum(new_bin | emptied)
+    last = np.flatnonzero(np.append(new_bin[1:], True))
+    last_segment = np.zeros(n_bins, dtype=segment.dtype)
+    last_segment[b[last]] = segment[last]
+    keep = segment == last_segment[b]
+    b, x, y = b[keep], x[keep], y[keep]
+
+    n = np.bincount(b, minlength=n_bins).astype(np.float64)
+    sx = np.bincount(b, x, n_bins)
+    sy = np.bincount(b, y, n_bins)
+    sxx = np.bincount(b, x * x, n_bins)
+    sxy = np.bincount(b, x * y, n_bins)
+
+    denom = n * sxx - sx * sx
+    rates = np.zeros(n_bins)
+    fitted = (n >= 2) & (denom > 1e-9)
+    rates[fitted] = (n[fitted] * sxy[fitted] - sx[fitted] * sy[fitted]) / denom[fitted]
+    return rates
+
+
+def hours_to_full(current, rates, threshold=FULL_THRESHOLD):
+    """Hours until each bin reaches ``threshold``; ``inf`` if it is not filling."""
+    current = np.asarray(current, dtype=np.float64)
+    remaining = threshold - current
+    hours = np.full(len(current), np.inf)
+    hours[remaining <= 0] = 0.0
+    filling = (remaining > 0) & (rates > MIN_RATE)
+    hours[filling] = remaining[filling] / rates[filling]
+    return hours
+
+
+def forecast_municipality(municipality, now=None, lookback=LOOKBACK):
+    """Return ``{bin_pk: (rate_per_hour, predicted_full_at or None)}``.
+
+    Costs two queries: the bins' current levels and the hourly rollups
+    of the lookback window.
+    """
+    now = now or timezone.now()
+    since = now - lookback
+
+    bins = list(SmartBin.objects.filter(municipality=municipality).values_list('id', 'current_level'))
+    if not bins:
+        return {}
+    pks = np.array([pk for pk, _ in bins])
+    current = np.array([level for _, level in bins])
+    position = {pk: i for i, pk in enumerate(pks.tolist())}
+
+    rows = BinLevelRollup.objects.filter(
+        municipality=municipality, resolution=3600, bucket__gte=since
+    ).order_by('bucket').values_list('bin_id', 'bucket', 'level_sum', 'sample_count')
+
+    bin_idx, hours, levels = [], [], []
+    start = since.timestamp()
+    for bin_pk, bucket, level_sum, count in rows.iterator(chunk_size=10000):
+        i = position.get(bin_pk)
+        if i is not None and count:
+            bin_idx.append(i)
+            hours.append((bucket.timestamp() - start) / 3600)
+            levels.append(level_sum / count)
+
+    rates = fit_fill_rates(
+        np.array(bin_idx, dtype=np.int64), np.array(hours), np.array(levels), len(pks)
+    )
+    remaining = hours_to_full(current, rates)
+
+    forecast = {}
+    for pk, rate, hours_left in zip(pks.tolist(), rates.tolist(), remaining.tolist()):
+        full_at = now + timedelta(hours=hours_left) if hours_left != float('inf') else None
+        forecast[pk] = (rate, full_at)
+    return forecast
+
+
+def cached_forecast(municipality, now=None):
+    """``forecast_municipality``, built at most once per hourly rollup bucket."""
+    now = now or timezone.now()
+    generation = int(now.timestamp() // 3600)
+    return dashcache.fetch(
+        'municipality.forecast', [], lambda: forecast_municipality(municipality, now=now),
+        vary=[municipality.id, generation],
+    )
+
+
+def bins_predicted_full_by(municipality, when, now=None):
+    """Linked bins expected to be full by ``when``, soonest first.
+
+    Each bin gets ``predicted_full_at`` and ``fill_rate`` attributes.
+    Bins that are already full are included. The bins themselves are
+    read fresh; only the fitted forecast comes from the cache.
+    """
+    forecast = cached_forecast(municipality, now=now)
+    due = {pk: value for pk, value in forecast.items() if value[1] is not None and value[1] <= when}
+    bins = list(
+        SmartBin.objects.filter(id__in=due, customer__isnull=False).select_related('customer__user')
+    )
+    for bin in bins:
+        bin.fill_rate, bin.predicted_full_at = due[bin.id]
+    bins.sort(key=lambda bin: bin.predicted_full_at)
+    return bins
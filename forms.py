@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django import forms
 from django.contrib.auth.models import User
 from .models import *
@@ -19,7 +21,7 @@ class CollectionAgentForm(forms.ModelForm):
     
     class Meta:
         model = CollectionAgent
-        fields = ['phone', 'address', 'vehicle_number', 'municipality']
+        fields = ['phone', 'address', 'vehicle_number', 'vehicle_capacity', 'municipality']
 
 class RecyclerForm(forms.ModelForm):
     username = forms.CharField(max_length=150)
@@ -43,8 +45,46 @@ class RecyclerBookingForm(forms.ModelForm):
         widgets = {
             'collection_date': forms.DateInput(attrs={'type': 'date'}),
         }
+    
+    def __init__(self, *args, municipality=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['waste_type'].queryset = WasteType.objects.filter(is_active=True).order_by('name')
+        if municipality is not None:
+            self.fields['recycler'].queryset = Recycler.objects.filter(municipality=municipality, is_approved=True)
 
 class EnquiryForm(forms.ModelForm):
     class Meta:
         model = Enquiry
         fields = ['subject', 'message']
+
+class DispatchForm(forms.Form):
+    collection_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    horizon_hours = forms.IntegerField(min_value=0, max_value=168, initial=0, required=False)
+
+class QuoteForm(forms.Form):
+    waste_type = forms.SlugField(max_length=20)
+    weight = forms.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+class PositionForm(forms.Form):
+    latitude = forms.FloatField(min_value=-90, max_value=90)
+    longitude = forms.FloatField(min_value=-180, max_value=180)
+
+class NearbyBinsForm(PositionForm):
+    radius_km = forms.FloatField(min_value=0, max_value=50)
+    full = forms.BooleanField(required=False)
+
+class ClusterForm(forms.Form):
+    cell_km = forms.FloatField(min_value=0.05, max_value=50, required=False)
+
+class AnalyticsForm(forms.Form):
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    municipality = forms.IntegerField(required=False)
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON lines')], required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    municipality = forms.IntegerField(required=False)
+    recycler = forms.IntegerField(required=False)
+    status = forms.CharField(max_length=20, required=False)
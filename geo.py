@@ -0,0 +1,159 @@
+"""Small geometry helpers for bins and agents.
+
+Coordinates are WGS84 degrees. At city scale an equirectangular
+projection to kilometres around a reference latitude is accurate to well
+under a percent, so routing and indexing work on plain (x, y) km.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 110.574
+LINEAR_SCAN = 32  # remaining points below which a lookup just checks them all
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def project(points, ref_lat=None):
+    """Project ``(lat, lon)`` pairs to ``(x, y)`` kilometres."""
+    points = list(points)
+    if ref_lat is None:
+        ref_lat = sum(lat for lat, _ in points) / len(points) if points else 0.0
+    km_per_deg_lon = 111.320 * math.cos(math.radians(ref_lat))
+    return [(lon * km_per_deg_lon, lat * KM_PER_DEG_LAT) for lat, lon in points]
+
+
+def cell_size(points, per_cell=2):
+    """Grid cell edge in km that puts about ``per_cell`` of ``points`` in each cell."""
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    area = max(max(xs) - min(xs), 1e-3) * max(max(ys) - min(ys), 1e-3)
+    return max(math.sqrt(per_cell * area / len(points)), 0.05)
+
+
+class GridIndex:
+    """Uniform grid over projected points for nearest-neighbour lookups.
+
+    Points can be removed as they are consumed (e.g. visited route stops).
+    Lookups only walk the cells inside the bounding box of the points, so
+    a query far outside it costs no more than one next to it.
+    """
+
+    def __init__(self, points, cell_km=0.5):
+        self.cell = cell_km
+        self.points = points
+        self.cells = defaultdict(set)
+        for i, (x, y) in enumerate(points):
+            self.cells[self._key(x, y)].add(i)
+        self.size = len(points)
+        if self.cells:
+            gxs = [gx for gx, _ in self.cells]
+            gys = [gy for _, gy in self.cells]
+            self.bounds = min(gxs), min(gys), max(gxs), max(gys)
+
+    def _key(self, x, y):
+        return int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+
+    def remove(self, i):
+        x, y = self.points[i]
+        self.cells[self._key(x, y)].discard(i)
+        self.size -= 1
+
+    def _remaining(self):
+        for members in self.cells.values():
+            yield from members
+
+    def _first_ring(self, cx, cy):
+        """The first ring around ``(cx, cy)`` that reaches the bounding box."""
+        x0, y0, x1, y1 = self.bounds
+        return max(0, x0 - cx, cx - x1, y0 - cy, cy - y1)
+
+    def nearest(self, x, y):
+        """Index of the nearest remaining point, or None when empty."""
+        if not self.size:
+            return None
+        if self.size <= LINEAR_SCAN:
+            return min(self._remaining(), key=lambda i: (self.points[i][0] - x) ** 2 + (self.points[i][1] - y) ** 2)
+        cx, cy = self._key(x, y)
+        best, best_d = None, float('inf')
+        ring = self._first_ring(cx, cy)
+        while True:
+            for gx, gy in self._ring(cx, cy, ring):
+                for i in self.cells.get((gx, gy), ()):
+                    px, py = self.points[i]
+                    d = (px - x) ** 2 + (py - y) ** 2
+                    if d < best_d:
+                        best, best_d = i, d
+            # Anything outside this ring is at least ring * cell away
+            if best is not None and best_d <= (ring * self.cell) ** 2:
+                return best
+            ring += 1
+
+    def k_nearest(self, x, y, k):
+        """``(distance_km, index)`` of the ``k`` nearest remaining points, closest first."""
+        k = min(k, self.size)
+        if k <= 0:
+            return []
+        if self.size <= LINEAR_SCAN:
+            found = ((math.hypot(self.points[i][0] - x, self.points[i][1] - y), i) for i in self._remaining())
+            return heapq.nsmallest(k, found)
+        cx, cy = self._key(x, y)
+        best = []  # max-heap of (-d2, i) holding the k closest so far
+        seen = 0
+        ring = self._first_ring(cx, cy)
+        while True:
+            for gx, gy in self._ring(cx, cy, ring):
+                for i in self.cells.get((gx, gy), ()):
+                    seen += 1
+                    px, py = self.points[i]
+                    d = (px - x) ** 2 + (py - y) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+            if len(best) == k and (seen == self.size or -best[0][0] <= (ring * self.cell) ** 2):
+                return sorted((math.sqrt(-d), i) for d, i in best)
+            ring += 1
+
+    def within(self, x, y, radius_km):
+        """``(distance_km, index)`` of the remaining points within ``radius_km``, closest first."""
+        if not self.cells:
+            return []
+        (x0, y0), (x1, y1) = self._key(x - radius_km, y - radius_km), self._key(x + radius_km, y + radius_km)
+        bx0, by0, bx1, by1 = self.bounds
+        x0, y0, x1, y1 = max(x0, bx0), max(y0, by0), min(x1, bx1), min(y1, by1)
+        r2 = radius_km ** 2
+        found = []
+        for gx in range(x0, x1 + 1):
+            for gy in range(y0, y1 + 1):
+                for i in self.cells.get((gx, gy), ()):
+                    px, py = self.points[i]
+                    d = (px - x) ** 2 + (py - y) ** 2
+                    if d <= r2:
+                        found.append((math.sqrt(d), i))
+        found.sort()
+        return found
+
+    def _ring(self, cx, cy, ring):
+        """Cells of the bounding box on the square ring ``ring`` cells out from ``(cx, cy)``."""
+        x0, y0, x1, y1 = self.bounds
+        if not ring:
+            yield cx, cy
+            return
+        columns = range(max(cx - ring, x0), min(cx + ring, x1) + 1)
+        for gy in (cy - ring, cy + ring):
+            if y0 <= gy <= y1:
+                for gx in columns:
+                    yield gx, gy
+        rows = range(max(cy - ring + 1, y0), min(cy + ring - 1, y1) + 1)
+        for gx in (cx - ring, cx + ring):
+            if x0 <= gx <= x1:
+                for gy in rows:
+                    yield gx, gy
@@ -0,0 +1,269 @@
+"""Fill-level history for SmartBins.
+
+Raw readings are stored as packed ``(seconds since midnight u32, level
+u8)`` samples in ``BinLevelDay`` rows, one per bin and UTC day.
+
+Ingestion never reads history back. Each batch appends its samples to
+the day rows of the bins it touched, concatenating in the database, and
+folds them into 5-minute, hourly and daily ``BinLevelRollup`` rows
+(min/max/sum/count). Both are ``INSERT ... ON CONFLICT DO UPDATE``
+statements (``ON DUPLICATE KEY UPDATE`` on MySQL), one per
+``UPSERT_BATCH`` rows, however long the day's history has grown.
+
+Range queries over more than ``RAW_SPAN`` read the rollups.
+``apply_retention`` drops raw days and fine rollups once they age out.
+"""
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+import struct
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from .models import BinLevelDay, BinLevelRollup
+
+SAMPLE = struct.Struct('<IB')
+RESOLUTIONS = [res for res, _ in BinLevelRollup.RESOLUTION_CHOICES]
+
+# Rows per upsert statement; 8 parameters each stays under SQLite's limit
+UPSERT_BATCH = 100
+
+# Longest span served as raw samples
+RAW_SPAN = timedelta(days=1)
+
+DEFAULT_RETENTION = {
+    'RAW_DAYS': 14,
+    'ROLLUP_DAYS': {300: 30, 3600: 365, 86400: None},
+}
+
+
+def pack_samples(samples):
+    return b''.join(SAMPLE.pack(secs, level) for secs, level in samples)
+
+
+def unpack_samples(blob):
+    return list(SAMPLE.iter_unpack(memoryview(blob)))
+
+
+def _utc(ts):
+    return ts.astimezone(dt_timezone.utc) if timezone.is_aware(ts) else ts
+
+
+def _bucket(ts, resolution):
+    epoch = int(ts.timestamp())
+    bucket = datetime.fromtimestamp(epoch - epoch % resolution, tz=dt_timezone.utc)
+    return bucket if settings.USE_TZ else timezone.make_naive(bucket, dt_timezone.utc)
+
+
+def record_samples(samples):
+    """Append ``(bin_pk, municipality_pk, ts, level)`` samples.
+
+    Costs one day-row upsert and one rollup upsert per ``UPSERT_BATCH``
+    rows, however many samples or bins are involved.
+    """
+    if not samples:
+        return
+    with transaction.atomic():
+        _append_days(samples)
+        _upsert_rollups(samples)
+
+
+def _upsert(model, names, key, updates, rows):
+    """Run ``INSERT ... ON CONFLICT (key) DO UPDATE`` for ``rows`` of ``names`` columns.
+
+    ``updates`` maps a column to its new value given ``(old, new)`` column
+    references; MySQL spells them ``column`` and ``VALUES(column)``.
+    """
+    meta = model._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    columns = {name: qn(meta.get_field(name).column) for name in names}
+    values = ', '.join(['(' + ', '.join(['%s'] * len(names)) + ')'] * len(rows))
+    sql = f'INSERT INTO {table} ({", ".join(columns.values())}) VALUES {values}'
+    if connection.vendor == 'mysql':
+        changes = (f'{columns[name]} = {update(columns[name], f"VALUES({columns[name]})")}'
+                   for name, update in updates.items())
+        sql += f' ON DUPLICATE KEY UPDATE {", ".join(changes)}'
+    else:
+        changes = (f'{columns[name]} = {update(f"{table}.{columns[name]}", f"EXCLUDED.{columns[name]}")}'
+                   for name, update in updates.items())
+        sql += f' ON CONFLICT ({", ".join(columns[name] for name in key)}) DO UPDATE SET {", ".join(changes)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def _sum(old, new):
+    return f'{old} + {new}'
+
+
+def _concat(old, new):
+    if connection.vendor == 'mysql':
+        return f'CONCAT({old}, {new})'
+    if connection.vendor == 'sqlite':
+        # SQLite's || yields text; the cast keeps the bytes as a blob
+        return f'CAST({old} || {new} AS BLOB)'
+    return f'{old} || {new}'
+
+
+def _append_days(samples):
+    new_samples = defaultdict(list)
+    municipalities = {}
+    for bin_pk, municipality_pk, ts, level in samples:
+        ts = _utc(ts)
+        secs = ts.hour * 3600 + ts.minute * 60 + ts.second
+        new_samples[(bin_pk, ts.date())].append((secs, level))
+        municipalities[bin_pk] = municipality_pk
+
+    blob = BinLevelDay._meta.get_field('samples')
+    # Sorted so concurrent batches lock shared days in the same order
+    rows = [
+        (bin_pk, municipalities[bin_pk], connection.ops.adapt_datefield_value(day),
+         blob.get_db_prep_value(pack_samples(rows), connection), len(rows))
+        for (bin_pk, day), rows in sorted(new_samples.items())
+    ]
+    for i in range(0, len(rows), UPSERT_BATCH):
+        _upsert(
+            BinLevelDay, ['bin', 'municipality', 'day', 'samples', 'sample_count'], ['bin', 'day'],
+            {'samples': _concat, 'sample_count': _sum},
+            rows[i:i + UPSERT_BATCH],
+        )
+
+
+def _upsert_rollups(samples):
+    aggregates = {}
+    municipalities = {}
+    for bin_pk, municipality_pk, ts, level in samples:
+        municipalities[bin_pk] = municipality_pk
+        for resolution in RESOLUTIONS:
+            key = (bin_pk, resolution, _bucket(ts, resolution))
+            agg = aggregates.get(key)
+            if agg is None:
+                aggregates[key] = [level, level, level, 1]
+            else:
+                agg[0] = min(agg[0], level)
+                agg[1] = max(agg[1], level)
+                agg[2] += level
+                agg[3] += 1
+
+    # Sorted so concurrent batches lock shared buckets in the same order
+    rows = [
+        (bin_pk, municipalities[bin_pk], resolution, connection.ops.adapt_datetimefield_value(bucket), *agg)
+        for (bin_pk, resolution, bucket), agg in sorted(aggregates.items())
+    ]
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    for i in range(0, len(rows), UPSERT_BATCH):
+        _upsert(
+            BinLevelRollup,
+            ['bin', 'municipality', 'resolution', 'bucket', 'min_level', 'max_level', 'level_sum', 'sample_count'],
+            ['bin', 'resolution', 'bucket'],
+            {
+                'min_level': lambda old, new: f'{least}({old}, {new})',
+                'max_level': lambda old, new: f'{greatest}({old}, {new})',
+                'level_sum': _sum,
+                'sample_count': _sum,
+            },
+            rows[i:i + UPSERT_BATCH],
+        )
+
+
+def pick_resolution(start, end):
+    """Raw samples for up to ``RAW_SPAN``, then progressively coarser rollups."""
+    span = end - start
+    if span <= RAW_SPAN:
+        return None
+    if span <= timedelta(days=7):
+        return 300
+    if span <= timedelta(days=90):
+        return 3600
+    return 86400
+
+
+def bin_history(bin, start, end, resolution=None):
+    """Return one bin's history between ``start`` and ``end``.
+
+    With ``resolution=None`` the raw samples are returned as
+    ``{'ts', 'level'}`` dicts; otherwise rollup buckets as
+    ``{'bucket', 'min', 'max', 'avg', 'samples'}`` dicts. Raw samples
+    span at most ``RAW_SPAN``; a longer span raises ValueError.
+    """
+    if resolution is None:
+        if end - start > RAW_SPAN:
+            hours = RAW_SPAN.total_seconds() / 3600
+            raise ValueError(f'Raw history spans at most {hours:g} hours; use a rollup resolution')
+        start, end = _utc(start), _utc(end)
+        tz = dt_timezone.utc if timezone.is_aware(start) else None
+        points = []
+        days = BinLevelDay.objects.filter(
+            bin=bin, day__gte=start.date(), day__lte=end.date()
+        ).order_by('day')
+        for row in days:
+            midnight = datetime.combine(row.day, dt_time.min, tzinfo=tz)
+            for secs, level in unpack_samples(row.samples):
+                ts = midnight + timedelta(seconds=secs)
+                if start <= ts <= end:
+                    points.append({'ts': ts, 'level': level})
+        points.sort(key=lambda p: p['ts'])
+        return points
+
+    rollups = BinLevelRollup.objects.filter(
+        bin=bin, resolution=resolution, bucket__gte=_bucket(start, resolution), bucket__lte=end
+    ).order_by('bucket')
+    return [
+        {
+            'bucket': row.bucket,
+            'min': row.min_level,
+            'max': row.max_level,
+            'avg': round(row.avg_level, 1),
+            'samples': row.sample_count,
+        }
+        for row in rollups
+    ]
+
+
+def municipality_history(municipality, start, end, resolution=3600):
+    """Aggregate all bins of a municipality into rollup buckets."""
+    rows = (
+        BinLevelRollup.objects
+        .filter(
+            municipality=municipality, resolution=resolution,
+            bucket__gte=_bucket(start, resolution), bucket__lte=end,
+        )
+        .values('bucket')
+        .annotate(
+            min=Min('min_level'), max=Max('max_level'),
+            total=Sum('level_sum'), samples=Sum('sample_count'),
+        )
+        .order_by('bucket')
+    )
+    return [
+        {
+            'bucket': row['bucket'],
+            'min': row['min'],
+            'max': row['max'],
+            'avg': round(row['total'] / row['samples'], 1) if row['samples'] else 0,
+            'samples': row['samples'],
+        }
+        for row in rows
+    ]
+
+
+def apply_retention(now=None):
+    """Delete raw days and rollups older than SMARTBIN_HISTORY allows."""
+    now = now or timezone.now()
+    config = getattr(settings, 'SMARTBIN_HISTORY', DEFAULT_RETENTION)
+    deleted = {}
+
+    raw_days = config.get('RAW_DAYS', DEFAULT_RETENTION['RAW_DAYS'])
+    if raw_days is not None:
+        cutoff = _utc(now).date() - timedelta(days=raw_days)
+        deleted['raw'] = BinLevelDay.objects.filter(day__lt=cutoff).delete()[0]
+
+    rollup_days = config.get('ROLLUP_DAYS', DEFAULT_RETENTION['ROLLUP_DAYS'])
+    for resolution, days in rollup_days.items():
+        if days is not None:
+            deleted[resolution] = BinLevelRollup.objects.filter(
+                resolution=resolution, bucket__lt=now - timedelta(days=days)
+            ).delete()[0]
+    return deleted
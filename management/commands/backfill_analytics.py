@@ -0,0 +1,57 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from waste import analytics
+from waste.models import RecyclerBooking, WalletTransaction, WasteCollection
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise CommandError(f'Invalid date: {value} (use YYYY-MM-DD)')
+    return day
+
+
+def _first_day():
+    firsts = [
+        WasteCollection.objects.aggregate(first=Min('collected_at'))['first'],
+        WalletTransaction.objects.filter(kind='collection_credit').aggregate(first=Min('created_at'))['first'],
+    ]
+    days = [timezone.localdate(first) for first in firsts if first is not None]
+    booking = RecyclerBooking.objects.filter(status='collected').aggregate(first=Min('collection_date'))['first']
+    if booking is not None:
+        days.append(booking)
+    return min(days, default=None)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily analytics rollups from collections, wallet credits and recycler bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_date, help='first day (default: the earliest recorded event)')
+        parser.add_argument('--end', type=_date, help='last day (default: today)')
+        parser.add_argument('--municipality', type=int, action='append', help='only this municipality id; repeatable')
+        parser.add_argument('--chunk-days', type=int, default=31, help='days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or _first_day()
+        if start is None:
+            self.stdout.write('Nothing to backfill')
+            return
+        if start > end:
+            raise CommandError('--start is after --end')
+
+        began = time.perf_counter()
+        rows = 0
+        day = start
+        while day <= end:
+            last = min(end, day + timedelta(days=options['chunk_days'] - 1))
+            rows += analytics.rebuild(day, last, options['municipality'])
+            day = last + timedelta(days=1)
+        self.stdout.write(f'{rows} rollup rows for {start} to {end} rebuilt in {time.perf_counter() - began:.1f}s')
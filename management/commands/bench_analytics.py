@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+from datetime import timedelta
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from waste import analytics
+from waste.benchmark import data
+from waste.benchmark.sandbox import sandbox
+from waste.models import RecyclerBooking, WalletTransaction, WasteCollection
+
+BATCH = 5000
+
+
+@contextmanager
+def backdated(*models):
+    """Let bulk_create() write ``created_at`` instead of stamping it with now."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def timed(query, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = query()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2] * 1000, result
+
+
+class Command(BaseCommand):
+    help = ('Load millions of collections, credits and bookings, then compare analytics answered from the daily '
+            'rollups with ad-hoc aggregation over the raw rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--municipalities', type=int, default=10)
+        parser.add_argument('--collections', type=int, default=1000000)
+        parser.add_argument('--bookings', type=int, default=200000)
+        parser.add_argument('--days', type=int, default=365, help='history the rows are spread over')
+        parser.add_argument('--repeat', type=int, default=5, help='runs per rollup query, median reported')
+
+    def handle(self, *args, **options):
+        with sandbox():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(0)
+        start = time.perf_counter()
+        dataset = data.generate(options['municipalities'], customers=20, agents=5, recyclers=3, collections=0,
+                                tag='analyticsbench_', rng=rng)
+        customers, recyclers = dataset['customers'], dataset['recyclers']
+        bins = {bin.customer_id: bin.id for bin in dataset['bins']}
+        waste_types = ['plastic', 'paper', 'metal']
+        now = timezone.now()
+
+        def moment():
+            return now - timedelta(seconds=rng.uniform(0, options['days'] * 86400))
+
+        with backdated(WasteCollection, WalletTransaction):
+            for offset in range(0, options['collections'], BATCH):
+                collections, credits = [], []
+                for _ in range(min(BATCH, options['collections'] - offset)):
+                    customer = rng.choice(customers)
+                    collected_at = moment()
+                    verified = rng.random() < 0.6
+                    collections.append(WasteCollection(
+                        customer=customer, bin_id=bins[customer.id], municipality_id=customer.municipality_id,
+                        collection_date=collected_at.date(), amount=50, status='verified' if verified else 'collected',
+                        created_at=collected_at - timedelta(hours=rng.uniform(0.5, 48)), collected_at=collected_at,
+                    ))
+                    if verified:
+                        credits.append(WalletTransaction(
+                            municipality_id=customer.municipality_id, kind='collection_credit', amount=50,
+                            created_at=min(now, collected_at + timedelta(hours=rng.uniform(0, 24))),
+                        ))
+                WasteCollection.objects.bulk_create(collections)
+                WalletTransaction.objects.bulk_create(credits)
+        RecyclerBooking.objects.bulk_create(
+            (
+                RecyclerBooking(
+                    customer=customer, recycler=rng.choice([r for r in recyclers
+                                                            if r.municipality_id == customer.municipality_id]),
+                    waste_type_id=rng.choice(waste_types), weight=rng.randint(1, 40), amount=rng.randint(20, 800),
+                    collection_date=moment().date(), status='collected',
+                )
+                for customer in (rng.choice(customers) for _ in range(options['bookings']))
+            ),
+            batch_size=BATCH,
+        )
+        self.stdout.write(f'loaded {options["collections"]} collections and {options["bookings"]} bookings over '
+                          f'{options["days"]} days in {options["municipalities"]} municipalities '
+                          f'in {time.perf_counter() - start:.0f}s')
+
+        today = timezone.localdate()
+        first = today - timedelta(days=options['days'])
+        start = time.perf_counter()
+        rows = analytics.rebuild(first, today)
+        self.stdout.write(f'backfill: {rows} rollup rows in {time.perf_counter() - start:.1f}s')
+
+        self.stdout.write(f'{"":<36}{"ad-hoc":>10}{"rollups":>10}{"speedup":>9}')
+        one = [dataset['municipalities'][0].id]
+        for label, days, municipality_ids in [
+            ('all municipalities, 30 days', 30, None),
+            (f'all municipalities, {options["days"]} days', options['days'], None),
+            (f'one municipality, {options["days"]} days', options['days'], one),
+        ]:
+            since = today - timedelta(days=days - 1)
+            # Ad-hoc aggregation over millions of rows is timed once
+            raw_ms, (stats, waste) = timed(lambda: analytics.aggregate_raw(since, today, municipality_ids), 1)
+            rollup_ms, summary = timed(lambda: analytics.summary(since, today, municipality_ids), options['repeat'])
+            self.stdout.write(f'{label:<36}{raw_ms:>8.0f}ms{rollup_ms:>8.1f}ms{raw_ms / rollup_ms:>8.0f}x')
+            totals = summary['totals']
+            if (sum(row['collections_collected'] for row in stats.values()) != totals['collections_collected']
+                    or sum(row['revenue'] for row in stats.values()) != totals['revenue']
+                    or sum(row['bookings'] for row in waste.values())
+                    != sum(row['bookings'] for row in summary['recycled'].values())):
+                self.stdout.write(self.style.WARNING(f'{label}: rollups and raw aggregation disagree'))
+
+        collection = WasteCollection.objects.filter(municipality_id=one[0]).first()
+        start = time.perf_counter()
+        for _ in range(1000):
+            analytics.record_collected(collection)
+        self.stdout.write(f'incremental update: {(time.perf_counter() - start):.2f} ms per event')
@@ -0,0 +1,63 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from waste import codec
+from waste.telemetry import clean_reading
+
+
+def throughput(fn, n_readings, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return n_readings / best
+
+
+class Command(BaseCommand):
+    help = 'Compare size and parse throughput of JSON and binary bin readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        n = options['readings']
+        now = int(time.time())
+        tuples = [(f'BIN{i:05d}', random.randint(0, 100), now) for i in range(n)]
+
+        json_single = [
+            json.dumps({'bin_id': b, 'level': level}).encode() for b, level, _ in tuples
+        ]
+        json_batch = json.dumps(
+            [{'bin_id': b, 'level': level, 'ts': ts} for b, level, ts in tuples]
+        ).encode()
+        binary_single = [codec.encode_readings([t]) for t in tuples]
+        binary_batch = codec.encode_readings(tuples)
+
+        def json_current():
+            # What update_bin_status does per request today
+            for body in json_single:
+                data = json.loads(body)
+                data.get('bin_id')
+                int(data.get('level', 0))
+
+        rows = [
+            ('json, one per request', sum(map(len, json_single)) / n, json_current),
+            ('json batch', len(json_batch) / n, lambda: json.loads(json_batch)),
+            ('json batch + clean', len(json_batch) / n,
+             lambda: [clean_reading(r) for r in json.loads(json_batch)]),
+            ('binary, one per request', sum(map(len, binary_single)) / n,
+             lambda: [codec.decode_readings(b) for b in binary_single]),
+            ('binary batch', len(binary_batch) / n, lambda: codec.decode_readings(binary_batch)),
+            ('binary batch + clean', len(binary_batch) / n,
+             lambda: [clean_reading(r) for r in codec.decode_readings(binary_batch)]),
+        ]
+
+        self.stdout.write(f'{"format":<26}{"bytes/reading":>15}{"readings/sec":>16}')
+        for name, size, fn in rows:
+            rate = throughput(fn, n, options['repeat'])
+            self.stdout.write(f'{name:<26}{size:>15.1f}{rate:>16,.0f}')
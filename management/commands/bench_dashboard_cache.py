@@ -0,0 +1,95 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from waste import dashcache
+from waste.benchmark.report import percentile
+from waste.benchmark.sandbox import sandbox
+
+from .bench_dashboards import seed
+
+BENCH_ALIAS = 'smartbin-bench'
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 dashboard latency and query counts with the fragment cache cold and warm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=500, help='rows in each dashboard list')
+        parser.add_argument('--requests', type=int, default=50, help='requests per dashboard and mode')
+        parser.add_argument('--alias', help='benchmark this configured cache instead of a private '
+                                            'local-memory one; it is cleared, so use a scratch cache')
+
+    def handle(self, *args, **options):
+        alias = options['alias'] or BENCH_ALIAS
+        cache_settings = {**settings.CACHES}
+        if not options['alias']:
+            cache_settings[BENCH_ALIAS] = {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': BENCH_ALIAS,
+            }
+        config = {**getattr(settings, 'SMARTBIN_DASHBOARD_CACHE', {}), 'ENABLED': True, 'ALIAS': alias}
+
+        # Rows are rolled back afterwards and their ids may be reused, so
+        # fragments must not outlive the run in a shared cache
+        with override_settings(CACHES=cache_settings, SMARTBIN_DASHBOARD_CACHE=config):
+            try:
+                with sandbox():
+                    self.run(caches[alias], options)
+            finally:
+                caches[alias].clear()
+
+    def run(self, cache, options):
+        logins = seed(options['scale'], 'cachebench_')
+        logins['admin_dashboard'] = User.objects.create_superuser('cachebench_admin')
+        before = dashcache.stats()['fragments']
+
+        self.stdout.write(f'{options["scale"]} rows per list, {options["requests"]} requests per mode, '
+                          f'{type(cache).__name__}')
+        self.stdout.write(f'{"":<24}{"cold p50":>10}{"p99":>9}{"queries":>9}'
+                          f'{"warm p50":>11}{"p99":>9}{"queries":>9}')
+        for name, user in logins.items():
+            try:
+                get_template(f'{name}.html')
+            except TemplateDoesNotExist:
+                continue
+            client = Client()
+            client.force_login(user)
+            url = reverse(name)
+            cold, cold_queries = self.measure(client, url, options['requests'], cache.clear)
+            warm, warm_queries = self.measure(client, url, options['requests'])
+            self.stdout.write(
+                f'{name:<24}{percentile(cold, 0.5):>8.1f}ms{percentile(cold, 0.99):>7.1f}ms{cold_queries:>9}'
+                f'{percentile(warm, 0.5):>9.1f}ms{percentile(warm, 0.99):>7.1f}ms{warm_queries:>9}'
+            )
+
+        self.stdout.write('\nfragment hits/misses')
+        for fragment, counts in sorted(dashcache.stats()['fragments'].items()):
+            previous = before.get(fragment, {'hits': 0, 'misses': 0})
+            self.stdout.write(f'    {fragment:<28}{counts["hits"] - previous["hits"]:>6} / '
+                              f'{counts["misses"] - previous["misses"]}')
+
+    def measure(self, client, url, n, reset=None):
+        queries = []
+        counter = lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)
+        if reset is None:
+            client.get(url)  # warm up
+        samples = []
+        for _ in range(n):
+            if reset is not None:
+                reset()
+            del queries[:]
+            start = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                client.get(url)
+            samples.append(time.perf_counter() - start)
+        return samples, len(queries)
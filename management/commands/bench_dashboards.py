@@ -0,0 +1,137 @@
+import time
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from waste.benchmark.sandbox import sandbox
+from waste.models import (
+    CollectionAgent, Customer, Municipality, Recycler, RecyclerBooking, SmartBin, WasteCollection,
+)
+
+
+def seed(scale, tag):
+    """Create one approved user per role plus ``scale`` rows in every dashboard list."""
+    def users(prefix, n):
+        User.objects.bulk_create(User(username=f'{tag}{prefix}{i}') for i in range(n))
+        return User.objects.filter(username__startswith=f'{tag}{prefix}').order_by('id')
+
+    municipality = Municipality.objects.create(
+        user=User.objects.create_user(f'{tag}municipality'), name=tag, area=tag, phone='0', address=tag,
+    )
+    # bulk_create() does not return primary keys on every backend, so re-read rows
+    Customer.objects.bulk_create(
+        Customer(user=u, municipality=municipality, phone='0', address='addr')
+        for u in users('customer', scale + 1)
+    )
+    customers = list(Customer.objects.filter(municipality=municipality).order_by('id'))
+    customer = customers.pop()
+    CollectionAgent.objects.bulk_create(
+        CollectionAgent(user=u, municipality=municipality, phone='0', address='a', vehicle_number='V')
+        for u in users('agent', scale + 1)
+    )
+    agent = CollectionAgent.objects.filter(municipality=municipality).latest('id')
+    Recycler.objects.bulk_create(
+        Recycler(user=u, municipality=municipality, company_name='R', phone='0', address='a')
+        for u in users('recycler', scale + 1)
+    )
+    recycler = Recycler.objects.filter(municipality=municipality).latest('id')
+    for obj in (customer, agent, recycler):
+        type(obj).objects.filter(pk=obj.pk).update(is_approved=True)
+
+    SmartBin.objects.bulk_create(
+        SmartBin(bin_id=f'{tag}B{i}', municipality=municipality, customer=c, current_level=90, is_full=True)
+        for i, c in enumerate(customers)
+    )
+    bins = list(SmartBin.objects.filter(municipality=municipality).order_by('id'))
+    WasteCollection.objects.bulk_create(
+        WasteCollection(
+            customer=c, bin=b, municipality=municipality, collection_agent=agent,
+            collection_date='2024-01-01', amount=50, status=status,
+        )
+        for c, b in zip(customers, bins)
+        for status in ('pending', 'assigned')
+    )
+    WasteCollection.objects.bulk_create(
+        WasteCollection(customer=customer, bin=b, municipality=municipality, collection_agent=agent,
+                        collection_date='2024-01-01', amount=50, status='collected')
+        for b in bins[:5]
+    )
+    RecyclerBooking.objects.bulk_create(
+        RecyclerBooking(
+            customer=c, recycler=recycler, collection_agent=agent, waste_type_id='plastic',
+            weight=1, amount=20, collection_date='2024-01-01', status=status,
+        )
+        for c in customers
+        for status in ('pending', 'assigned')
+    )
+    return {
+        'municipality_dashboard': municipality.user,
+        'customer_dashboard': customer.user,
+        'agent_dashboard': agent.user,
+        'recycler_dashboard': recycler.user,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Check that dashboard query counts stay constant as data grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = {}
+        # Count the queries of a full render, not of cached fragments
+        no_cache = {**getattr(settings, 'SMARTBIN_DASHBOARD_CACHE', {}), 'ENABLED': False}
+        with override_settings(SMARTBIN_DASHBOARD_CACHE=no_cache):
+            for scale in options['scales']:
+                with sandbox():
+                    results[scale] = self.measure(scale, options['repeat'])
+
+        names = sorted({name for r in results.values() for name in r})
+        header = ''.join(f'{scale:>16}' for scale in results)
+        self.stdout.write(f'{"queries / ms":<26}{header}')
+        unbounded = []
+        for name in names:
+            cells = [results[scale].get(name) for scale in results]
+            row = ''.join(
+                f'{"-":>16}' if c is None else f'{c[0]:>8} {c[1]:>6.1f}ms'
+                for c in cells
+            )
+            self.stdout.write(f'{name:<26}{row}')
+            counts = {c[0] for c in cells if c is not None}
+            if len(counts) > 1:
+                unbounded.append(name)
+        if unbounded:
+            raise CommandError(f'Query count grows with data: {", ".join(unbounded)}')
+
+    def measure(self, scale, repeat):
+        logins = seed(scale, f'bench{scale}_')
+        measured = {}
+        for name, user in logins.items():
+            try:
+                get_template(f'{name}.html')
+            except TemplateDoesNotExist:
+                continue
+            client = Client()
+            client.force_login(user)
+            url = reverse(name)
+            queries = []
+            # The request_started signal resets connection.queries, so count
+            # with an execute wrapper rather than CaptureQueriesContext
+            counter = lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)
+            with connection.execute_wrapper(counter):
+                client.get(url)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                client.get(url)
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            measured[name] = (len(queries), elapsed)
+        return measured
@@ -0,0 +1,138 @@
+import multiprocessing
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, Q
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from waste import telemetry, wallet
+from waste.benchmark.report import percentile
+from waste.models import Customer, Municipality, SmartBin, WalletTransaction
+
+TAG = 'dbwrites_'
+
+
+def seed(bins):
+    municipality = Municipality.objects.create(
+        user=User.objects.create_user(f'{TAG}municipality'), name=TAG, area=TAG, phone='0', address=TAG,
+    )
+    User.objects.bulk_create(User(username=f'{TAG}c{i}') for i in range(bins))
+    Customer.objects.bulk_create(
+        Customer(user=u, municipality=municipality, phone='0', address='a')
+        for u in User.objects.filter(username__startswith=f'{TAG}c')
+    )
+    SmartBin.objects.bulk_create(
+        SmartBin(bin_id=f'{TAG}B{n}', municipality=municipality, customer=c)
+        for n, c in enumerate(Customer.objects.filter(municipality=municipality))
+    )
+    return municipality
+
+
+def cleanup():
+    WalletTransaction.objects.filter(customer__user__username__startswith=TAG).delete()
+    SmartBin.objects.filter(bin_id__startswith=TAG).delete()
+    User.objects.filter(username__startswith=TAG).delete()
+
+
+class Command(BaseCommand):
+    help = ('Run IoT writers, wallet writers and dashboard readers against the default database at once '
+            'and report throughput, p99 latency and lock errors (SQLite: rollback journal vs WAL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='duration of each run')
+        parser.add_argument('--iot', type=int, default=4, help='threads writing bin levels')
+        parser.add_argument('--wallet', type=int, default=2, help='threads topping up wallets')
+        parser.add_argument('--readers', type=int, default=4, help='threads reading the dashboard lists')
+        parser.add_argument('--bins', type=int, default=200)
+        parser.add_argument('--batch', type=int, default=50, help='readings per IoT write')
+
+    def handle(self, *args, **options):
+        cleanup()
+        municipality = seed(options['bins'])
+        try:
+            if connection.vendor == 'sqlite':
+                for mode in ('delete', 'wal'):
+                    with override_settings(SMARTBIN_DATABASE={'SQLITE_WAL': mode == 'wal'}):
+                        with connection.cursor() as cursor:
+                            cursor.execute(f'PRAGMA journal_mode={mode}')
+                        self.run(f'sqlite {mode}', municipality, options)
+            else:
+                self.run(connection.vendor, municipality, options)
+        finally:
+            cleanup()
+
+    def run(self, label, municipality, options):
+        bin_ids = list(SmartBin.objects.filter(municipality=municipality).values_list('bin_id', flat=True))
+        customers = list(Customer.objects.filter(municipality=municipality))
+        # Processes rather than threads, so Python work in one client does not
+        # hold up the others and only the database serializes them
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        reports = context.Queue()
+
+        def iot():
+            now = timezone.now()
+            telemetry.write_levels({
+                bin_id: (random.randint(0, 100), now)
+                for bin_id in random.sample(bin_ids, min(options['batch'], len(bin_ids)))
+            })
+
+        def top_up():
+            wallet.top_up(random.choice(customers), 1)
+
+        def read():
+            list(SmartBin.objects.filter(municipality=municipality, is_full=True)
+                 .select_related('customer__user').order_by('id')[:50])
+            SmartBin.objects.filter(municipality=municipality).aggregate(
+                total=Count('id'), full=Count('id', filter=Q(is_full=True)),
+            )
+
+        def worker(kind, operation):
+            stats = {'ops': 0, 'locked': 0, 'latency': []}
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        operation()
+                    except OperationalError:
+                        # SQLite: "database is locked" once the busy timeout runs out
+                        stats['locked'] += 1
+                        continue
+                    stats['ops'] += 1
+                    stats['latency'].append(time.perf_counter() - start)
+            finally:
+                connection.close()
+                reports.put((kind, stats))
+
+        workers = (
+            [('iot', iot)] * options['iot'] + [('wallet', top_up)] * options['wallet']
+            + [('reader', read)] * options['readers']
+        )
+        connections.close_all()
+        processes = [context.Process(target=worker, args=args) for args in workers]
+        for process in processes:
+            process.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        results = {kind: {'ops': 0, 'locked': 0, 'latency': []} for kind in ('iot', 'wallet', 'reader')}
+        for _ in processes:
+            kind, stats = reports.get()
+            results[kind]['ops'] += stats['ops']
+            results[kind]['locked'] += stats['locked']
+            results[kind]['latency'] += stats['latency']
+        for process in processes:
+            process.join()
+
+        self.stdout.write(f'{label}: {options["iot"]} IoT writers ({options["batch"]} readings each), '
+                          f'{options["wallet"]} wallet writers, {options["readers"]} readers')
+        for kind, stats in results.items():
+            self.stdout.write(
+                f'    {kind:<8}{stats["ops"] / options["seconds"]:>9.1f} ops/s'
+                f'    p50 {percentile(stats["latency"], 0.5):>7.1f}ms'
+                f'    p99 {percentile(stats["latency"], 0.99):>7.1f}ms'
+                f'    {stats["locked"]} locked'
+            )
@@ -0,0 +1,105 @@
+from datetime import timedelta
+import gc
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from waste.benchmark import data
+from waste.benchmark.sandbox import sandbox
+from waste.models import WasteCollection
+
+BATCH = 5000
+
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        raise CommandError('Measuring RSS needs /proc (Linux)')
+    return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+class Command(BaseCommand):
+    help = ('Stream millions of synthetic collections through /api/export/ and check that memory stays flat '
+            'while measuring rows per second')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--formats', nargs='+', choices=['csv', 'jsonl'], default=['csv', 'jsonl'])
+        parser.add_argument('--max-rss-mb', type=float, default=64,
+                            help='fail if RSS grows by more than this while streaming')
+        parser.add_argument('--materialize', action='store_true',
+                            help='also load the same rows as model instances, as the admin does, for comparison')
+
+    def handle(self, *args, **options):
+        with sandbox():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(0)
+        start = time.perf_counter()
+        dataset = data.generate(1, customers=100, agents=5, recyclers=1, collections=0, tag='exportbench_', rng=rng)
+        municipality = dataset['municipalities'][0]
+        customers, agents = dataset['customers'], dataset['agents']
+        bins = {bin.customer_id: bin.id for bin in dataset['bins']}
+        today = timezone.localdate()
+        first = today - timedelta(days=364)
+        for offset in range(0, options['rows'], BATCH):
+            collections = []
+            for _ in range(min(BATCH, options['rows'] - offset)):
+                customer = rng.choice(customers)
+                collections.append(WasteCollection(
+                    customer=customer, bin_id=bins[customer.id], municipality=municipality,
+                    collection_agent=rng.choice(agents), collection_date=first + timedelta(days=rng.randrange(365)),
+                    amount=50, status=rng.choice(data.COLLECTION_STATUSES),
+                ))
+            WasteCollection.objects.bulk_create(collections)
+        del collections
+        self.stdout.write(f'loaded {options["rows"]} collections in {time.perf_counter() - start:.0f}s')
+
+        client = Client()
+        client.force_login(municipality.user)
+        url = reverse('export_records', args=['collections'])
+        failed = []
+        self.stdout.write(f'{"":<14}{"rows":>10}{"rows/s":>10}{"MB":>8}{"MB/s":>8}{"RSS +MB":>9}')
+        for format in options['formats']:
+            gc.collect()
+            baseline = peak = rss_mb()
+            began = time.perf_counter()
+            response = client.get(url, {'format': format, 'start': first, 'end': today})
+            if response.status_code != 200:
+                raise CommandError(f'{format} export returned {response.status_code}')
+            lines = size = 0
+            for piece in response.streaming_content:
+                lines += piece.count(b'\n')
+                size += len(piece)
+                peak = max(peak, rss_mb())
+            elapsed = time.perf_counter() - began
+            rows = lines - 1 if format == 'csv' else lines
+            growth = peak - baseline
+            self.stdout.write(f'{format + " stream":<14}{rows:>10}{rows / elapsed:>10.0f}{size / 2 ** 20:>8.0f}'
+                              f'{size / 2 ** 20 / elapsed:>8.1f}{growth:>9.1f}')
+            if rows != options['rows']:
+                failed.append(f'{format} exported {rows} of {options["rows"]} rows')
+            if growth > options['max_rss_mb']:
+                failed.append(f'{format} export grew RSS by {growth:.0f} MB')
+
+        if options['materialize']:
+            gc.collect()
+            baseline = rss_mb()
+            began = time.perf_counter()
+            loaded = list(WasteCollection.objects.filter(municipality=municipality))
+            elapsed = time.perf_counter() - began
+            self.stdout.write(f'{"materialized":<14}{len(loaded):>10}{len(loaded) / elapsed:>10.0f}{"":>16}'
+                              f'{rss_mb() - baseline:>9.1f}')
+            del loaded
+
+        if failed:
+            raise CommandError('; '.join(failed))
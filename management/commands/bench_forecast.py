@@ -0,0 +1,105 @@
+from datetime import timedelta
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from waste.benchmark.sandbox import sandbox
+from waste.forecast import cached_forecast, fit_fill_rates, forecast_municipality, hours_to_full
+from waste.models import BinLevelRollup, Municipality, SmartBin
+
+
+class Command(BaseCommand):
+    help = ('Time the vectorized fill-rate fit against a per-bin loop, then the whole forecast including '
+            'the database fetch, cold and cached')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=100000)
+        parser.add_argument('--hours', type=int, default=72)
+        parser.add_argument('--loop-sample', type=int, default=2000,
+                            help='bins fitted one by one to extrapolate the loop time')
+        parser.add_argument('--db-bins', type=int, default=10000,
+                            help='bins whose hourly rollups are loaded to time the fetch (0 to skip)')
+
+    def handle(self, *args, **options):
+        n_bins, n_hours = options['bins'], options['hours']
+        rng = np.random.default_rng(0)
+
+        # Linear fill with noise; a third of the bins get emptied mid-window
+        rates = rng.uniform(0.2, 3.0, n_bins)
+        hours = np.tile(np.arange(n_hours, dtype=np.float64), n_bins)
+        bin_idx = np.repeat(np.arange(n_bins), n_hours)
+        emptied_at = np.where(rng.random(n_bins) < 0.33, rng.integers(1, n_hours, n_bins), 0)
+        since_empty = hours - emptied_at[bin_idx]
+        since_empty[since_empty < 0] += emptied_at[bin_idx][since_empty < 0]
+        levels = np.clip(rates[bin_idx] * since_empty + rng.normal(0, 1, len(hours)), 0, 100)
+        current = levels.reshape(n_bins, n_hours)[:, -1]
+
+        start = time.perf_counter()
+        fitted = fit_fill_rates(bin_idx, hours, levels, n_bins)
+        remaining = hours_to_full(current, fitted)
+        vectorized = time.perf_counter() - start
+
+        sample = min(options['loop_sample'], n_bins)
+        start = time.perf_counter()
+        for i in range(sample):
+            x = hours[i * n_hours:(i + 1) * n_hours]
+            y = levels[i * n_hours:(i + 1) * n_hours]
+            keep = x >= emptied_at[i]
+            if keep.sum() >= 2:
+                np.polyfit(x[keep], y[keep], 1)
+        loop = (time.perf_counter() - start) * n_bins / sample
+
+        unsaturated = current < 95
+        error = np.median(np.abs(fitted[unsaturated] - rates[unsaturated]))
+        predicted = np.isfinite(remaining).sum()
+        self.stdout.write(f'samples:            {len(hours):,} ({n_bins:,} bins x {n_hours} h)')
+        self.stdout.write(f'vectorized fit:     {vectorized:.2f}s')
+        self.stdout.write(f'per-bin polyfit:    {loop:.2f}s (extrapolated from {sample} bins)')
+        self.stdout.write(f'speedup:            {loop / vectorized:.0f}x')
+        self.stdout.write(f'median rate error:  {error:.3f} level/h')
+        self.stdout.write(f'bins with forecast: {predicted:,}')
+
+        db_bins = min(options['db_bins'], n_bins)
+        if db_bins:
+            with sandbox():
+                self.run_db(db_bins, n_hours, levels, current)
+
+    def run_db(self, n_bins, n_hours, levels, current):
+        """Load ``n_bins`` bins of hourly rollups and time the full forecast."""
+        start = time.perf_counter()
+        municipality = Municipality.objects.create(
+            user=User.objects.create(username='forecastbench_municipality'), name='Forecast bench',
+            area='Ward', phone='0', address='Depot',
+        )
+        SmartBin.objects.bulk_create(
+            (SmartBin(bin_id=f'forecastbench_{i}', municipality=municipality, current_level=int(current[i]))
+             for i in range(n_bins)),
+            batch_size=1000,
+        )
+        pks = list(SmartBin.objects.filter(municipality=municipality).order_by('id').values_list('id', flat=True))
+        now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        first = now - timedelta(hours=n_hours - 1)
+        BinLevelRollup.objects.bulk_create(
+            (
+                BinLevelRollup(bin_id=pk, municipality=municipality, resolution=3600, bucket=first + timedelta(hours=h),
+                               min_level=level, max_level=level, level_sum=level, sample_count=1)
+                for i, pk in enumerate(pks)
+                for h in range(n_hours)
+                for level in [int(levels[i * n_hours + h])]
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f'\nloaded {n_bins * n_hours:,} rollups ({n_bins:,} bins) in {time.perf_counter() - start:.0f}s')
+
+        start = time.perf_counter()
+        forecast_municipality(municipality, now=now)
+        cold = time.perf_counter() - start
+        cached_forecast(municipality, now=now)
+        start = time.perf_counter()
+        cached_forecast(municipality, now=now)
+        cached = time.perf_counter() - start
+        self.stdout.write(f'fetch + fit:        {cold:.2f}s ({cold / n_bins * 1e6:.0f} us/bin)')
+        self.stdout.write(f'cached forecast:    {cached * 1000:.1f}ms')
@@ -0,0 +1,165 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from waste.benchmark.sandbox import sandbox
+from waste.models import (
+    CollectionAgent, Customer, Municipality, Recycler, RecyclerBooking, SmartBin, WasteCollection,
+)
+
+INDEXED_MODELS = [Customer, CollectionAgent, Recycler, SmartBin, WasteCollection, RecyclerBooking]
+
+
+def seed(municipalities, customers_per, collections_per):
+    rng = random.Random(0)
+    batch = 2000
+    tag = 'idxbench'
+    n_customers = municipalities * customers_per
+    n_agents = max(1, n_customers // 100)
+
+    User.objects.bulk_create(
+        (User(username=f'{tag}_{kind}{i}') for kind, n in
+         (('m', municipalities), ('c', n_customers), ('a', n_agents), ('r', n_agents))
+         for i in range(n)),
+        batch_size=batch,
+    )
+    user_ids = {
+        kind: list(User.objects.filter(username__startswith=f'{tag}_{kind}').order_by('id').values_list('id', flat=True))
+        for kind in 'mcar'
+    }
+
+    Municipality.objects.bulk_create(
+        Municipality(user_id=u, name=f'M{u}', area='a', phone='0', address='a') for u in user_ids['m']
+    )
+    muni_ids = list(Municipality.objects.filter(user_id__in=user_ids['m']).values_list('id', flat=True))
+
+    Customer.objects.bulk_create(
+        (Customer(user_id=u, municipality_id=muni_ids[i % municipalities], phone='0', address='a',
+                  is_approved=rng.random() > 0.02)
+         for i, u in enumerate(user_ids['c'])),
+        batch_size=batch,
+    )
+    CollectionAgent.objects.bulk_create(
+        (CollectionAgent(user_id=u, municipality_id=muni_ids[i % municipalities], phone='0', address='a',
+                         vehicle_number='V', is_approved=rng.random() > 0.05)
+         for i, u in enumerate(user_ids['a'])),
+        batch_size=batch,
+    )
+    Recycler.objects.bulk_create(
+        (Recycler(user_id=u, municipality_id=muni_ids[i % municipalities], company_name='R', phone='0',
+                  address='a', is_approved=rng.random() > 0.05)
+         for i, u in enumerate(user_ids['r'])),
+        batch_size=batch,
+    )
+    customers = list(Customer.objects.filter(user_id__in=user_ids['c']).values_list('id', 'municipality_id'))
+    agents = list(CollectionAgent.objects.filter(user_id__in=user_ids['a']).values_list('id', flat=True))
+    recyclers = list(Recycler.objects.filter(user_id__in=user_ids['r']).values_list('id', flat=True))
+
+    SmartBin.objects.bulk_create(
+        (SmartBin(bin_id=f'{tag}{c}', customer_id=c, municipality_id=m, current_level=rng.randint(0, 100),
+                  is_full=rng.random() < 0.03)
+         for c, m in customers),
+        batch_size=batch,
+    )
+    bins = dict(SmartBin.objects.filter(bin_id__startswith=tag).values_list('customer_id', 'id'))
+
+    statuses = ['verified'] * 90 + ['collected'] * 4 + ['assigned'] * 4 + ['pending'] * 2
+    WasteCollection.objects.bulk_create(
+        (WasteCollection(customer_id=c, bin_id=bins[c], municipality_id=m,
+                         collection_agent_id=rng.choice(agents), collection_date='2024-01-01',
+                         status=rng.choice(statuses), amount=50)
+         for c, m in customers for _ in range(collections_per)),
+        batch_size=batch,
+    )
+    RecyclerBooking.objects.bulk_create(
+        (RecyclerBooking(customer_id=c, recycler_id=rng.choice(recyclers), collection_agent_id=rng.choice(agents),
+                         waste_type_id='plastic', weight=1, amount=20, collection_date='2024-01-01',
+                         status=rng.choice(['pending', 'assigned', 'collected', 'collected']))
+         for c, _ in customers[::2]),
+        batch_size=batch,
+    )
+    return muni_ids[0], customers[0][0], agents[0], recyclers[0]
+
+
+def dashboard_queries(municipality, customer, agent, recycler):
+    """The hot dashboard querysets, as built in views.py."""
+    return {
+        'full bins': SmartBin.objects.filter(municipality_id=municipality, is_full=True, customer__isnull=False).order_by('id')[:50],
+        'pending customers': Customer.objects.filter(municipality_id=municipality, is_approved=False).order_by('id')[:50],
+        'pending agents': CollectionAgent.objects.filter(municipality_id=municipality, is_approved=False).order_by('id')[:50],
+        'approved agents': CollectionAgent.objects.filter(municipality_id=municipality, is_approved=True),
+        'pending collections': WasteCollection.objects.filter(municipality_id=municipality, status='pending').order_by('id')[:50],
+        'agent tasks': WasteCollection.objects.filter(
+            collection_agent_id=agent, status__in=['assigned', 'collected']).order_by('collection_date'),
+        'recycler pending': RecyclerBooking.objects.filter(recycler_id=recycler, status='pending').order_by('id')[:50],
+        'customer recent': WasteCollection.objects.filter(customer_id=customer).order_by('-created_at')[:5],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic data and compare dashboard query plans with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--municipalities', type=int, default=20)
+        parser.add_argument('--customers', type=int, default=2500, help='customers per municipality')
+        parser.add_argument('--collections', type=int, default=5, help='collections per customer')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--plans', action='store_true', help='print full EXPLAIN output')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'mysql':
+            self.stderr.write('MySQL commits DDL implicitly; run this against a scratch database.')
+        # SQLite can only run the schema editor inside a transaction with
+        # foreign key checks off, and they can't be toggled mid-transaction
+        connection.disable_constraint_checking()
+        try:
+            with sandbox():
+                self.run(options)
+        finally:
+            connection.enable_constraint_checking()
+
+    def run(self, options):
+        start = time.perf_counter()
+        ids = seed(options['municipalities'], options['customers'], options['collections'])
+        self.stdout.write(f'seeded in {time.perf_counter() - start:.1f}s')
+        self.analyze()
+
+        indexes = [(model, index) for model in INDEXED_MODELS for index in model._meta.indexes]
+        with connection.schema_editor(atomic=False) as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        self.analyze()
+        before = self.measure(ids, options)
+
+        with connection.schema_editor(atomic=False) as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+        self.analyze()
+        after = self.measure(ids, options)
+
+        self.stdout.write(f'\n{"query":<22}{"without":>12}{"with":>12}')
+        for name in before:
+            (ms_before, plan_before), (ms_after, plan_after) = before[name], after[name]
+            self.stdout.write(f'{name:<22}{ms_before:>10.2f}ms{ms_after:>10.2f}ms')
+            for label, plan in (('without', plan_before), ('with', plan_after)):
+                lines = plan.splitlines() if options['plans'] else plan.splitlines()[:1]
+                for line in lines:
+                    self.stdout.write(f'    {label:<8} {line}')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            if connection.vendor in ('sqlite', 'postgresql'):
+                cursor.execute('ANALYZE')
+
+    def measure(self, ids, options):
+        results = {}
+        for name, queryset in dashboard_queries(*ids).items():
+            plan = queryset.explain()
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            results[name] = ((time.perf_counter() - start) / options['repeat'] * 1000, plan)
+        return results
@@ -0,0 +1,55 @@
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from waste.benchmark.sandbox import sandbox
+from waste.models import Municipality, SmartBin
+
+
+class Command(BaseCommand):
+    help = 'Compare readings/sec of the single-reading and batch bin update APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with sandbox():
+            self.run(options['bins'], options['batch_size'])
+
+    def run(self, n_bins, batch_size):
+        user = User.objects.create_user(username='bench_municipality')
+        municipality = Municipality.objects.create(
+            user=user, name='Bench', area='Bench', phone='0', address='Bench'
+        )
+        SmartBin.objects.bulk_create(
+            SmartBin(bin_id=f'BENCH{i:06d}', municipality=municipality) for i in range(n_bins)
+        )
+        readings = [
+            {'bin_id': f'BENCH{i:06d}', 'level': random.randint(0, 100)} for i in range(n_bins)
+        ]
+        client = Client()
+
+        start = time.perf_counter()
+        for reading in readings:
+            client.post(reverse('update_bin_status'), json.dumps(reading), content_type='application/json')
+        single = n_bins / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, n_bins, batch_size):
+            client.post(
+                reverse('update_bin_status_batch'),
+                json.dumps(readings[i:i + batch_size]),
+                content_type='application/json',
+            )
+        batch = n_bins / (time.perf_counter() - start)
+
+        self.stdout.write(f'bins:          {n_bins}')
+        self.stdout.write(f'single:        {single:10.0f} readings/sec')
+        self.stdout.write(f'batch ({batch_size:>4}): {batch:10.0f} readings/sec')
+        self.stdout.write(f'speedup:       {batch / single:10.1f}x')
@@ -0,0 +1,83 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from waste import metrics
+from waste.benchmark.report import percentile
+from waste.benchmark.sandbox import sandbox
+from waste.models import SmartBin
+
+from .bench_dashboards import seed
+
+MIDDLEWARE = 'waste.metrics.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of MetricsMiddleware on the IoT endpoint and the dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=100, help='rows in each dashboard list')
+        parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and mode')
+
+    def handle(self, *args, **options):
+        # Keep the slow log quiet: it is measured, not read
+        logging.getLogger(metrics.__name__).setLevel(logging.ERROR)
+        with sandbox():
+            self.run(options)
+
+    def run(self, options):
+        logins = seed(options['scale'], 'metricsbench_')
+        bin_id = SmartBin.objects.filter(bin_id__startswith='metricsbench_').values_list('bin_id', flat=True)[0]
+        without = [m for m in settings.MIDDLEWARE if m != MIDDLEWARE]
+        with override_settings(MIDDLEWARE=without):
+            plain = self.clients(logins)
+        with override_settings(MIDDLEWARE=[MIDDLEWARE] + without):
+            metered = self.clients(logins)
+
+        self.stdout.write(f'{options["requests"]} requests per endpoint and mode, alternating')
+        self.stdout.write(f'{"":<24}{"off p50":>10}{"p99":>10}{"on p50":>10}{"p99":>10}{"overhead":>10}')
+        for name in plain:
+            path = reverse(name)
+            if name == 'update_bin_status':
+                def send(client, n):
+                    client.post(path, json.dumps({'bin_id': bin_id, 'level': n % 100}),
+                                content_type='application/json')
+            else:
+                def send(client, n):
+                    client.get(path)
+            off, on = [], []
+            # Alternate the two modes so drift in the database hits both alike
+            for n in range(options['requests'] + 1):
+                for client, samples in ((plain[name], off), (metered[name], on)):
+                    start = time.perf_counter()
+                    send(client, n)
+                    if n:  # the first request warms up
+                        samples.append(time.perf_counter() - start)
+            # Medians: garbage collection pauses swamp a difference of means
+            self.stdout.write(
+                f'{name:<24}{percentile(off, 0.5):>8.2f}ms{percentile(off, 0.99):>8.2f}ms'
+                f'{percentile(on, 0.5):>8.2f}ms{percentile(on, 0.99):>8.2f}ms'
+                f'{(percentile(on, 0.5) - percentile(off, 0.5)) * 1000:>8.0f}us'
+            )
+
+    def clients(self, logins):
+        # A Client builds its middleware chain from the settings on its first request
+        clients = {'update_bin_status': Client()}
+        clients['update_bin_status'].get(reverse('home'))
+        for name, user in logins.items():
+            try:
+                get_template(f'{name}.html')
+            except TemplateDoesNotExist:
+                continue
+            clients[name] = Client()
+            clients[name].force_login(user)
+            clients[name].get(reverse(name))
+        return clients
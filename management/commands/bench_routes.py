@@ -0,0 +1,37 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from waste.routing import plan_routes
+
+
+class Command(BaseCommand):
+    help = 'Time route planning for many bins and agents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=5000)
+        parser.add_argument('--agents', type=int, default=50)
+        parser.add_argument('--capacity', type=int, default=120)
+        parser.add_argument('--radius-km', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        depot = (12.97, 77.59)
+        deg = options['radius_km'] / 111.0
+        stops = [
+            (i, depot[0] + rng.uniform(-deg, deg), depot[1] + rng.uniform(-deg, deg))
+            for i in range(options['bins'])
+        ]
+        agents = [(a, options['capacity']) for a in range(options['agents'])]
+
+        start = time.perf_counter()
+        routes, unassigned = plan_routes(stops, agents, depot)
+        elapsed = time.perf_counter() - start
+
+        lengths = [route.distance_km for route in routes]
+        self.stdout.write(f'bins/agents:    {options["bins"]} / {options["agents"]}')
+        self.stdout.write(f'solve time:     {elapsed:.2f}s')
+        self.stdout.write(f'assigned:       {sum(len(r.stops) for r in routes)} ({len(unassigned)} unassigned)')
+        self.stdout.write(f'total distance: {sum(lengths):.1f} km '
+                          f'(route min {min(lengths):.1f} / max {max(lengths):.1f} km)')
@@ -0,0 +1,112 @@
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from waste.benchmark.report import percentile
+from waste.spatial import SpatialIndex
+
+# Roughly Bengaluru
+ORIGIN = (12.97, 77.59)
+
+
+def scan_nearest(index, points, ids, lat, lon, k):
+    x, y = index._point(lat, lon)
+    ranked = sorted((math.hypot(px - x, py - y), i) for i, (px, py) in enumerate(points))
+    return [(ids[i], d) for d, i in ranked[:k]]
+
+
+def scan_within(index, lat, lon, radius_km):
+    x, y = index._point(lat, lon)
+    found = []
+    for i, (px, py) in enumerate(index.bin_points):
+        d = math.hypot(px - x, py - y)
+        if d <= radius_km:
+            found.append((d, i))
+    found.sort()
+    return [(index.bin_ids[i], d) for d, i in found]
+
+
+def ids(rows):
+    return [row['bins'] if isinstance(row, dict) else row[0] for row in rows]
+
+
+def scan_clusters(index, full, cell_km):
+    # Find the full bins by reading every bin, as a query without the index would
+    return index._cluster([i for i, bin_id in enumerate(index.bin_ids) if bin_id in full], cell_km)
+
+
+class Command(BaseCommand):
+    help = 'Compare grid-indexed nearest-agent, radius and full-bin cluster queries with a linear scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=100000)
+        parser.add_argument('--agents', type=int, default=200)
+        parser.add_argument('--km', type=float, default=30, help='side of the square the city covers')
+        parser.add_argument('--full', type=float, default=0.05, help='fraction of bins that are full')
+        parser.add_argument('--radius', type=float, default=0.5, help='km, for bins within radius')
+        parser.add_argument('--cluster-km', type=float, default=1.0)
+        parser.add_argument('--queries', type=int, default=200, help='per query type and method')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        half_lat = options['km'] / 2 / 110.574
+        half_lon = options['km'] / 2 / (111.320 * math.cos(math.radians(ORIGIN[0])))
+
+        def position():
+            return ORIGIN[0] + rng.uniform(-half_lat, half_lat), ORIGIN[1] + rng.uniform(-half_lon, half_lon)
+
+        bins = [(i, *position()) for i in range(options['bins'])]
+        agents = [(i, *position()) for i in range(options['agents'])]
+        full = [row[0] for row in bins if rng.random() < options['full']]
+
+        start = time.perf_counter()
+        index = SpatialIndex(bins, agents, full, ref_lat=ORIGIN[0])
+        self.stdout.write(f'{len(bins)} bins ({len(full)} full), {len(agents)} agents over '
+                          f'{options["km"]:g}x{options["km"]:g} km; index built in '
+                          f'{(time.perf_counter() - start) * 1000:.0f} ms')
+
+        probes = [position() for _ in range(options['queries'])]
+        radius, cell_km = options['radius'], options['cluster_km']
+        agent_points = [index.agents.points[i] for i in range(len(index.agent_ids))]
+        cases = [
+            ('nearest 5 agents', lambda p: index.nearest_agents(*p, 5),
+             lambda p: scan_nearest(index, agent_points, index.agent_ids, *p, 5)),
+            # A bin far outside the area the agents cover
+            ('  from 50 km away', lambda p: index.nearest_agents(p[0] + 0.45, p[1], 5),
+             lambda p: scan_nearest(index, agent_points, index.agent_ids, p[0] + 0.45, p[1], 5)),
+            (f'bins within {radius:g} km', lambda p: index.bins_within(*p, radius),
+             lambda p: scan_within(index, *p, radius)),
+            (f'full clusters, {cell_km:g} km', lambda p: index.full_clusters(cell_km),
+             lambda p: scan_clusters(index, index.full, cell_km)),
+            # The first call after each refresh of the full flags
+            ('  after a refresh', lambda p: index.set_full(index.full) or index.full_clusters(cell_km),
+             lambda p: scan_clusters(index, index.full, cell_km)),
+        ]
+
+        self.stdout.write(f'{"":<24}{"index p50":>11}{"p99":>10}{"scan p50":>11}{"p99":>10}{"speedup":>9}')
+        for name, indexed, scan in cases:
+            # Full scans are slow, so time fewer of them
+            scan_probes = probes[:max(5, len(probes) // 20)]
+            fast = self.time(indexed, probes)
+            slow = self.time(scan, scan_probes)
+            for probe in scan_probes[:5]:
+                if ids(indexed(probe)) != ids(scan(probe)):
+                    self.stdout.write(self.style.WARNING(f'{name}: results differ at {probe}'))
+            fast_p50, fast_p99, slow_p50, slow_p99 = (
+                percentile(samples, p) * 1000 for samples in (fast, slow) for p in (0.5, 0.99)
+            )
+            self.stdout.write(
+                f'{name:<24}{fast_p50:>9.0f}us{fast_p99:>8.0f}us{slow_p50:>9.0f}us{slow_p99:>8.0f}us'
+                f'{slow_p50 / max(fast_p50, 1e-3):>8.0f}x'
+            )
+
+    def time(self, query, probes):
+        samples = []
+        for probe in probes:
+            start = time.perf_counter()
+            query(probe)
+            samples.append(time.perf_counter() - start)
+        return samples
@@ -0,0 +1,149 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+from waste.events import stream_path
+from waste.models import SmartBin
+
+from .loadtest_ingest import post_json
+
+
+def login_session(user):
+    """Create a database session logged in as ``user`` and return its key."""
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+async def read_events(reader):
+    """Yield ``(event, data)`` pairs from a chunked ``text/event-stream`` body."""
+    buffer = b''
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            return
+        buffer += await reader.readexactly(size)
+        await reader.readexactly(2)
+        while b'\n\n' in buffer:
+            block, buffer = buffer.split(b'\n\n', 1)
+            event, data = 'message', ''
+            for line in block.decode().splitlines():
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data = line[5:].strip()
+            if data:
+                yield event, data
+
+
+class Command(BaseCommand):
+    help = 'Hold N full-bin event streams open against a running ASGI server and time event delivery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--clients', type=int, default=500, help='concurrent event streams')
+        parser.add_argument('--events', type=int, default=20, help='is_full flips to trigger')
+        parser.add_argument('--interval', type=float, default=0.25, help='seconds between flips')
+        parser.add_argument('--bin', help='bin_id to flip (defaults to the first linked bin)')
+
+    def handle(self, *args, **options):
+        bins = SmartBin.objects.filter(customer__isnull=False).select_related('municipality__user')
+        bin = bins.filter(bin_id=options['bin']).first() if options['bin'] else bins.first()
+        if bin is None:
+            raise CommandError('Need a SmartBin linked to a customer')
+        cookie = f'{settings.SESSION_COOKIE_NAME}={login_session(bin.municipality.user)}'
+
+        url = urlsplit(options['url'])
+        path = stream_path()
+        host, port = url.hostname, url.port or 80
+        clients = options['clients']
+        arrivals = [[] for _ in range(clients)]
+        sent = []
+
+        async def subscriber(n, ready):
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                writer.write(
+                    f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\n'
+                    f'Cookie: {cookie}\r\nAccept: text/event-stream\r\n\r\n'.encode()
+                )
+                await writer.drain()
+                status = int((await reader.readline()).split()[1])
+                if status != 200:
+                    raise CommandError(f'Event stream returned {status}')
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                async for event, _ in read_events(reader):
+                    if event == 'snapshot':
+                        ready.release()
+                    else:
+                        arrivals[n].append(time.perf_counter())
+                        if len(arrivals[n]) == options['events']:
+                            return
+            finally:
+                writer.close()
+
+        async def run():
+            path = '/api/bin/update/batch/'
+            reader, writer = await asyncio.open_connection(host, port)
+            # Start from an empty bin so the first reading is a flip
+            await post_json(reader, writer, url.netloc, path, [{'bin_id': bin.bin_id, 'level': 0}])
+            writer.close()
+
+            ready = asyncio.Semaphore(0)
+            start = time.perf_counter()
+            tasks = [asyncio.ensure_future(subscriber(n, ready)) for n in range(clients)]
+            acquired = 0
+            try:
+                while acquired < clients:
+                    await asyncio.wait_for(ready.acquire(), timeout=30)
+                    acquired += 1
+            except asyncio.TimeoutError:
+                pass
+            connect_time = time.perf_counter() - start
+
+            reader, writer = await asyncio.open_connection(host, port)
+            for k in range(options['events']):
+                level = 90 if k % 2 == 0 else 10
+                sent.append(time.perf_counter())
+                await post_json(reader, writer, url.netloc, path, [{'bin_id': bin.bin_id, 'level': level}])
+                await asyncio.sleep(options['interval'])
+            writer.close()
+
+            done, pending = await asyncio.wait(tasks, timeout=10)
+            for task in pending:
+                task.cancel()
+            failed = sum(1 for t in done if t.exception() is not None)
+            return acquired, failed, connect_time
+
+        acquired, failed, connect_time = asyncio.run(run())
+
+        latencies = []
+        spreads = []
+        for k, sent_at in enumerate(sent):
+            received = [a[k] for a in arrivals if len(a) > k]
+            latencies.extend(t - sent_at for t in received)
+            if received:
+                spreads.append(max(received) - min(received))
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        expected = acquired * len(sent)
+
+        self.stdout.write(f'clients:     {acquired}/{clients} connected in {connect_time:.2f}s '
+                          f'({failed} failed)')
+        self.stdout.write(f'events:      {len(latencies)}/{expected} delivered for {len(sent)} flips of {bin.bin_id}')
+        if latencies:
+            self.stdout.write(f'latency ms:  mean {statistics.mean(latencies) * 1000:.1f}  '
+                              f'p50 {pct(0.50):.1f}  p95 {pct(0.95):.1f}  p99 {pct(0.99):.1f}  '
+                              f'max {latencies[-1] * 1000:.1f}')
+            self.stdout.write(f'fan-out ms:  mean {statistics.mean(spreads) * 1000:.1f} '
+                              f'(first to last client per event)')
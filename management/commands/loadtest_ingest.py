@@ -0,0 +1,106 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from waste.models import Municipality, SmartBin
+
+
+async def post(reader, writer, host, path, body, content_type):
+    """POST ``body`` on a keep-alive connection and return ``(status, headers)``."""
+    writer.write(
+        (
+            f'POST {path} HTTP/1.1\r\n'
+            f'Host: {host}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: keep-alive\r\n\r\n'
+        ).encode() + body
+    )
+    await writer.drain()
+
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' not in headers.get('transfer-encoding', '').lower():
+        await reader.readexactly(int(headers.get('content-length', 0)))
+        return status, headers
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        await reader.readexactly(size + 2)
+        if size == 0:
+            return status, headers
+
+
+async def post_json(reader, writer, host, path, payload):
+    status, _ = await post(reader, writer, host, path, json.dumps(payload).encode(), 'application/json')
+    return status
+
+
+class Command(BaseCommand):
+    help = 'Simulate N bins reporting concurrently against a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/bin/update/async/')
+        parser.add_argument('--bins', type=int, default=1000, help='concurrent connections')
+        parser.add_argument('--readings', type=int, default=10, help='readings per bin')
+        parser.add_argument('--seed', action='store_true',
+                            help='create the LOAD* bins under the first municipality first')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            municipality = Municipality.objects.first()
+            if municipality is None:
+                raise CommandError('Create a Municipality before seeding bins')
+            SmartBin.objects.bulk_create(
+                [SmartBin(bin_id=f'LOAD{i:06d}', municipality=municipality)
+                 for i in range(options['bins'])],
+                ignore_conflicts=True,
+            )
+
+        url = urlsplit(options['url'])
+        statuses = {}
+        latencies = []
+
+        async def bin_session(n):
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            try:
+                for _ in range(options['readings']):
+                    reading = {'bin_id': f'LOAD{n:06d}', 'level': random.randint(0, 100)}
+                    start = time.perf_counter()
+                    status = await post_json(reader, writer, url.netloc, url.path, reading)
+                    latencies.append(time.perf_counter() - start)
+                    statuses[status] = statuses.get(status, 0) + 1
+            finally:
+                writer.close()
+
+        async def run():
+            results = await asyncio.gather(
+                *(bin_session(n) for n in range(options['bins'])), return_exceptions=True
+            )
+            return sum(1 for r in results if isinstance(r, Exception))
+
+        start = time.perf_counter()
+        failed = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        self.stdout.write(f'bins:        {options["bins"]} ({failed} connection failures)')
+        self.stdout.write(f'requests:    {len(latencies)} in {elapsed:.2f}s '
+                          f'({len(latencies) / elapsed:.0f} req/sec)')
+        self.stdout.write(f'status:      {statuses}')
+        if latencies:
+            self.stdout.write(f'latency ms:  mean {statistics.mean(latencies) * 1000:.1f}  '
+                              f'p50 {pct(0.50):.1f}  p95 {pct(0.95):.1f}  p99 {pct(0.99):.1f}')
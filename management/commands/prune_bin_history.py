@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from waste.history import apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Delete bin fill-level history older than SMARTBIN_HISTORY retention'
+
+    def handle(self, *args, **options):
+        for name, count in apply_retention().items():
+            label = 'raw days' if name == 'raw' else f'{name}s rollups'
+            self.stdout.write(f'{label}: {count} rows deleted')
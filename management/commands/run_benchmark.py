@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from waste.benchmark import data, fleet, sessions
+from waste.benchmark.report import Recorder
+from waste.urls import urlpatterns
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic dataset, replay a bin fleet against /api/bin/update/ and run scripted '
+            'role sessions over every URL, then report throughput, p50/p95/p99 and queries per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--municipalities', type=int, default=2)
+        parser.add_argument('--customers', type=int, default=200, help='per municipality, one bin each')
+        parser.add_argument('--agents', type=int, default=10, help='per municipality')
+        parser.add_argument('--recyclers', type=int, default=3, help='per municipality')
+        parser.add_argument('--collections', type=int, default=3, help='per customer')
+        parser.add_argument('--readings', type=int, default=2000, help='fleet readings to replay')
+        parser.add_argument('--sessions', type=int, default=20, help='scripted sessions per role')
+        parser.add_argument('--workers', type=int, default=1, help='threads sending requests at once')
+        parser.add_argument('--random-seed', type=int, help='make the dataset and sessions repeatable')
+        parser.add_argument('--keep', action='store_true', help="don't delete the generated data afterwards")
+
+    def handle(self, *args, **options):
+        # Lets the test Client run in a management command
+        setup_test_environment()
+        rng = random.Random(options['random_seed'])
+        self.workers = options['workers']
+        data.cleanup()
+        start = time.perf_counter()
+        dataset = data.generate(
+            options['municipalities'], options['customers'], options['agents'], options['recyclers'],
+            options['collections'], rng=rng,
+        )
+        self.stdout.write(
+            f'generated {len(dataset["municipalities"])} municipalities, '
+            f'{len(dataset["customers"]) + len(dataset["pending_customers"])} customers, '
+            f'{len(dataset["agents"])} agents, {len(dataset["recyclers"])} recyclers, '
+            f'{len(dataset["bins"]) + len(dataset["unlinked_bins"])} bins in {time.perf_counter() - start:.1f}s'
+        )
+        try:
+            requested = set(self.run_fleet(dataset, rng, options).samples)
+            requested |= set(self.run_sessions(dataset, rng, options).samples)
+        finally:
+            if not options['keep']:
+                data.cleanup()
+        self.report_coverage(requested)
+
+    def run_workers(self, work):
+        """Run ``work(n)`` on ``--workers`` threads, each with its own database connection."""
+        def target(n):
+            try:
+                work(n)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target, args=(n,)) for n in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_fleet(self, dataset, rng, options):
+        bins = [fleet.VirtualBin(bin.bin_id, bin.current_level, random.Random(rng.random()))
+                for bin in dataset['bins']]
+        recorder = Recorder()
+
+        def work(n):
+            share = bins[n::self.workers]
+            if share:
+                fleet.replay(recorder, Client(), share, options['readings'] // self.workers)
+
+        self.run_workers(work)
+        recorder.write(self.stdout, f'fleet, {len(bins)} bins')
+        return recorder
+
+    def run_sessions(self, dataset, rng, options):
+        recorder = Recorder()
+        scripts = [role for role in sessions.ROLES.values() for _ in range(options['sessions'])]
+        rng.shuffle(scripts)
+        seeds = [rng.random() for _ in scripts]
+
+        def work(n):
+            for script, seed in list(zip(scripts, seeds))[n::self.workers]:
+                script(recorder, dataset, random.Random(seed))
+
+        self.run_workers(work)
+        recorder.write(self.stdout, f'sessions, {options["sessions"]} per role')
+        return recorder
+
+    def report_coverage(self, requested):
+        missed = {pattern.name for pattern in urlpatterns} - requested - set(sessions.SKIPPED)
+        self.stdout.write('')
+        for name, reason in sessions.SKIPPED.items():
+            self.stdout.write(f'not requested: {name} ({reason})')
+        if missed:
+            self.stdout.write(f'not covered: {", ".join(sorted(missed))}')
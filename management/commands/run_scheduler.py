@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from waste import scheduler
+
+
+class Command(BaseCommand):
+    help = ('Periodically create and assign collection tasks for full bins, balancing open tasks across '
+            'agents. Run several processes to share the work (PostgreSQL/MySQL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='seconds between passes (default SMARTBIN_SCHEDULER)')
+        parser.add_argument('--once', action='store_true', help='run a single pass and exit')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or getattr(settings, 'SMARTBIN_SCHEDULER', {}).get(
+            'INTERVAL', scheduler.DEFAULTS['INTERVAL'])
+        while True:
+            start = time.monotonic()
+            try:
+                summary = scheduler.run_once()
+            finally:
+                close_old_connections()
+            if summary['due'] or options['once']:
+                self.stdout.write(
+                    f'{summary["assigned"]} of {summary["due"]} due bins assigned in '
+                    f'{summary["municipalities"]} municipalities ({summary["skipped_locked"]} held by another '
+                    f'worker) in {(time.monotonic() - start) * 1000:.0f} ms'
+                )
+            if options['once']:
+                return
+            time.sleep(max(0, interval - (time.monotonic() - start)))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from waste.wallet import settle_credits
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded municipality credits into Municipality.wallet_balance'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{settle_credits()} municipalities settled')
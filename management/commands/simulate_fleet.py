@@ -0,0 +1,277 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from waste import codec
+from waste.models import Municipality, SmartBin
+
+from .loadtest_ingest import post
+
+# Firmware timings in seconds, as in NodeMCU.ino
+SAMPLE_INTERVAL = 5
+UPDATE_INTERVAL = 60        # old firmware: one reading a minute
+LEVEL_DELTA = 5
+FULL_LEVEL = 75
+HEARTBEAT_INTERVAL = 900
+FLUSH_INTERVAL = 60
+BATCH_SIZE = 16
+RING_SIZE = 192
+BACKOFF_MIN = 2
+BACKOFF_MAX = 300
+RECONNECT_SPREAD = 30
+
+NETWORK_ERRORS = (OSError, EOFError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+
+class Fleet:
+    """Shared simulated clock, network state and counters.
+
+    Simulated time runs ``speed`` times faster than the wall clock. The
+    network is down between ``outage_at`` and ``outage_at + outage``;
+    with ``power_cut`` every device also reboots when it comes back.
+    """
+
+    def __init__(self, options):
+        self.speed = options['speed']
+        self.duration = options['duration']
+        self.outage_at = options['outage_at']
+        self.restore_at = options['outage_at'] + options['outage']
+        self.power_cut = options['power_cut']
+        self.timeout = options['timeout']
+        url = urlsplit(options['url'])
+        self.host, self.port, self.netloc = url.hostname, url.port or 80, url.netloc
+        self.base = url.path.rstrip('/')
+        self.start = time.monotonic()
+        self.requests = {}      # wall second -> requests sent
+        self.latencies = []
+        self.statuses = {}
+        self.counters = {'connections': 0, 'failures': 0, 'generated': 0, 'delivered': 0, 'lost': 0, 'pending': 0}
+
+    def now(self):
+        return (time.monotonic() - self.start) * self.speed
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(max(seconds, 0) / self.speed)
+
+    async def sleep_until(self, t):
+        await self.sleep(t - self.now())
+
+    def online(self):
+        return not self.outage_at <= self.now() < self.restore_at
+
+    async def connect(self):
+        self.counters['connections'] += 1
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def send(self, reader, writer, path, readings):
+        """POST ``readings`` in the binary format; returns ``(status, headers)``."""
+        second = int(time.monotonic() - self.start)
+        self.requests[second] = self.requests.get(second, 0) + 1
+        start = time.perf_counter()
+        try:
+            status, headers = await asyncio.wait_for(
+                post(reader, writer, self.netloc, self.base + path, codec.encode_readings(readings),
+                     codec.CONTENT_TYPE),
+                self.timeout,
+            )
+        except NETWORK_ERRORS:
+            self.counters['failures'] += 1
+            raise
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 500 or status in (408, 429):
+            self.counters['failures'] += 1
+        return status, headers
+
+
+class Bin:
+    """A bin filling at a random rate and emptied once it reaches 100%."""
+
+    def __init__(self, n):
+        self.bin_id = f'SIM{n:06d}'
+        self.level = random.randint(0, 60)
+        self.rate = random.uniform(0.02, 0.1)   # percent per second
+
+    def measure(self):
+        self.level += self.rate * SAMPLE_INTERVAL * random.uniform(0.5, 1.5)
+        if self.level >= 100:
+            self.level = 0
+        return int(self.level)
+
+
+async def old_firmware(fleet, bin):
+    """The original firmware: one reading a minute on a new connection, dropped when offline."""
+    booted = fleet.now() - random.uniform(0, UPDATE_INTERVAL)   # bins were installed at different times
+    last_update = booted
+    rebooted = False
+    while fleet.now() < fleet.duration:
+        if fleet.power_cut and not rebooted and fleet.now() >= fleet.outage_at:
+            # Power is back everywhere at once; setup() waits for WiFi
+            await fleet.sleep_until(fleet.restore_at + random.uniform(1, 3))
+            booted = last_update = fleet.now()
+            rebooted = True
+        level = bin.measure()
+        if fleet.now() - last_update >= UPDATE_INTERVAL:
+            fleet.counters['generated'] += 1
+            last_update = fleet.now()
+            if not fleet.online():
+                fleet.counters['lost'] += 1
+            else:
+                try:
+                    reader, writer = await fleet.connect()
+                    try:
+                        status, _ = await fleet.send(reader, writer, '/api/bin/update/', [(bin.bin_id, level, 0)])
+                    finally:
+                        writer.close()
+                    fleet.counters['delivered' if status < 300 else 'lost'] += 1
+                except NETWORK_ERRORS:
+                    fleet.counters['lost'] += 1
+        await fleet.sleep(SAMPLE_INTERVAL)
+
+
+async def new_firmware(fleet, bin):
+    """Port of NodeMCU.ino: ring buffer, change/heartbeat queueing, batches on one connection, jittered backoff."""
+    ring = []
+    # Already running: the server has a recent level for this bin
+    last_queued_level = int(bin.level)
+    last_queued = fleet.now() - random.uniform(0, HEARTBEAT_INTERVAL)
+    next_attempt = 0
+    backoff = BACKOFF_MIN
+    urgent = False
+    was_connected = fleet.online()
+    connection = None
+    rebooted = False
+    next_sample = fleet.now() + random.uniform(0, SAMPLE_INTERVAL)
+
+    while fleet.now() < fleet.duration:
+        connected = fleet.online()
+        if fleet.power_cut and not rebooted and not connected:
+            # Power cut: RAM, and with it the ring buffer, is lost
+            fleet.counters['lost'] += len(ring)
+            await fleet.sleep_until(fleet.restore_at + random.uniform(1, 3))
+            ring, last_queued_level, urgent, backoff = [], None, False, BACKOFF_MIN
+            last_queued = next_sample = fleet.now()
+            rebooted, was_connected, connected = True, False, True
+        if connected and not was_connected:
+            next_attempt = fleet.now() + random.uniform(0, RECONNECT_SPREAD)
+        if not connected and connection is not None:
+            connection[1].close()
+            connection = None
+        was_connected = connected
+
+        if fleet.now() >= next_sample:
+            next_sample += SAMPLE_INTERVAL
+            level = bin.measure()
+            first = last_queued_level is None
+            crossed = not first and (level >= FULL_LEVEL) != (last_queued_level >= FULL_LEVEL)
+            moved = first or abs(level - last_queued_level) >= LEVEL_DELTA
+            if moved or crossed or fleet.now() - last_queued >= HEARTBEAT_INTERVAL:
+                fleet.counters['generated'] += 1
+                if len(ring) == RING_SIZE:
+                    ring.pop(0)
+                    fleet.counters['lost'] += 1
+                ring.append((level, fleet.now()))
+                urgent = urgent or crossed or first
+                last_queued_level, last_queued = level, fleet.now()
+
+        due = urgent or len(ring) >= BATCH_SIZE or (ring and fleet.now() - ring[0][1] >= FLUSH_INTERVAL)
+        if connected and due and fleet.now() >= next_attempt:
+            batch = ring[:BATCH_SIZE]
+            readings = [(bin.bin_id, level, time.time() - (fleet.now() - taken) / fleet.speed)
+                        for level, taken in batch]
+            retry_after = 0
+            try:
+                # HTTPClient reuses the connection until the server closes it
+                if connection is None or connection[0].at_eof():
+                    if connection is not None:
+                        connection[1].close()
+                    connection = await fleet.connect()
+                status, headers = await fleet.send(*connection, '/api/bin/update/batch/', readings)
+                retry = status >= 500 or status in (408, 429)
+                retry_after = int(headers.get('retry-after', 0) or 0)
+            except NETWORK_ERRORS:
+                if connection is not None:
+                    connection[1].close()
+                connection = None
+                retry = True
+            if not retry:
+                del ring[:len(batch)]
+                fleet.counters['delivered' if status < 300 else 'lost'] += len(batch)
+                urgent = False
+                backoff = BACKOFF_MIN
+            else:
+                wait = random.uniform(0, backoff)
+                if retry_after:
+                    wait = max(wait, retry_after + random.uniform(0, BACKOFF_MIN))
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                next_attempt = fleet.now() + wait
+            continue
+
+        await fleet.sleep(min(0.1 * fleet.speed, SAMPLE_INTERVAL))
+
+    if connection is not None:
+        connection[1].close()
+    fleet.counters['pending'] += len(ring)
+
+
+class Command(BaseCommand):
+    help = ('Simulate a fleet of bins through a network outage against a running server and compare '
+            'the request storm of the old and the store-and-forward firmware')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/')
+        parser.add_argument('--bins', type=int, default=500)
+        parser.add_argument('--firmware', choices=['old', 'new', 'both'], default='both')
+        parser.add_argument('--duration', type=float, default=360, help='simulated seconds')
+        parser.add_argument('--outage-at', type=float, default=120, help='simulated seconds')
+        parser.add_argument('--outage', type=float, default=60, help='simulated seconds without network')
+        parser.add_argument('--power-cut', action='store_true',
+                            help='bins also lose power during the outage and reboot together')
+        parser.add_argument('--speed', type=float, default=4, help='simulated seconds per wall second')
+        parser.add_argument('--timeout', type=float, default=10, help='request timeout in wall seconds')
+        parser.add_argument('--seed', action='store_true',
+                            help='create the SIM* bins under the first municipality first')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            municipality = Municipality.objects.first()
+            if municipality is None:
+                raise CommandError('Create a Municipality before seeding bins')
+            SmartBin.objects.bulk_create(
+                [SmartBin(bin_id=f'SIM{i:06d}', municipality=municipality) for i in range(options['bins'])],
+                ignore_conflicts=True,
+            )
+
+        firmwares = ['old', 'new'] if options['firmware'] == 'both' else [options['firmware']]
+        for name in firmwares:
+            fleet = Fleet(options)
+            device = old_firmware if name == 'old' else new_firmware
+            bins = [Bin(n) for n in range(options['bins'])]
+
+            async def run():
+                await asyncio.gather(*(device(fleet, bin) for bin in bins))
+
+            asyncio.run(run())
+            self.report(name, fleet, options)
+
+    def report(self, name, fleet, options):
+        counters = fleet.counters
+        restore = int(fleet.restore_at / fleet.speed)
+        before = [n for second, n in fleet.requests.items() if second < int(fleet.outage_at / fleet.speed)]
+        after = [n for second, n in fleet.requests.items() if second >= restore]
+        latencies = sorted(fleet.latencies)
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+
+        self.stdout.write(f'{name} firmware: {options["bins"]} bins, '
+                          f'{"power cut" if fleet.power_cut else "network outage"} of {options["outage"]:.0f}s '
+                          f'at {options["outage_at"]:.0f}s, x{fleet.speed:g} speed')
+        self.stdout.write(f'    requests     {sum(fleet.requests.values())} on {counters["connections"]} connections, '
+                          f'{counters["failures"]} failed, status {fleet.statuses}')
+        self.stdout.write(f'    peak req/s   {max(before, default=0)} before the outage, '
+                          f'{max(after, default=0)} after it (wall clock)')
+        self.stdout.write(f'    latency ms   p50 {pct(0.5):.1f}  p99 {pct(0.99):.1f}')
+        self.stdout.write(f'    readings     {counters["delivered"]} delivered, {counters["lost"]} lost, '
+                          f'{counters["pending"]} still buffered of {counters["generated"]} taken')
@@ -0,0 +1,164 @@
+from decimal import Decimal
+import queue
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections
+from django.db.models import Sum
+
+from waste import wallet
+from waste.models import Customer, Municipality, MunicipalityCreditShard, WalletTransaction, WasteCollection
+
+TAG = 'walletstress_'
+
+
+def seed(customers, collections, balance, amount):
+    municipality = Municipality.objects.create(
+        user=User.objects.create_user(f'{TAG}municipality'), name=TAG, area=TAG, phone='0', address=TAG,
+    )
+    User.objects.bulk_create(User(username=f'{TAG}c{i}') for i in range(customers))
+    Customer.objects.bulk_create(
+        Customer(user=u, municipality=municipality, phone='0', address='a', wallet_balance=balance)
+        for u in User.objects.filter(username__startswith=f'{TAG}c')
+    )
+    customer_ids = list(Customer.objects.filter(municipality=municipality).values_list('id', flat=True))
+    WasteCollection.objects.bulk_create(
+        (WasteCollection(customer_id=c, municipality=municipality, collection_date='2024-01-01',
+                         amount=amount, status='collected')
+         for c in customer_ids for _ in range(collections)),
+        batch_size=1000,
+    )
+    return municipality
+
+
+def cleanup():
+    WalletTransaction.objects.filter(customer__user__username__startswith=TAG).delete()
+    WalletTransaction.objects.filter(municipality__user__username__startswith=TAG).delete()
+    User.objects.filter(username__startswith=TAG).delete()
+
+
+def naive_pay(collection):
+    """The original read-modify-write verify_collection, for comparison."""
+    customer = Customer.objects.get(pk=collection.customer_id)
+    if collection.status == 'collected' and customer.wallet_balance >= collection.amount:
+        customer.wallet_balance -= collection.amount
+        customer.save()
+        municipality = Municipality.objects.get(pk=collection.municipality_id)
+        municipality.wallet_balance += collection.amount
+        municipality.save()
+        collection.status = 'verified'
+        collection.save()
+
+
+class Command(BaseCommand):
+    help = 'Verify collections and top up wallets from many threads, then check the ledger for lost updates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--collections', type=int, default=20, help='collected tasks per customer')
+        parser.add_argument('--replays', type=float, default=0.2,
+                            help='fraction of payments and top-ups sent twice')
+        parser.add_argument('--naive', action='store_true',
+                            help='use the old read-modify-write code path instead of the ledger')
+
+    def handle(self, *args, **options):
+        cleanup()
+        amount = Decimal('50.00')
+        topup = Decimal('10.00')
+        # Enough for every payment, so any shortfall is a lost update
+        balance = amount * options['collections']
+        municipality = seed(options['customers'], options['collections'], balance, amount)
+        try:
+            self.run(municipality, amount, topup, balance, options)
+        finally:
+            cleanup()
+
+    def run(self, municipality, amount, topup, balance, options):
+        work = queue.Queue()
+        collections = list(WasteCollection.objects.filter(municipality=municipality))
+        random.shuffle(collections)
+        for n, collection in enumerate(collections):
+            work.put(('pay', collection))
+            work.put(('topup', (collection.customer_id, f'{TAG}topup{n}')))
+            if random.random() < options['replays']:
+                work.put(('pay', collection))
+                work.put(('topup', (collection.customer_id, f'{TAG}topup{n}')))
+        customers = {c.pk: c for c in Customer.objects.filter(municipality=municipality)}
+        stats = {'ops': 0, 'retries': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        op, arg = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    for _ in range(20):
+                        try:
+                            if op == 'pay' and options['naive']:
+                                naive_pay(WasteCollection.objects.get(pk=arg.pk))
+                            elif op == 'pay':
+                                wallet.pay_collection(arg)
+                            elif options['naive']:
+                                customer = Customer.objects.get(pk=arg[0])
+                                customer.wallet_balance += topup
+                                customer.save()
+                            else:
+                                wallet.top_up(customers[arg[0]], topup, arg[1])
+                            break
+                        except OperationalError:
+                            # SQLite answers "database is locked" under write contention
+                            with lock:
+                                stats['retries'] += 1
+                            time.sleep(random.random() * 0.01)
+                        except wallet.WalletError:
+                            with lock:
+                                stats['errors'] += 1
+                            break
+                    with lock:
+                        stats['ops'] += 1
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        wallet.settle_credits([municipality.pk])
+
+        payments = len(collections)
+        topups = len(collections)
+        verified = WasteCollection.objects.filter(municipality=municipality, status='verified').count()
+        customer_total = Customer.objects.filter(municipality=municipality).aggregate(
+            total=Sum('wallet_balance'))['total']
+        municipality.refresh_from_db()
+        expected_customers = balance * len(customers) + topup * topups - amount * payments
+        expected_municipality = amount * payments
+
+        self.stdout.write(f'mode:          {"naive read-modify-write" if options["naive"] else "ledger"}')
+        self.stdout.write(f'operations:    {stats["ops"]} in {elapsed:.2f}s ({stats["ops"] / elapsed:.0f} tx/sec, '
+                          f'{options["threads"]} threads, {stats["retries"]} lock retries, '
+                          f'{stats["errors"]} rejected)')
+        self.stdout.write(f'verified:      {verified}/{payments}')
+        self.stdout.write(f'customers:     {customer_total} (expected {expected_customers})')
+        self.stdout.write(f'municipality:  {municipality.wallet_balance} (expected {expected_municipality})')
+        lost = abs(customer_total - expected_customers) + abs(expected_municipality - municipality.wallet_balance)
+        if not options['naive']:
+            ledger = WalletTransaction.objects.filter(customer__municipality=municipality).aggregate(
+                total=Sum('amount'))['total']
+            self.stdout.write(f'ledger:        {balance * len(customers) + ledger} matches customer balances: '
+                              f'{balance * len(customers) + ledger == customer_total}')
+            leftover = MunicipalityCreditShard.objects.filter(municipality=municipality).aggregate(
+                total=Sum('amount'))['total']
+            self.stdout.write(f'unsettled:     {leftover}')
+        self.stdout.write(f'lost updates:  ₹{lost}')
+        if lost and not options['naive']:
+            raise CommandError('Wallet balances do not match the ledger')
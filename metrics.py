@@ -0,0 +1,296 @@
+"""Per-view request metrics exposed in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and attributes it to the URL
+name it resolved to, together with the database queries it ran, the
+dashboard and price-book cache lookups it made and, for the IoT
+endpoints, the readings it accepted or rejected. ``render()`` formats
+the totals for ``/api/metrics/``.
+
+Counters live in the process, like the dashboard cache stats: with
+several workers, scrape each one or sum them in Prometheus. Requests
+slower than ``SLOW_REQUEST_MS`` are logged with the SQL they ran.
+"""
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+import asyncio
+import hmac
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'CAPTURE_SQL': 50,        # statements kept per request for the slow log
+    'TOKEN': None,            # bearer token Prometheus scrapes with
+}
+
+# Seconds; Prometheus' default buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+UNRESOLVED = '<unresolved>'
+
+_current = ContextVar('smartbin_request_metrics', default=None)
+_lock = threading.Lock()
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SMARTBIN_METRICS', {})}
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``counts[i]`` holds values in ``(buckets[i-1], buckets[i]]``."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + ('+Inf',), self.counts):
+            total += n
+            yield bound, total
+
+
+class Registry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()      # (view, method, status)
+        self.latency = {}              # view -> Histogram of seconds
+        self.queries = {}              # view -> Histogram of queries per request
+        self.db_seconds = Counter()    # view
+        self.cache = Counter()         # (view, 'hit' | 'miss')
+        self.readings = Counter()      # (view, 'accepted' | 'rejected')
+        self.slow = Counter()          # view
+
+    def observe(self, view, method, status, elapsed, stats):
+        with _lock:
+            self.requests[view, method, status] += 1
+            if view not in self.latency:
+                self.latency[view] = Histogram(LATENCY_BUCKETS)
+                self.queries[view] = Histogram(QUERY_BUCKETS)
+            self.latency[view].observe(elapsed)
+            self.queries[view].observe(stats.queries)
+            self.db_seconds[view] += stats.db_seconds
+            if stats.cache_hits:
+                self.cache[view, 'hit'] += stats.cache_hits
+            if stats.cache_misses:
+                self.cache[view, 'miss'] += stats.cache_misses
+            if stats.accepted:
+                self.readings[view, 'accepted'] += stats.accepted
+            if stats.rejected:
+                self.readings[view, 'rejected'] += stats.rejected
+
+    def count_slow(self, view):
+        with _lock:
+            self.slow[view] += 1
+
+
+registry = Registry()
+
+
+class RequestStats:
+    """What one request did; filled in by the execute wrapper and ``count_*`` helpers."""
+
+    __slots__ = ('queries', 'db_seconds', 'sql', 'capture', 'cache_hits', 'cache_misses', 'accepted', 'rejected')
+
+    def __init__(self, capture):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.sql = []
+        self.capture = capture
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.accepted = 0
+        self.rejected = 0
+
+
+def _execute(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if len(stats.sql) < stats.capture:
+            stats.sql.append((elapsed, sql))
+
+
+@receiver(connection_created)
+def _install_wrapper(sender, connection, **kwargs):
+    # Installed once per connection rather than per request: the request's
+    # stats travel in a context variable, which also reaches the threads
+    # sync views run in under ASGI.
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def count_cache(hit):
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def count_readings(accepted=0, rejected=0):
+    stats = _current.get()
+    if stats is not None:
+        stats.accepted += accepted
+        stats.rejected += rejected
+
+
+class MetricsMiddleware:
+    """Record latency, queries, cache lookups and readings per URL name.
+
+    Put it first in ``MIDDLEWARE`` so the timings include the other
+    middleware. It runs natively under ASGI, so the async ingestion view
+    isn't pushed onto a thread. Streaming responses are timed up to their
+    first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = _config()
+        self.enabled = config['ENABLED']
+        self.slow_seconds = config['SLOW_REQUEST_MS'] / 1000
+        self.capture = config['CAPTURE_SQL']
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Mark the instance as a coroutine function for Django's handler
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        # Connections opened before this module was imported
+        for connection in connections.all():
+            if connection.connection is not None:
+                _install_wrapper(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats = RequestStats(self.capture)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats = RequestStats(self.capture)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    def record(self, request, response, elapsed, stats):
+        match = request.resolver_match
+        view = match.view_name if match else UNRESOLVED
+        registry.observe(view, request.method, response.status_code, elapsed, stats)
+        if elapsed >= self.slow_seconds:
+            registry.count_slow(view)
+            log_slow_request(request, view, response.status_code, elapsed, stats)
+
+
+def log_slow_request(request, view, status, elapsed, stats):
+    lines = [
+        f'Slow request: {request.method} {request.get_full_path()} ({view}) {status} '
+        f'in {elapsed * 1000:.0f} ms, {stats.queries} queries in {stats.db_seconds * 1000:.0f} ms'
+    ]
+    lines += [f'  {seconds * 1000:7.1f} ms  {sql}' for seconds, sql in stats.sql]
+    if stats.queries > len(stats.sql):
+        lines.append(f'  ... {stats.queries - len(stats.sql)} more')
+    logger.warning('\n'.join(lines))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    # Exact: counters must keep counting past 1e6 for rate() to work
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _histogram(lines, name, help, histograms):
+    lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+    for view, histogram in sorted(histograms.items()):
+        for bound, total in histogram.cumulative():
+            lines.append(f'{name}_bucket{_labels(view=view, le=bound)} {total}')
+        lines.append(f'{name}_sum{_labels(view=view)} {_number(histogram.sum)}')
+        lines.append(f'{name}_count{_labels(view=view)} {histogram.count}')
+
+
+def _counter(lines, name, help, counter, *label_names):
+    lines += [f'# HELP {name} {help}', f'# TYPE {name} counter']
+    for key, value in sorted(counter.items()):
+        key = key if isinstance(key, tuple) else (key,)
+        lines.append(f'{name}{_labels(**dict(zip(label_names, key)))} {_number(value)}')
+
+
+def render():
+    """The registry in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        _counter(lines, 'smartbin_http_requests_total', 'Requests by URL name, method and status.',
+                 registry.requests, 'view', 'method', 'status')
+        _histogram(lines, 'smartbin_http_request_duration_seconds', 'Request latency by URL name.',
+                   registry.latency)
+        _histogram(lines, 'smartbin_db_queries_per_request', 'Database queries per request by URL name.',
+                   registry.queries)
+        _counter(lines, 'smartbin_db_query_seconds_total', 'Time spent in database queries by URL name.',
+                 registry.db_seconds, 'view')
+        _counter(lines, 'smartbin_cache_lookups_total', 'Dashboard and price book cache lookups by URL name.',
+                 registry.cache, 'view', 'result')
+        _counter(lines, 'smartbin_readings_total', 'Bin readings accepted or rejected by the IoT endpoints.',
+                 registry.readings, 'view', 'outcome')
+        _counter(lines, 'smartbin_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS by URL name.',
+                 registry.slow, 'view')
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(request):
+    token = _config()['TOKEN']
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.user.is_authenticated and request.user.is_superuser
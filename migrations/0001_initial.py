@@ -0,0 +1,189 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionAgent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=15)),
+                ('address', models.TextField()),
+                ('vehicle_number', models.CharField(max_length=50)),
+                ('vehicle_capacity', models.IntegerField(default=50)),
+                ('is_approved', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=15)),
+                ('address', models.TextField()),
+                ('wallet_balance', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('bin_id', models.CharField(blank=True, max_length=50, null=True, unique=True)),
+                ('is_approved', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Municipality',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('area', models.CharField(max_length=200)),
+                ('phone', models.CharField(max_length=15)),
+                ('address', models.TextField()),
+                ('wallet_balance', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('collection_rate', models.DecimalField(decimal_places=2, default=50, max_digits=10)),
+                ('is_approved', models.BooleanField(default=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recycler',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('company_name', models.CharField(max_length=200)),
+                ('phone', models.CharField(max_length=15)),
+                ('address', models.TextField()),
+                ('wallet_balance', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('plastic_rate', models.DecimalField(decimal_places=2, default=20, max_digits=10)),
+                ('paper_rate', models.DecimalField(decimal_places=2, default=15, max_digits=10)),
+                ('metal_rate', models.DecimalField(decimal_places=2, default=30, max_digits=10)),
+                ('is_approved', models.BooleanField(default=False)),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SmartBin',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bin_id', models.CharField(max_length=50, unique=True)),
+                ('current_level', models.IntegerField(default=0)),
+                ('is_full', models.BooleanField(default=False)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='waste.customer')),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WasteCollection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('assigned', 'Assigned'), ('collected', 'Collected'), ('verified', 'Verified')], default='pending', max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('collected_at', models.DateTimeField(blank=True, null=True)),
+                ('route_order', models.IntegerField(blank=True, null=True)),
+                ('bin', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='waste.smartbin')),
+                ('collection_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='waste.collectionagent')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.customer')),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecyclerBooking',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('waste_type', models.CharField(choices=[('plastic', 'Plastic'), ('paper', 'Paper'), ('metal', 'Metal')], max_length=20)),
+                ('weight', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('collection_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('assigned', 'Assigned'), ('collected', 'Collected')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('collection_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='waste.collectionagent')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.customer')),
+                ('recycler', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.recycler')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Enquiry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('reply', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_replied', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='municipality',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='collectionagent',
+            name='municipality',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality'),
+        ),
+        migrations.AddField(
+            model_name='collectionagent',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='BinLevelRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField(choices=[(300, '5 minutes'), (3600, 'Hourly'), (86400, 'Daily')])),
+                ('bucket', models.DateTimeField()),
+                ('min_level', models.IntegerField()),
+                ('max_level', models.IntegerField()),
+                ('level_sum', models.IntegerField()),
+                ('sample_count', models.IntegerField()),
+                ('bin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.smartbin')),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BinLevelDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('samples', models.BinaryField(default=bytes)),
+                ('sample_count', models.IntegerField(default=0)),
+                ('bin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.smartbin')),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='binlevelrollup',
+            index=models.Index(fields=['municipality', 'resolution', 'bucket'], name='waste_binle_municip_7c5903_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='binlevelrollup',
+            unique_together={('bin', 'resolution', 'bucket')},
+        ),
+        migrations.AddIndex(
+            model_name='binlevelday',
+            index=models.Index(fields=['municipality', 'day'], name='waste_binle_municip_af071d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='binlevelday',
+            unique_together={('bin', 'day')},
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waste', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collectionagent',
+            index=models.Index(fields=['municipality', 'is_approved'], name='agent_muni_approved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collectionagent',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['municipality', 'id'], name='agent_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['municipality', 'is_approved'], name='customer_muni_approved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['municipality', 'id'], name='customer_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recycler',
+            index=models.Index(fields=['municipality', 'is_approved'], name='recycler_muni_approved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recycler',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['municipality', 'id'], name='recycler_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recyclerbooking',
+            index=models.Index(fields=['recycler', 'status', 'id'], name='booking_recycler_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recyclerbooking',
+            index=models.Index(fields=['collection_agent', 'status', 'collection_date'], name='booking_agent_tasks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recyclerbooking',
+            index=models.Index(fields=['customer', '-created_at'], name='booking_customer_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smartbin',
+            index=models.Index(fields=['municipality', 'is_full', 'customer'], name='bin_muni_full_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smartbin',
+            index=models.Index(condition=models.Q(('is_full', True)), fields=['municipality', 'id'], name='bin_full_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wastecollection',
+            index=models.Index(fields=['municipality', 'status'], name='collection_muni_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wastecollection',
+            index=models.Index(fields=['collection_agent', 'status', 'collection_date'], name='collection_agent_tasks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wastecollection',
+            index=models.Index(fields=['customer', '-created_at'], name='collection_customer_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wastecollection',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['municipality', 'id'], name='collection_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waste', '0002_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletTransaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('topup', 'Top-up'), ('collection_payment', 'Collection Payment'), ('collection_credit', 'Collection Credit')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('idempotency_key', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('collection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='waste.wastecollection')),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='waste.customer')),
+                ('municipality', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='waste.municipality')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MunicipalityCreditShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['customer', '-created_at'], name='wallet_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['municipality', '-created_at'], name='wallet_municipality_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='municipalitycreditshard',
+            unique_together={('municipality', 'shard')},
+        ),
+    ]
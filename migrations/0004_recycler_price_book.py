@@ -0,0 +1,84 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The types and defaults that used to be hard-coded on RecyclerBooking/Recycler
+WASTE_TYPES = [
+    ('plastic', 'Plastic', 20),
+    ('paper', 'Paper', 15),
+    ('metal', 'Metal', 30),
+]
+
+
+def move_rates_to_table(apps, schema_editor):
+    WasteType = apps.get_model('waste', 'WasteType')
+    Recycler = apps.get_model('waste', 'Recycler')
+    RecyclerRate = apps.get_model('waste', 'RecyclerRate')
+    RecyclerBooking = apps.get_model('waste', 'RecyclerBooking')
+
+    types = {
+        code: WasteType.objects.create(code=code, name=name, default_rate=rate)
+        for code, name, rate in WASTE_TYPES
+    }
+    # Keep bookings of any other stored code valid under the new foreign key
+    for code in RecyclerBooking.objects.exclude(waste_type__in=list(types)).values_list('waste_type', flat=True).distinct():
+        WasteType.objects.create(code=code, name=code.title(), default_rate=0, is_active=False)
+
+    # Recyclers still on the old defaults follow default_rate from now on
+    RecyclerRate.objects.bulk_create(
+        RecyclerRate(recycler=recycler, waste_type=types[code], rate=getattr(recycler, f'{code}_rate'))
+        for recycler in Recycler.objects.all()
+        for code, _, default in WASTE_TYPES
+        if getattr(recycler, f'{code}_rate') != default
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waste', '0003_wallet_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WasteType',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('default_rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecyclerRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('recycler', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='waste.recycler')),
+                ('waste_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.wastetype')),
+            ],
+            options={
+                'unique_together': {('recycler', 'waste_type')},
+            },
+        ),
+        migrations.RunPython(move_rates_to_table, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='recycler',
+            name='metal_rate',
+        ),
+        migrations.RemoveField(
+            model_name='recycler',
+            name='paper_rate',
+        ),
+        migrations.RemoveField(
+            model_name='recycler',
+            name='plastic_rate',
+        ),
+        migrations.AlterField(
+            model_name='recyclerbooking',
+            name='waste_type',
+            field=models.ForeignKey(db_column='waste_type', on_delete=django.db.models.deletion.PROTECT, to='waste.wastetype', to_field='code'),
+        ),
+    ]
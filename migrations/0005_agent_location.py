@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waste', '0004_recycler_price_book'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectionagent',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='collectionagent',
+            name='location_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='collectionagent',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
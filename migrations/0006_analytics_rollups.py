@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waste', '0005_agent_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipalityDailyWaste',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+                ('waste_type', models.ForeignKey(db_column='waste_type', on_delete=django.db.models.deletion.PROTECT, to='waste.wastetype', to_field='code')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MunicipalityDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('collections_collected', models.IntegerField(default=0)),
+                ('collection_seconds', models.BigIntegerField(default=0)),
+                ('collections_verified', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waste.municipality')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='municipalitydailywaste',
+            index=models.Index(fields=['day'], name='daily_waste_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='municipalitydailywaste',
+            unique_together={('municipality', 'day', 'waste_type')},
+        ),
+        migrations.AddIndex(
+            model_name='municipalitydailystats',
+            index=models.Index(fields=['day'], name='daily_stats_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='municipalitydailystats',
+            unique_together={('municipality', 'day', 'shard')},
+        ),
+    ]
@@ -10,6 +10,8 @@ class Municipality(models.Model):
     wallet_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     collection_rate = models.DecimalField(max_digits=10, decimal_places=2, default=50)
     is_approved = models.BooleanField(default=True)
+    latitude = models.FloatField(null=True, blank=True)  # depot location for routing
+    longitude = models.FloatField(null=True, blank=True)
     
     def __str__(self):
         return self.name
@@ -23,6 +25,14 @@ class Customer(models.Model):
     bin_id = models.CharField(max_length=50, blank=True, null=True, unique=True)
     is_approved = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['municipality', 'is_approved'], name='customer_muni_approved_idx'),
+            # Municipality "pending approvals" list (partial indexes are skipped on MySQL)
+            models.Index(fields=['municipality', 'id'], condition=models.Q(is_approved=False),
+                         name='customer_pending_idx'),
+        ]
+    
     def __str__(self):
         return self.user.username
 
@@ -32,7 +42,19 @@ class CollectionAgent(models.Model):
     phone = models.CharField(max_length=15)
     address = models.TextField()
     vehicle_number = models.CharField(max_length=50)
+    vehicle_capacity = models.IntegerField(default=50)  # bins per route
     is_approved = models.BooleanField(default=False)
+    # Last position reported by the agent's phone
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    location_updated = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['municipality', 'is_approved'], name='agent_muni_approved_idx'),
+            models.Index(fields=['municipality', 'id'], condition=models.Q(is_approved=False),
+                         name='agent_pending_idx'),
+        ]
     
     def __str__(self):
         return self.user.username
@@ -44,14 +66,39 @@ class Recycler(models.Model):
     phone = models.CharField(max_length=15)
     address = models.TextField()
     wallet_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    plastic_rate = models.DecimalField(max_digits=10, decimal_places=2, default=20)
-    paper_rate = models.DecimalField(max_digits=10, decimal_places=2, default=15)
-    metal_rate = models.DecimalField(max_digits=10, decimal_places=2, default=30)
     is_approved = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['municipality', 'is_approved'], name='recycler_muni_approved_idx'),
+            models.Index(fields=['municipality', 'id'], condition=models.Q(is_approved=False),
+                         name='recycler_pending_idx'),
+        ]
+    
     def __str__(self):
         return self.company_name
 
+class WasteType(models.Model):
+    # Materials recyclers buy; add rows to support new types
+    code = models.SlugField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+    default_rate = models.DecimalField(max_digits=10, decimal_places=2)  # per kg, unless a recycler sets its own
+    is_active = models.BooleanField(default=True)
+    
+    def __str__(self):
+        return self.name
+
+class RecyclerRate(models.Model):
+    recycler = models.ForeignKey(Recycler, on_delete=models.CASCADE, related_name='rates')
+    waste_type = models.ForeignKey(WasteType, on_delete=models.CASCADE)
+    rate = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        unique_together = [('recycler', 'waste_type')]
+    
+    def __str__(self):
+        return f"{self.recycler} {self.waste_type}: {self.rate}"
+
 class SmartBin(models.Model):
     bin_id = models.CharField(max_length=50, unique=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=True, blank=True)
@@ -59,10 +106,62 @@ class SmartBin(models.Model):
     current_level = models.IntegerField(default=0)  # 0-100 percentage
     is_full = models.BooleanField(default=False)
     last_updated = models.DateTimeField(auto_now=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['municipality', 'is_full', 'customer'], name='bin_muni_full_customer_idx'),
+            # Full-bin list: only the few full bins are indexed
+            models.Index(fields=['municipality', 'id'], condition=models.Q(is_full=True),
+                         name='bin_full_idx'),
+        ]
     
     def __str__(self):
         return f"Bin {self.bin_id}"
 
+class BinLevelDay(models.Model):
+    # Raw readings of one bin for one UTC day, packed by history.py
+    bin = models.ForeignKey(SmartBin, on_delete=models.CASCADE)
+    municipality = models.ForeignKey(Municipality, on_delete=models.CASCADE)
+    day = models.DateField()
+    samples = models.BinaryField(default=bytes)
+    sample_count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('bin', 'day')]
+        indexes = [models.Index(fields=['municipality', 'day'])]
+    
+    def __str__(self):
+        return f"{self.bin_id} on {self.day}"
+
+class BinLevelRollup(models.Model):
+    RESOLUTION_CHOICES = [
+        (300, '5 minutes'),
+        (3600, 'Hourly'),
+        (86400, 'Daily'),
+    ]
+    
+    bin = models.ForeignKey(SmartBin, on_delete=models.CASCADE)
+    municipality = models.ForeignKey(Municipality, on_delete=models.CASCADE)
+    resolution = models.IntegerField(choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    min_level = models.IntegerField()
+    max_level = models.IntegerField()
+    level_sum = models.IntegerField()
+    sample_count = models.IntegerField()
+    
+    class Meta:
+        unique_together = [('bin', 'resolution', 'bucket')]
+        indexes = [models.Index(fields=['municipality', 'resolution', 'bucket'])]
+    
+    @property
+    def avg_level(self):
+        return self.level_sum / self.sample_count if self.sample_count else 0
+    
+    def __str__(self):
+        return f"{self.bin_id} {self.get_resolution_display()} at {self.bucket}"
+
 class WasteCollection(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -80,6 +179,17 @@ class WasteCollection(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     collected_at = models.DateTimeField(null=True, blank=True)
+    route_order = models.IntegerField(null=True, blank=True)  # stop number in the agent's route
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['municipality', 'status'], name='collection_muni_status_idx'),
+            models.Index(fields=['collection_agent', 'status', 'collection_date'],
+                         name='collection_agent_tasks_idx'),
+            models.Index(fields=['customer', '-created_at'], name='collection_customer_recent_idx'),
+            models.Index(fields=['municipality', 'id'], condition=models.Q(status='pending'),
+                         name='collection_pending_idx'),
+        ]
     
     def __str__(self):
         return f"Collection {self.id} - {self.customer.user.username}"
@@ -91,22 +201,24 @@ class RecyclerBooking(models.Model):
         ('collected', 'Collected'),
     ]
     
-    WASTE_TYPES = [
-        ('plastic', 'Plastic'),
-        ('paper', 'Paper'),
-        ('metal', 'Metal'),
-    ]
-    
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     recycler = models.ForeignKey(Recycler, on_delete=models.CASCADE)
     collection_agent = models.ForeignKey(CollectionAgent, on_delete=models.SET_NULL, null=True, blank=True)
-    waste_type = models.CharField(max_length=20, choices=WASTE_TYPES)
+    waste_type = models.ForeignKey(WasteType, on_delete=models.PROTECT, to_field='code', db_column='waste_type')
     weight = models.DecimalField(max_digits=10, decimal_places=2)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     collection_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['recycler', 'status', 'id'], name='booking_recycler_status_idx'),
+            models.Index(fields=['collection_agent', 'status', 'collection_date'],
+                         name='booking_agent_tasks_idx'),
+            models.Index(fields=['customer', '-created_at'], name='booking_customer_recent_idx'),
+        ]
+    
     def __str__(self):
         return f"Recycler Booking {self.id}"
 
@@ -120,3 +232,79 @@ class Enquiry(models.Model):
     
     def __str__(self):
         return f"Enquiry by {self.user.username}"
+
+class WalletTransaction(models.Model):
+    # Append-only ledger; wallet_balance columns are kept in step by wallet.py
+    KIND_CHOICES = [
+        ('topup', 'Top-up'),
+        ('collection_payment', 'Collection Payment'),
+        ('collection_credit', 'Collection Credit'),
+    ]
+    
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, null=True, blank=True)
+    municipality = models.ForeignKey(Municipality, on_delete=models.PROTECT, null=True, blank=True)
+    collection = models.ForeignKey(WasteCollection, on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)  # signed: credits > 0, debits < 0
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', '-created_at'], name='wallet_customer_idx'),
+            models.Index(fields=['municipality', '-created_at'], name='wallet_municipality_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Wallet transactions are append-only')
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount}"
+
+class MunicipalityCreditShard(models.Model):
+    # Unsettled credits, spread over several rows so concurrent payments
+    # don't all queue on the municipality row lock
+    municipality = models.ForeignKey(Municipality, on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = [('municipality', 'shard')]
+    
+    def __str__(self):
+        return f"{self.municipality} shard {self.shard}"
+
+class MunicipalityDailyStats(models.Model):
+    # Per-day counters kept current by analytics.py; backfill_analytics rebuilds them
+    municipality = models.ForeignKey(Municipality, on_delete=models.CASCADE)
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)  # verified counts are spread over shards
+    collections_collected = models.IntegerField(default=0)
+    collection_seconds = models.BigIntegerField(default=0)  # task created to collected, summed
+    collections_verified = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = [('municipality', 'day', 'shard')]
+        indexes = [models.Index(fields=['day'], name='daily_stats_day_idx')]
+    
+    def __str__(self):
+        return f"{self.municipality} on {self.day}"
+
+class MunicipalityDailyWaste(models.Model):
+    # Collected recycler bookings per day and waste type, kept by analytics.py
+    municipality = models.ForeignKey(Municipality, on_delete=models.CASCADE)
+    day = models.DateField()
+    waste_type = models.ForeignKey(WasteType, on_delete=models.PROTECT, to_field='code', db_column='waste_type')
+    bookings = models.IntegerField(default=0)
+    weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = [('municipality', 'day', 'waste_type')]
+        indexes = [models.Index(fields=['day'], name='daily_waste_day_idx')]
+    
+    def __str__(self):
+        return f"{self.municipality} {self.waste_type_id} on {self.day}"
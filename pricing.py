@@ -0,0 +1,118 @@
+"""Recycler price book.
+
+A municipality's price book holds the per-kg rate of every approved
+recycler for every active ``WasteType``: the recycler's own
+``RecyclerRate`` or the type's ``default_rate``. It is built with three
+queries and cached, so quoting and booking read no rates from the
+database. Saving or deleting a rate or recycler drops the municipality's
+book; changing a waste type bumps a version that all books are keyed by.
+Queryset ``update()`` calls skip signals, so callers that update
+recyclers that way must call ``invalidate`` themselves.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import Recycler, RecyclerRate, WasteType
+
+TIMEOUT = getattr(settings, 'SMARTBIN_PRICE_BOOK', {}).get('TIMEOUT', 3600)
+
+VERSION_KEY = 'smartbin:pricebook:version'
+
+CENT = Decimal('0.01')
+
+
+def _key(municipality_id):
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    return f'smartbin:pricebook:{version}:{municipality_id}'
+
+
+def build_price_book(municipality_id):
+    waste_types = list(WasteType.objects.filter(is_active=True).order_by('name').values_list('code', 'name', 'default_rate'))
+    recyclers = dict(
+        Recycler.objects.filter(municipality_id=municipality_id, is_approved=True)
+        .order_by('company_name').values_list('id', 'company_name')
+    )
+    custom = {
+        (recycler, code): rate
+        for recycler, code, rate in RecyclerRate.objects.filter(
+            recycler__municipality_id=municipality_id, recycler__is_approved=True, waste_type__is_active=True,
+        ).values_list('recycler_id', 'waste_type__code', 'rate')
+    }
+
+    rates = {}
+    ranked = {}
+    for code, _, default_rate in waste_types:
+        rates[code] = {recycler: custom.get((recycler, code), default_rate) for recycler in recyclers}
+        # Best payout first; ties keep company-name order
+        ranked[code] = sorted(recyclers, key=lambda recycler: -rates[code][recycler])
+    return {
+        'waste_types': {code: name for code, name, _ in waste_types},
+        'recyclers': recyclers,
+        'rates': rates,
+        'ranked': ranked,
+    }
+
+
+def get_price_book(municipality_id):
+    key = _key(municipality_id)
+    book = cache.get(key)
+    metrics.count_cache(book is not None)
+    if book is None:
+        book = build_price_book(municipality_id)
+        cache.set(key, book, TIMEOUT)
+    return book
+
+
+def invalidate(municipality_id=None):
+    """Drop one municipality's price book, or every book when None."""
+    if municipality_id is None:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 2, None)
+    else:
+        cache.delete(_key(municipality_id))
+
+
+def price(book, recycler_id, waste_type, weight):
+    """Amount for ``weight`` kg, or None if the recycler or type isn't in the book."""
+    rate = book['rates'].get(waste_type, {}).get(recycler_id)
+    if rate is None:
+        return None
+    return (Decimal(weight) * rate).quantize(CENT)
+
+
+def quote(municipality_id, waste_type, weight):
+    """Rank the municipality's recyclers by payout for ``weight`` kg of ``waste_type``."""
+    book = get_price_book(municipality_id)
+    return [
+        {
+            'recycler': recycler,
+            'company_name': book['recyclers'][recycler],
+            'rate': book['rates'][waste_type][recycler],
+            'amount': price(book, recycler, waste_type, weight),
+        }
+        for recycler in book['ranked'].get(waste_type, [])
+    ]
+
+
+@receiver([post_save, post_delete], sender=RecyclerRate)
+def _rate_changed(sender, instance, **kwargs):
+    municipality_id = Recycler.objects.filter(pk=instance.recycler_id).values_list('municipality_id', flat=True).first()
+    if municipality_id is not None:
+        invalidate(municipality_id)
+
+
+@receiver([post_save, post_delete], sender=Recycler)
+def _recycler_changed(sender, instance, **kwargs):
+    invalidate(instance.municipality_id)
+
+
+@receiver([post_save, post_delete], sender=WasteType)
+def _waste_type_changed(sender, instance, **kwargs):
+    invalidate()
@@ -0,0 +1,201 @@
+"""Batch route planning for collection agents.
+
+Bins are split between agents with a sweep around the municipality depot
+(consecutive angular sectors sized by each agent's free capacity), then
+every sector is ordered with a grid-indexed nearest-neighbour tour and
+improved with 2-opt. Routes are open paths starting at the depot.
+"""
+from collections import namedtuple
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import dashcache, events, forecast
+from .geo import GridIndex, cell_size, project
+from .models import CollectionAgent, SmartBin, WasteCollection
+
+Route = namedtuple('Route', ['agent', 'stops', 'distance_km'])
+
+OPEN_STATUSES = ['pending', 'assigned']
+
+
+def two_opt(route, dist, max_passes=20):
+    """Improve an open path in place; ``route[0]`` (the depot) stays fixed."""
+    n = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a, b = route[i - 1], route[i]
+            js = np.arange(i + 1, n)
+            c = route[js]
+            gain = dist[a, c] - dist[a, b]
+            inner = js < n - 1
+            d = route[js[inner] + 1]
+            gain[inner] += dist[b, d] - dist[c[inner], d]
+            k = int(np.argmin(gain))
+            if gain[k] < -1e-9:
+                j = js[k]
+                route[i:j + 1] = route[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def order_stops(points, depot):
+    """Order projected ``points`` into a short open path from ``depot``.
+
+    Returns ``(order, distance_km)`` where ``order`` indexes ``points``.
+    """
+    if not points:
+        return [], 0.0
+    index = GridIndex(points, cell_km=cell_size(points))
+    tour = []
+    x, y = depot
+    while index.size:
+        i = index.nearest(x, y)
+        index.remove(i)
+        tour.append(i)
+        x, y = points[i]
+
+    coords = np.array([depot] + points)
+    dist = np.sqrt(((coords[:, None, :] - coords[None, :, :]) ** 2).sum(axis=-1))
+    route = two_opt(np.array([0] + [i + 1 for i in tour]), dist)
+    length = float(dist[route[:-1], route[1:]].sum())
+    return [int(i) - 1 for i in route[1:]], length
+
+
+def plan_routes(stops, agents, depot=None):
+    """Plan one route per agent.
+
+    ``stops`` is a list of ``(key, lat, lon)`` and ``agents`` a list of
+    ``(key, capacity)``. ``depot`` is an optional ``(lat, lon)``; the
+    centroid of the stops is used otherwise. Returns ``(routes,
+    unassigned_keys)``; when the stops exceed the total capacity the
+    end of the sweep is left unassigned.
+    """
+    agents = [(key, capacity) for key, capacity in agents if capacity > 0]
+    if not stops or not agents:
+        return [], [key for key, _, _ in stops]
+
+    latlons = [(lat, lon) for _, lat, lon in stops]
+    if depot is None:
+        depot = (sum(lat for lat, _ in latlons) / len(latlons),
+                 sum(lon for _, lon in latlons) / len(latlons))
+    ref_lat = depot[0]
+    points = project(latlons, ref_lat)
+    depot_xy = project([depot], ref_lat)[0]
+
+    # Sweep: sort by angle around the depot and cut into sectors
+    angles = [math.atan2(y - depot_xy[1], x - depot_xy[0]) for x, y in points]
+    sweep = sorted(range(len(points)), key=angles.__getitem__)
+    total_capacity = sum(capacity for _, capacity in agents)
+    served = min(len(points), total_capacity)
+
+    routes = []
+    start = 0
+    remaining_capacity = total_capacity
+    for key, capacity in agents:
+        # Share the remaining stops in proportion to capacity
+        share = round((served - start) * capacity / remaining_capacity)
+        remaining_capacity -= capacity
+        size = min(capacity, share, served - start)
+        sector = sweep[start:start + size]
+        start += size
+        order, length = order_stops([points[i] for i in sector], depot_xy)
+        routes.append(Route(key, [stops[sector[i]][0] for i in order], round(length, 3)))
+
+    unassigned = [stops[i][0] for i in sweep[start:]]
+    return routes, unassigned
+
+
+def dispatch(municipality, collection_date, horizon=None):
+    """Plan routes for due bins and create their WasteCollection tasks.
+
+    Due bins are linked bins that are full, or predicted full within
+    ``horizon`` (a timedelta) when given, and have no open collection.
+    Agent capacity is reduced by the tasks they already hold for
+    ``collection_date``. Returns a summary dict.
+    """
+    due = Q(is_full=True)
+    if horizon:
+        predicted = forecast.bins_predicted_full_by(municipality, timezone.now() + horizon)
+        due |= Q(id__in=[bin.id for bin in predicted])
+
+    bins = list(
+        SmartBin.objects
+        .filter(due, municipality=municipality, customer__isnull=False)
+        .exclude(wastecollection__status__in=OPEN_STATUSES)
+        .only('id', 'bin_id', 'customer', 'current_level', 'latitude', 'longitude', 'is_full')
+    )
+    located = [bin for bin in bins if bin.latitude is not None and bin.longitude is not None]
+
+    agents = list(
+        CollectionAgent.objects
+        .filter(municipality=municipality, is_approved=True)
+        .annotate(booked=Count(
+            'wastecollection',
+            filter=Q(wastecollection__collection_date=collection_date,
+                     wastecollection__status__in=OPEN_STATUSES),
+        ))
+        .order_by('id')
+    )
+
+    depot = None
+    if municipality.latitude is not None and municipality.longitude is not None:
+        depot = (municipality.latitude, municipality.longitude)
+    routes, unassigned = plan_routes(
+        [(bin.id, bin.latitude, bin.longitude) for bin in located],
+        [(agent.id, agent.vehicle_capacity - agent.booked) for agent in agents],
+        depot,
+    )
+
+    by_id = {bin.id: bin for bin in located}
+    collections = [
+        WasteCollection(
+            customer_id=by_id[bin_pk].customer_id,
+            bin_id=bin_pk,
+            municipality=municipality,
+            collection_agent_id=route.agent,
+            collection_date=collection_date,
+            amount=municipality.collection_rate,
+            status='assigned',
+            route_order=position,
+        )
+        for route in routes
+        for position, bin_pk in enumerate(route.stops, start=1)
+    ]
+    with transaction.atomic():
+        # The scheduler or a manual assignment may have taken some of these
+        # bins since they were read; the bin locks serialize with them
+        planned = [c.bin_id for c in collections]
+        list(SmartBin.objects.select_for_update().filter(id__in=planned).values_list('id', flat=True))
+        taken = set(
+            WasteCollection.objects.filter(bin_id__in=planned, status__in=OPEN_STATUSES)
+            .values_list('bin_id', flat=True)
+        )
+        collections = [c for c in collections if c.bin_id not in taken]
+        WasteCollection.objects.bulk_create(collections, batch_size=500)
+        SmartBin.objects.filter(id__in=[c.bin_id for c in collections], is_full=True).update(is_full=False)
+        events.publish_flips([
+            (municipality.id, c.bin_id, by_id[c.bin_id].bin_id, by_id[c.bin_id].current_level, False)
+            for c in collections if by_id[c.bin_id].is_full
+        ])
+        dashcache.invalidate(
+            f'municipality:{municipality.id}:bins',
+            *(tag for c in collections for tag in dashcache.collection_tags(
+                municipality.id, c.customer_id, c.collection_agent_id)),
+        )
+
+    return {
+        'assigned': len(collections),
+        'routes': [
+            {'agent': route.agent, 'stops': len(route.stops), 'distance_km': route.distance_km}
+            for route in routes if route.stops
+        ],
+        'unassigned': len(unassigned),
+        'missing_location': len(bins) - len(located),
+    }
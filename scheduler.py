@@ -0,0 +1,148 @@
+"""Automatic collection tasks for full bins.
+
+``run_once`` finds every full linked bin without an open collection in
+one query, then hands each municipality's bins to its approved agents,
+least-loaded first. An agent's load is their open (pending or assigned)
+collections, and no agent is given more than ``vehicle_capacity`` of
+them. Bins left over wait for the next pass.
+
+Each municipality is handled in its own transaction, with its row and
+its bins locked ``FOR UPDATE SKIP LOCKED``. Several ``run_scheduler``
+processes can therefore share the work: a municipality or bin that
+another worker, a bulk assignment or a manual assignment holds is
+skipped and picked up on a later pass. The open-collection check is
+repeated under the lock, so a bin never gets a second open collection.
+SQLite takes no row locks, so run a single scheduler there.
+"""
+from collections import defaultdict
+import heapq
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import dashcache, events
+from .models import CollectionAgent, Municipality, SmartBin, WasteCollection
+from .routing import OPEN_STATUSES
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'INTERVAL': 60,           # seconds between passes
+    'BATCH_SIZE': 1000,       # most bins one pass assigns per municipality
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SMARTBIN_SCHEDULER', {})}
+
+
+def _open_bins():
+    return WasteCollection.objects.filter(status__in=OPEN_STATUSES).values('bin_id')
+
+
+def due_bins(municipality_ids=None):
+    """``{municipality_id: [bin pk, ...]}`` of full linked bins with no open collection, fullest first."""
+    bins = SmartBin.objects.filter(is_full=True, customer__isnull=False).exclude(id__in=_open_bins())
+    if municipality_ids is not None:
+        bins = bins.filter(municipality_id__in=municipality_ids)
+    due = defaultdict(list)
+    for bin_pk, municipality_id in bins.order_by('-current_level', 'id').values_list('id', 'municipality_id'):
+        due[municipality_id].append(bin_pk)
+    return due
+
+
+def balance(bins, agents):
+    """Pair each bin with the agent holding the fewest open tasks.
+
+    ``agents`` are ``(agent pk, open tasks, capacity)``. Returns
+    ``[(bin, agent pk), ...]``; bins beyond the agents' spare capacity are
+    left out.
+    """
+    heap = [(load, pk, capacity) for pk, load, capacity in agents if load < capacity]
+    heapq.heapify(heap)
+    pairs = []
+    for bin in bins:
+        if not heap:
+            break
+        load, pk, capacity = heapq.heappop(heap)
+        pairs.append((bin, pk))
+        if load + 1 < capacity:
+            heapq.heappush(heap, (load + 1, pk, capacity))
+    return pairs
+
+
+def assign_municipality(municipality_id, bin_ids, collection_date=None):
+    """Create assigned collections for the due ``bin_ids`` of one municipality.
+
+    Returns the number of collections created, or None if another worker
+    holds the municipality.
+    """
+    collection_date = collection_date or timezone.localdate()
+    with transaction.atomic():
+        municipality = Municipality.objects.select_for_update(skip_locked=True).filter(pk=municipality_id).first()
+        if municipality is None:
+            return None
+        # Re-checked under the lock: another worker or a manual assignment
+        # may have created a collection since due_bins() ran
+        locked = {
+            bin.id: bin
+            for bin in SmartBin.objects.select_for_update(skip_locked=True)
+            .filter(id__in=bin_ids, municipality_id=municipality_id, is_full=True, customer__isnull=False)
+            .exclude(id__in=_open_bins())
+            .only('id', 'bin_id', 'customer', 'current_level')
+        }
+        bins = [locked[pk] for pk in bin_ids if pk in locked]
+        agents = (
+            CollectionAgent.objects
+            .filter(municipality_id=municipality_id, is_approved=True)
+            .annotate(open=Count('wastecollection', filter=Q(wastecollection__status__in=OPEN_STATUSES)))
+            .order_by('id')
+            .values_list('id', 'open', 'vehicle_capacity')
+        )
+
+        collections = [
+            WasteCollection(
+                customer_id=bin.customer_id,
+                bin_id=bin.id,
+                municipality=municipality,
+                collection_agent_id=agent_pk,
+                collection_date=collection_date,
+                amount=municipality.collection_rate,
+                status='assigned',
+            )
+            for bin, agent_pk in balance(bins, agents)
+        ]
+        if not collections:
+            return 0
+        WasteCollection.objects.bulk_create(collections, batch_size=500)
+        SmartBin.objects.filter(id__in=[c.bin_id for c in collections]).update(is_full=False)
+        events.publish_flips([
+            (municipality_id, c.bin_id, locked[c.bin_id].bin_id, locked[c.bin_id].current_level, False)
+            for c in collections
+        ])
+        dashcache.invalidate(
+            f'municipality:{municipality_id}:bins',
+            *(tag for c in collections for tag in dashcache.collection_tags(
+                municipality_id, c.customer_id, c.collection_agent_id)),
+        )
+    return len(collections)
+
+
+def run_once(municipality_ids=None):
+    """One scheduling pass. Returns a summary dict."""
+    batch_size = _config()['BATCH_SIZE']
+    summary = {'due': 0, 'assigned': 0, 'municipalities': 0, 'skipped_locked': 0}
+    for municipality_id, bin_ids in due_bins(municipality_ids).items():
+        summary['due'] += len(bin_ids)
+        assigned = assign_municipality(municipality_id, bin_ids[:batch_size])
+        if assigned is None:
+            summary['skipped_locked'] += 1
+            continue
+        summary['municipalities'] += 1
+        summary['assigned'] += assigned
+        if assigned:
+            logger.info('Assigned %d of %d due bins in municipality %s', assigned, len(bin_ids), municipality_id)
+    return summary
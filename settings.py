@@ -1,3 +1,5 @@
+import os
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -8,12 +10,148 @@ INSTALLED_APPS = [
     'waste',
 ]
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database profile, picked with SMARTBIN_DB_ENGINE: sqlite (the default, for
+# development) or mysql / postgresql in production. Server settings come from
+# SMARTBIN_DB_NAME, _USER, _PASSWORD, _HOST and _PORT.
+DB_ENGINE = os.environ.get('SMARTBIN_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'timeout': 20},   # seconds to wait for the write lock
+        }
     }
+else:
+    # SMARTBIN_DB_POOL_SIZE > 0 keeps that many connections open per process
+    # (pip install django-db-connection-pool). Without a pool each thread
+    # keeps its connection for CONN_MAX_AGE seconds.
+    DB_POOL_SIZE = int(os.environ.get('SMARTBIN_DB_POOL_SIZE', 0))
+
+    def _database(host):
+        database = {
+            'ENGINE': f'dj_db_conn_pool.backends.{DB_ENGINE}' if DB_POOL_SIZE else f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.environ.get('SMARTBIN_DB_NAME', 'smartrash'),
+            'USER': os.environ.get('SMARTBIN_DB_USER', 'smartrash'),
+            'PASSWORD': os.environ.get('SMARTBIN_DB_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.environ.get('SMARTBIN_DB_PORT', ''),
+            'CONN_MAX_AGE': 0 if DB_POOL_SIZE else 60,
+            'OPTIONS': {'connect_timeout': 5},
+        }
+        if DB_ENGINE == 'mysql':
+            database['OPTIONS'].update(charset='utf8mb4', init_command="SET sql_mode='STRICT_TRANS_TABLES'")
+        if DB_POOL_SIZE:
+            database['POOL_OPTIONS'] = {'POOL_SIZE': DB_POOL_SIZE, 'MAX_OVERFLOW': DB_POOL_SIZE, 'RECYCLE': 3600}
+        return database
+
+    DATABASES = {'default': _database(os.environ.get('SMARTBIN_DB_HOST', '127.0.0.1'))}
+    # Comma-separated read replicas of the primary for dashboard reads
+    for n, host in enumerate(filter(None, os.environ.get('SMARTBIN_DB_REPLICAS', '').split(','))):
+        DATABASES[f'replica{n}'] = {**_database(host.strip()), 'TEST': {'MIRROR': 'default'}}
+
+# Dashboard views read from replicas (waste.database). Add
+# 'waste.database.PrimaryAfterWriteMiddleware' to MIDDLEWARE with replicas
+# so clients see their own writes.
+DATABASE_ROUTERS = ['waste.database.ReplicaRouter']
+
+SMARTBIN_DATABASE = {
+    'REPLICAS': [alias for alias in DATABASES if alias.startswith('replica')],
+    'REPLICA_LAG': 5,         # seconds a client stays on the primary after writing
+    'SQLITE_WAL': True,       # WAL journal so readers don't block the writer
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smartrash',
+    },
+    # Shared across processes; needs `pip install django-redis` and a local Redis:
+    # 'default': {
+    #     'BACKEND': 'django_redis.cache.RedisCache',
+    #     'LOCATION': 'redis://127.0.0.1:6379/1',
+    # },
 }
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Coalesce IoT bin writes in-process (waste.telemetry.TelemetryBuffer).
+# Full-threshold crossings always flush immediately.
+SMARTBIN_WRITE_BUFFER = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL': 5.0,    # seconds between background flushes
+    'FLUSH_THRESHOLD': 500,   # flush early once this many bins are dirty
+    'MAX_AGE': 300.0,         # rewrite unchanged bins after this many seconds
+}
+
+# Async IoT ingestion (/api/bin/update/async/, needs an ASGI server).
+# Readings are acked immediately and written by batched queue workers;
+# a full queue answers 503 with a Retry-After header.
+SMARTBIN_INGEST_QUEUE = {
+    'MAX_SIZE': 10000,
+    'WORKERS': 4,
+    'BATCH_SIZE': 500,
+    'RETRY_AFTER': 5,         # seconds, used until a drain rate is measured
+}
+
+# Bin fill-level history retention in days (None keeps forever).
+SMARTBIN_HISTORY = {
+    'RAW_DAYS': 14,
+    'ROLLUP_DAYS': {300: 30, 3600: 365, 86400: None},
+}
+
+# Verified collections credit one of CREDIT_SHARDS rows per municipality;
+# run `manage.py settle_wallets` periodically to fold them into the balance.
+# Their daily analytics counts are spread over as many rows.
+SMARTBIN_WALLET = {
+    'CREDIT_SHARDS': 8,
+}
+
+# Cached per-municipality recycler price book (waste.pricing); rate and
+# recycler changes invalidate it, the timeout only bounds staleness.
+SMARTBIN_PRICE_BOOK = {
+    'TIMEOUT': 3600,          # seconds
+}
+
+# Cached dashboard fragments (waste.dashcache). Model saves invalidate them;
+# the timeout only bounds memory. Use a shared cache (Redis) when running
+# more than one process, or invalidations won't reach the other processes.
+SMARTBIN_DASHBOARD_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,           # seconds
+}
+
+# Per-view request metrics (waste.metrics), served in the Prometheus text
+# format at /api/metrics/ to superusers or to `Authorization: Bearer TOKEN`.
+# Add 'waste.metrics.MetricsMiddleware' first in MIDDLEWARE to collect them.
+SMARTBIN_METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,   # log slower requests with their SQL to 'waste.metrics'
+    'CAPTURE_SQL': 50,        # statements kept per request for that log
+    'TOKEN': os.environ.get('SMARTBIN_METRICS_TOKEN'),
+}
+
+# In-process grid index of bin and agent positions (waste.spatial). Moving
+# bins rebuilds it; full flags and agent positions are re-read at most
+# every REFRESH seconds.
+SMARTBIN_SPATIAL = {
+    'REFRESH': 5,             # seconds
+    'CLUSTER_KM': 1.0,        # default cell edge for /api/bins/full/clusters/
+}
+
+# Automatic collection tasks for full bins (waste.scheduler). Run
+# `manage.py run_scheduler` in one or more processes; on SQLite run one.
+SMARTBIN_SCHEDULER = {
+    'INTERVAL': 60,           # seconds between passes
+    'BATCH_SIZE': 1000,       # most bins assigned per municipality per pass
+}
+
+# Streaming CSV / JSON-lines exports at /api/export/<name>/ (waste.exports).
+# Serve them from WSGI workers; Django 3.2 can't stream ORM rows under ASGI.
+SMARTBIN_EXPORTS = {
+    'CHUNK_SIZE': 2000,       # rows per database fetch
+    'FLUSH_BYTES': 65536,     # output buffered per piece sent
+}
@@ -0,0 +1,246 @@
+"""Proximity queries over bins and collection agents.
+
+Each municipality gets an in-process ``SpatialIndex``. Bin and agent
+positions are projected to kilometres around the municipality's depot
+and bucketed in a ``GridIndex``, so a lookup only reads the cells around
+the query point. The lookups are agents nearest a bin, bins within a
+radius, and full bins grouped into geographic clusters. Each stays well
+under a millisecond with 100k bins; ``manage.py bench_spatial`` compares
+them with a scan.
+
+Bin positions rarely change, but ``is_full`` flags and agent positions
+change all the time, so the three are kept fresh in different ways:
+
+- Adding, moving or deleting a bin bumps a version in the shared cache.
+  The index is rebuilt when it sees a new version.
+- Full flags and agent positions are re-read at most every ``REFRESH``
+  seconds. Full flags come from the partial full-bin index.
+- ``update_agent_position`` also moves the agent in this process's index
+  straight away.
+
+Queryset ``update()`` and ``bulk_create()`` skip signals, so callers that
+move bins that way must call ``invalidate`` themselves.
+"""
+from collections import defaultdict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .geo import GridIndex, cell_size, project
+from .models import CollectionAgent, Municipality, SmartBin
+
+DEFAULTS = {
+    'REFRESH': 5,             # seconds between re-reads of full flags and agent positions
+    'CLUSTER_KM': 1.0,        # default grid cell edge for full-bin clusters
+}
+
+_lock = threading.Lock()
+_indexes = {}  # municipality_id -> SpatialIndex
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SMARTBIN_SPATIAL', {})}
+
+
+def _version_key(municipality_id):
+    return f'smartbin:spatial:{municipality_id}'
+
+
+class SpatialIndex:
+    """Bins and agents of one municipality on a grid.
+
+    ``bins`` and ``agents`` are ``(id, latitude, longitude)`` rows and
+    ``full`` is the set of full bin ids. Distances are straight-line km in
+    the projection, within a percent of the great-circle distance at city
+    scale.
+    """
+
+    def __init__(self, bins, agents=(), full=(), ref_lat=None, version=None):
+        bins = list(bins)
+        if ref_lat is None:
+            ref_lat = sum(row[1] for row in bins) / len(bins) if bins else 0.0
+        self.ref_lat = ref_lat
+        self.version = version
+        self.bin_ids = [row[0] for row in bins]
+        self.bin_coords = [(row[1], row[2]) for row in bins]
+        self.bin_points = project(self.bin_coords, ref_lat)
+        self.bin_rows = {bin_id: i for i, bin_id in enumerate(self.bin_ids)}
+        self.bins = GridIndex(self.bin_points, cell_km=cell_size(self.bin_points)) if bins else None
+        self.set_full(full)
+        self.set_agents(agents)
+        self.checked = time.monotonic()
+
+    def set_full(self, full):
+        self.full = set(full)
+        self._clusters = {}  # cell_km -> full_clusters() result
+
+    def set_agents(self, agents):
+        self.agent_positions = {agent_id: (lat, lon) for agent_id, lat, lon in agents}
+        self._build_agents()
+
+    def move_agent(self, agent_id, latitude, longitude):
+        self.agent_positions[agent_id] = (latitude, longitude)
+        self._build_agents()
+
+    def _build_agents(self):
+        # Few agents per municipality, so rebuilding beats updating in place
+        self.agent_ids = list(self.agent_positions)
+        points = project(self.agent_positions.values(), self.ref_lat)
+        self.agents = GridIndex(points, cell_km=cell_size(points)) if points else None
+
+    def _point(self, latitude, longitude):
+        return project([(latitude, longitude)], self.ref_lat)[0]
+
+    def nearest_agents(self, latitude, longitude, k=5):
+        """``(agent_id, km)`` of the ``k`` agents nearest the point, closest first."""
+        if self.agents is None:
+            return []
+        x, y = self._point(latitude, longitude)
+        return [(self.agent_ids[i], d) for d, i in self.agents.k_nearest(x, y, k)]
+
+    def bins_within(self, latitude, longitude, radius_km, full_only=False):
+        """``(bin pk, km)`` of the bins within ``radius_km`` of the point, closest first."""
+        if self.bins is None:
+            return []
+        x, y = self._point(latitude, longitude)
+        found = [(self.bin_ids[i], d) for d, i in self.bins.within(x, y, radius_km)]
+        if full_only:
+            found = [(bin_id, d) for bin_id, d in found if bin_id in self.full]
+        return found
+
+    def full_clusters(self, cell_km=None):
+        """Group full bins into clusters, largest first.
+
+        Full bins are bucketed into ``cell_km`` cells (``CLUSTER_KM`` by
+        default). Occupied cells that touch, including at a corner, form
+        one cluster. Each cluster is a dict with the bin pks, their count
+        and the mean position. Results are kept until the full flags are
+        next refreshed.
+        """
+        cell_km = cell_km or _config()['CLUSTER_KM']
+        if cell_km not in self._clusters:
+            rows = (self.bin_rows.get(bin_id) for bin_id in self.full)
+            self._clusters[cell_km] = self._cluster([i for i in rows if i is not None], cell_km)
+        return self._clusters[cell_km]
+
+    def _cluster(self, rows, cell_km):
+        cells = defaultdict(list)
+        for i in rows:
+            x, y = self.bin_points[i]
+            cells[int(x // cell_km), int(y // cell_km)].append(i)
+
+        clusters = []
+        unvisited = set(cells)
+        while unvisited:
+            stack = [unvisited.pop()]
+            members = []
+            while stack:
+                cx, cy = stack.pop()
+                members += cells[cx, cy]
+                for neighbour in ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+                    if neighbour in unvisited:
+                        unvisited.remove(neighbour)
+                        stack.append(neighbour)
+            clusters.append({
+                'bins': sorted(self.bin_ids[i] for i in members),
+                'count': len(members),
+                'latitude': sum(self.bin_coords[i][0] for i in members) / len(members),
+                'longitude': sum(self.bin_coords[i][1] for i in members) / len(members),
+            })
+        clusters.sort(key=lambda cluster: (-cluster['count'], cluster['bins'][0]))
+        return clusters
+
+
+def _load_full(municipality_id):
+    return SmartBin.objects.filter(municipality_id=municipality_id, is_full=True).values_list('id', flat=True)
+
+
+def _load_agents(municipality_id):
+    return CollectionAgent.objects.filter(
+        municipality_id=municipality_id, is_approved=True, latitude__isnull=False, longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude')
+
+
+def build_index(municipality_id, version=None):
+    depot = Municipality.objects.filter(pk=municipality_id).values_list('latitude', flat=True).first()
+    bins = SmartBin.objects.filter(
+        municipality_id=municipality_id, latitude__isnull=False, longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude')
+    return SpatialIndex(bins, _load_agents(municipality_id), _load_full(municipality_id),
+                        ref_lat=depot, version=version)
+
+
+def get_index(municipality_id):
+    """The municipality's index, rebuilt or refreshed if it is out of date."""
+    index = _indexes.get(municipality_id)
+    if index is not None and time.monotonic() - index.checked < _config()['REFRESH']:
+        return index
+
+    version = cache.get_or_set(_version_key(municipality_id), 1, None)
+    if index is None or index.version != version:
+        index = build_index(municipality_id, version)
+    else:
+        index.set_full(_load_full(municipality_id))
+        index.set_agents(_load_agents(municipality_id))
+        index.checked = time.monotonic()
+    with _lock:
+        _indexes[municipality_id] = index
+    return index
+
+
+def invalidate(municipality_id):
+    """Rebuild the municipality's index in every process on its next refresh."""
+    def bump():
+        try:
+            cache.incr(_version_key(municipality_id))
+        except ValueError:
+            cache.set(_version_key(municipality_id), 2, None)
+        with _lock:
+            _indexes.pop(municipality_id, None)
+
+    # Bumped before commit, another process could rebuild from the old rows
+    transaction.on_commit(bump)
+
+
+def update_agent_position(agent, latitude, longitude):
+    """Store the agent's last-known position and move it in this process's index."""
+    now = timezone.now()
+    CollectionAgent.objects.filter(pk=agent.pk).update(
+        latitude=latitude, longitude=longitude, location_updated=now,
+    )
+    agent.latitude, agent.longitude, agent.location_updated = latitude, longitude, now
+    index = _indexes.get(agent.municipality_id)
+    if index is not None and agent.is_approved:
+        index.move_agent(agent.pk, latitude, longitude)
+
+
+def _position(instance):
+    # Deferred fields aren't loaded, and save() leaves them alone
+    return tuple(instance.__dict__.get(field) for field in ('municipality_id', 'latitude', 'longitude'))
+
+
+@receiver(post_init, sender=SmartBin)
+def _remember_position(sender, instance, **kwargs):
+    instance._spatial_position = _position(instance)
+
+
+@receiver(post_save, sender=SmartBin)
+def _bin_saved(sender, instance, created, **kwargs):
+    old = instance._spatial_position
+    new = _position(instance)
+    if created or old != new:
+        invalidate(instance.municipality_id)
+        if old[0] is not None and old[0] != new[0]:
+            invalidate(old[0])
+    instance._spatial_position = new
+
+
+@receiver(post_delete, sender=SmartBin)
+def _bin_deleted(sender, instance, **kwargs):
+    invalidate(instance.municipality_id)
@@ -0,0 +1,375 @@
+from datetime import datetime, timezone as dt_timezone
+import atexit
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import codec, dashcache, events, history
+from .models import SmartBin
+
+logger = logging.getLogger(__name__)
+
+# A bin counts as full from this fill level (percentage) upwards
+FULL_THRESHOLD = 75
+
+# Largest number of readings accepted in one batch request
+BATCH_MAX_READINGS = getattr(settings, 'SMARTBIN_BATCH_MAX_READINGS', 5000)
+
+
+class TelemetryError(ValueError):
+    pass
+
+
+def parse_batch(body, content_type=''):
+    """Decode a batch body into a list of raw reading dicts.
+
+    Accepts a JSON array, a JSON object with a ``readings`` array,
+    newline-delimited JSON (one reading per line), or the compact binary
+    format from ``codec`` which decodes to ``(bin_id, level, ts)`` tuples.
+    """
+    if content_type == codec.CONTENT_TYPE:
+        readings = codec.decode_readings(body)
+        if len(readings) > BATCH_MAX_READINGS:
+            raise TelemetryError(f'Batch too large (max {BATCH_MAX_READINGS} readings)')
+        return readings
+
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        readings = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        data = json.loads(text)
+        readings = data.get('readings') if isinstance(data, dict) else data
+
+    if not isinstance(readings, list):
+        raise TelemetryError('Expected an array of readings')
+    if len(readings) > BATCH_MAX_READINGS:
+        raise TelemetryError(f'Batch too large (max {BATCH_MAX_READINGS} readings)')
+    return readings
+
+
+def parse_timestamp(value):
+    if value in (None, ''):
+        return timezone.now()
+    try:
+        if isinstance(value, (int, float)):
+            ts = datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        else:
+            ts = parse_datetime(str(value))
+    except (ValueError, OverflowError, OSError):
+        # Out-of-range fields, NaN, or epochs the platform can't represent
+        ts = None
+    if ts is None:
+        raise TelemetryError(f'Invalid timestamp: {value}')
+    if settings.USE_TZ and timezone.is_naive(ts):
+        ts = timezone.make_aware(ts, dt_timezone.utc)
+    return ts
+
+
+def _check_level(level):
+    if not 0 <= level <= 100:
+        raise TelemetryError(f'Level out of range (0-100): {level}')
+    return level
+
+
+def clean_reading(raw):
+    """Validate one reading and return ``(bin_id, level, ts)``."""
+    if isinstance(raw, tuple):
+        bin_id, level, ts = raw
+        return bin_id, _check_level(level), parse_timestamp(ts or None)
+    if not isinstance(raw, dict):
+        raise TelemetryError('Reading must be an object')
+    bin_id = raw.get('bin_id')
+    if not bin_id:
+        raise TelemetryError('Missing bin_id')
+    try:
+        level = int(raw.get('level', 0))
+    except (TypeError, ValueError, OverflowError):
+        raise TelemetryError('Invalid level')
+    return str(bin_id), _check_level(level), parse_timestamp(raw.get('ts'))
+
+
+def write_levels(latest):
+    """Write ``{bin_id: (level, ts)}`` with one lookup and one bulk update.
+
+    Each written level is also appended to the bin's fill-level history.
+    Once the write commits, linked bins that are full with a new level are
+    published to the municipality event stream with their full table row,
+    and linked bins that stop being full are published as cleared. Returns
+    the set of bin ids that exist and were written.
+    """
+    bins = SmartBin.objects.filter(bin_id__in=list(latest)).select_related('customer__user').only(
+        'id', 'bin_id', 'municipality', 'customer', 'current_level', 'is_full', 'last_updated',
+        'customer__address', 'customer__user__username',
+    )
+    found = {}
+    full = []
+    cleared = []
+    listed = set()  # municipalities whose full-bin list changes
+    for bin in bins:
+        level, ts = latest[bin.bin_id]
+        is_full = level >= FULL_THRESHOLD
+        if is_full and (level != bin.current_level or not bin.is_full) and bin.customer_id is not None:
+            full.append((bin.municipality_id, {
+                'id': bin.id, 'bin_id': bin.bin_id, 'current_level': level,
+                'username': bin.customer.user.username, 'address': bin.customer.address,
+            }))
+        elif bin.is_full and not is_full and bin.customer_id is not None:
+            cleared.append((bin.municipality_id, bin.id, bin.bin_id, level, False))
+        if (is_full or bin.is_full) and bin.customer_id is not None:
+            listed.add(bin.municipality_id)
+        bin.current_level = level
+        bin.is_full = is_full
+        bin.last_updated = ts
+        found[bin.bin_id] = bin
+
+    with transaction.atomic():
+        SmartBin.objects.bulk_update(
+            found.values(), ['current_level', 'is_full', 'last_updated'], batch_size=500
+        )
+        history.record_samples([
+            (bin.id, bin.municipality_id, bin.last_updated, bin.current_level)
+            for bin in found.values()
+        ])
+        events.publish_full(full)
+        events.publish_flips(cleared)
+        dashcache.invalidate(*(f'municipality:{m}:bins' for m in listed))
+    return set(found)
+
+
+class TelemetryBuffer:
+    """In-process last-value cache that coalesces SmartBin writes.
+
+    Readings that repeat the last known level are dropped, bursts for the
+    same bin collapse into one pending write, and pending writes are
+    flushed in bulk every ``flush_interval`` seconds or once
+    ``flush_threshold`` bins are dirty. A reading that crosses
+    ``FULL_THRESHOLD`` in either direction flushes straight away so the
+    municipality ``full_bins`` list never lags behind. An unchanged bin is
+    still rewritten once ``max_age`` seconds have passed since its last
+    write, which keeps ``last_updated`` fresh and bounds drift when
+    several processes share the same bins.
+    """
+
+    def __init__(self, flush_interval=5.0, flush_threshold=500, max_age=300.0):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last = {}   # bin_id -> [level, is_full, written_at]
+        self._dirty = {}  # bin_id -> (level, ts)
+        self._last_flush = time.monotonic()
+        self._thread = None
+        self.counters = {
+            'received': 0,
+            'absorbed': 0,
+            'coalesced': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'urgent_flushes': 0,
+        }
+
+    def submit(self, latest):
+        """Buffer ``{bin_id: (level, ts)}`` and return the set of known bin ids."""
+        self._start()
+        with self._lock:
+            missing = [bin_id for bin_id in latest if bin_id not in self._last]
+        if missing:
+            self._seed(missing)
+
+        known = set()
+        urgent = False
+        now = time.monotonic()
+        with self._lock:
+            for bin_id, (level, ts) in latest.items():
+                last = self._last.get(bin_id)
+                if last is None:
+                    continue
+                known.add(bin_id)
+                self.counters['received'] += 1
+
+                prev_level, prev_full, written_at = last
+                pending = bin_id in self._dirty
+                if level == prev_level and (pending or now - written_at < self.max_age):
+                    self.counters['absorbed'] += 1
+                    continue
+                if pending:
+                    self.counters['coalesced'] += 1
+
+                is_full = level >= FULL_THRESHOLD
+                urgent = urgent or is_full != prev_full
+                self._dirty[bin_id] = (level, ts)
+                last[0], last[1] = level, is_full
+            due = (
+                len(self._dirty) >= self.flush_threshold
+                or now - self._last_flush >= self.flush_interval
+            )
+            if urgent:
+                self.counters['urgent_flushes'] += 1
+
+        if urgent or due:
+            self.flush()
+        return known
+
+    def flush(self):
+        """Write every dirty bin to the database in one bulk update."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                self._last_flush = time.monotonic()
+            if not dirty:
+                return 0
+
+            try:
+                written = write_levels(dirty)
+            except Exception:
+                # Put the batch back under any newer readings so the next flush
+                # retries it; the last-value cache already holds these levels
+                with self._lock:
+                    self._dirty = {**dirty, **self._dirty}
+                raise
+            now = time.monotonic()
+            with self._lock:
+                for bin_id in dirty:
+                    if bin_id in written:
+                        self._last[bin_id][2] = now
+                    else:
+                        self._last.pop(bin_id, None)
+                self.counters['flushed'] += len(written)
+                self.counters['flushes'] += 1
+            return len(written)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['pending'] = len(self._dirty)
+            stats['cached_bins'] = len(self._last)
+        return stats
+
+    def _seed(self, bin_ids):
+        rows = SmartBin.objects.filter(bin_id__in=bin_ids).values_list(
+            'bin_id', 'current_level', 'is_full'
+        )
+        now = time.monotonic()
+        with self._lock:
+            for bin_id, level, is_full in rows:
+                self._last.setdefault(bin_id, [level, is_full, now])
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='smartbin-buffer', daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('SmartBin buffer flush failed')
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Return the shared TelemetryBuffer, or None if buffering is disabled."""
+    global _buffer
+    config = getattr(settings, 'SMARTBIN_WRITE_BUFFER', {})
+    if not config.get('ENABLED', False):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = TelemetryBuffer(
+                    flush_interval=config.get('FLUSH_INTERVAL', 5.0),
+                    flush_threshold=config.get('FLUSH_THRESHOLD', 500),
+                    max_age=config.get('MAX_AGE', 300.0),
+                )
+    return _buffer
+
+
+def store_levels(latest):
+    """Store ``{bin_id: (level, ts)}`` through the write buffer if enabled.
+
+    Returns the set of bin ids that exist.
+    """
+    buffer = get_buffer()
+    if buffer is not None:
+        return buffer.submit(latest)
+    return write_levels(latest)
+
+
+def record_history(readings):
+    """Append ``(bin_id, level, ts)`` readings to history without touching the bins.
+
+    Devices that buffered readings while offline send them in one batch;
+    only the newest updates the bin, the older ones still belong in its
+    history.
+    """
+    if not readings:
+        return
+    bins = {
+        bin_id: (pk, municipality_id)
+        for bin_id, pk, municipality_id in SmartBin.objects.filter(
+            bin_id__in={bin_id for bin_id, _, _ in readings}
+        ).values_list('bin_id', 'id', 'municipality_id')
+    }
+    history.record_samples([
+        (*bins[bin_id], ts, level) for bin_id, level, ts in readings if bin_id in bins
+    ])
+
+
+def apply_readings(readings):
+    """Apply many readings with one lookup query and one bulk update.
+
+    Returns a per-reading list of ``{'bin_id', 'status', 'message'}``
+    dicts in the same order as ``readings``. When a bin appears more than
+    once, the reading with the newest timestamp wins and the others are
+    only added to its history. Goes through the write buffer when it is
+    enabled.
+    """
+    results = []
+    latest = {}
+    superseded = []
+
+    for raw in readings:
+        try:
+            bin_id, level, ts = clean_reading(raw)
+        except TelemetryError as e:
+            bin_id = raw.get('bin_id') if isinstance(raw, dict) else None
+            results.append({'bin_id': bin_id, 'status': 'error', 'message': str(e)})
+            continue
+        results.append({'bin_id': bin_id, 'status': 'success', 'message': 'Bin status updated'})
+        if bin_id not in latest or ts >= latest[bin_id][1]:
+            if bin_id in latest:
+                superseded.append((bin_id, *latest[bin_id]))
+            latest[bin_id] = (level, ts)
+        else:
+            superseded.append((bin_id, level, ts))
+
+    found = store_levels(latest)
+    record_history(superseded)
+
+    for result in results:
+        if result['status'] == 'success' and result['bin_id'] not in found:
+            result['status'] = 'error'
+            result['message'] = 'SmartBin matching query does not exist.'
+    return results
@@ -0,0 +1,137 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, reset_queries
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import telemetry
+from .management.commands.bench_dashboards import seed
+from .models import Municipality, SmartBin
+
+# Below and above PAGE_SIZE, so the larger scale fills every paged list
+SCALES = (5, 60)
+
+# Stand-ins for the dashboard templates that walk every list and the
+# related rows each view select_related()s, as the real pages do
+TEMPLATES = {
+    'municipality_dashboard.html': (
+        '{{ municipality.name }} {{ wallet_balance }} {{ counts.full_bins }}'
+        '{% for c in pending_customers %}{{ c.user.username }}{% endfor %}'
+        '{% for a in pending_agents %}{{ a.user.username }}{% endfor %}'
+        '{% for r in pending_recyclers %}{{ r.user.username }}{% endfor %}'
+        '{% for b in full_bins %}{{ b.bin_id }} {{ b.customer.user.username }}{% endfor %}'
+        '{% for b in soon_full_bins %}{{ b.bin_id }} {{ b.customer.user.username }}{% endfor %}'
+        '{% for c in pending_collections %}{{ c.customer.user.username }} '
+        '{{ c.collection_agent.user.username }}{% endfor %}'
+    ),
+    'customer_dashboard.html': (
+        '{{ customer.user.username }} {{ bin.bin_id }}'
+        '{% for c in collections %}{{ c.collection_agent.user.username }}{% endfor %}'
+        '{% for b in recycler_bookings %}{{ b.waste_type.name }}{% endfor %}'
+    ),
+    'agent_dashboard.html': (
+        '{{ agent.user.username }}'
+        '{% for t in tasks %}{{ t.customer.user.username }} {{ t.bin.bin_id }}{% endfor %}'
+        '{% for t in recycler_tasks %}{{ t.customer.user.username }} {{ t.waste_type.name }}{% endfor %}'
+    ),
+    'recycler_dashboard.html': (
+        '{{ recycler.company_name }} {{ counts.pending }}'
+        '{% for b in pending_bookings %}{{ b.customer.user.username }}{% endfor %}'
+        '{% for b in assigned_bookings %}{{ b.customer.user.username }} '
+        '{{ b.collection_agent.user.username }}{% endfor %}'
+    ),
+}
+
+# Queries per page load, including the session and user lookups
+EXPECTED_QUERIES = {
+    'municipality_dashboard': 13,
+    'customer_dashboard': 6,
+    'agent_dashboard': 5,
+    'recycler_dashboard': 6,
+}
+
+
+@override_settings(
+    TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', TEMPLATES)]},
+    }],
+    # Count the queries of a full render, not of cached fragments
+    SMARTBIN_DASHBOARD_CACHE={'ENABLED': False},
+)
+class DashboardQueryCountTests(TestCase):
+    """Each dashboard runs the same number of queries at every data scale."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.logins = {scale: seed(scale, f'test{scale}_') for scale in SCALES}
+
+    def assert_query_count(self, name):
+        for scale in SCALES:
+            with self.subTest(scale=scale):
+                self.client.force_login(self.logins[scale][name])
+                # The request_started signal clears the query log, so start it empty
+                reset_queries()
+                with self.assertNumQueries(EXPECTED_QUERIES[name]):
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_municipality_dashboard(self):
+        self.assert_query_count('municipality_dashboard')
+
+    def test_customer_dashboard(self):
+        self.assert_query_count('customer_dashboard')
+
+    def test_agent_dashboard(self):
+        self.assert_query_count('agent_dashboard')
+
+    def test_recycler_dashboard(self):
+        self.assert_query_count('recycler_dashboard')
+
+
+class TelemetryBufferTests(TestCase):
+    """A flush that fails keeps its readings for the next one."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('buffertest')
+        municipality = Municipality.objects.create(user=user, name='Test', area='Test', phone='0', address='Test')
+        SmartBin.objects.create(bin_id='BUF-1', municipality=municipality)
+
+    def setUp(self):
+        # Long enough that only the explicit flushes below write
+        self.buffer = telemetry.TelemetryBuffer(flush_interval=3600, flush_threshold=1000)
+        write_levels = telemetry.write_levels
+        failures = [OperationalError('database is locked')]
+
+        def fail_once(latest):
+            if failures:
+                raise failures.pop()
+            return write_levels(latest)
+
+        self.write_levels = mock.patch.object(telemetry, 'write_levels', fail_once)
+
+    def level(self):
+        return SmartBin.objects.get(bin_id='BUF-1').current_level
+
+    def test_failed_flush_is_retried(self):
+        self.buffer.submit({'BUF-1': (10, timezone.now())})
+        with self.write_levels:
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+            self.assertEqual(self.buffer.stats()['pending'], 1)
+            # The same level again is still only pending, not absorbed as written
+            self.buffer.submit({'BUF-1': (10, timezone.now())})
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.level(), 10)
+
+    def test_newer_reading_wins_over_failed_batch(self):
+        self.buffer.submit({'BUF-1': (10, timezone.now())})
+        with self.write_levels:
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+            self.buffer.submit({'BUF-1': (20, timezone.now())})
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.level(), 20)
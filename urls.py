@@ -23,6 +23,11 @@ urlpatterns = [
     path('municipality/dashboard/', views.municipality_dashboard, name='municipality_dashboard'),
     path('municipality/approve-customer/<int:customer_id>/', views.approve_customer, name='approve_customer'),
     path('municipality/assign-task/<int:bin_id>/', views.assign_collection_task, name='assign_collection_task'),
+    path('municipality/dispatch/', views.dispatch_routes, name='dispatch_routes'),
+    path('municipality/history/', views.municipality_history, name='municipality_history'),
+    path('municipality/forecast/', views.municipality_forecast, name='municipality_forecast'),
+    path('municipality/bulk/approve/', views.bulk_approve, name='bulk_approve'),
+    path('municipality/bulk/assign/', views.bulk_assign, name='bulk_assign'),
     
     # Recycler
     path('recycler/dashboard/', views.recycler_dashboard, name='recycler_dashboard'),
@@ -33,4 +38,18 @@ urlpatterns = [
     
     # API
     path('api/bin/update/', views.update_bin_status, name='update_bin_status'),
+    path('api/bin/update/batch/', views.update_bin_status_batch, name='update_bin_status_batch'),
+    path('api/bin/update/async/', views.update_bin_status_async, name='update_bin_status_async'),
+    path('api/bin/buffer/', views.bin_buffer_stats, name='bin_buffer_stats'),
+    path('api/cache/stats/', views.dashboard_cache_stats, name='dashboard_cache_stats'),
+    path('api/metrics/', views.prometheus_metrics, name='prometheus_metrics'),
+    path('api/analytics/', views.analytics_summary, name='analytics_summary'),
+    path('api/export/<str:name>/', views.export_records, name='export_records'),
+    path('api/bin/<str:bin_id>/history/', views.bin_history, name='bin_history'),
+    path('api/recyclers/quote/', views.recycler_quote, name='recycler_quote'),
+    path('api/agent/location/', views.agent_location, name='agent_location'),
+    path('api/bin/<str:bin_id>/agents/nearest/', views.nearest_agents, name='nearest_agents'),
+    path('api/bins/nearby/', views.nearby_bins, name='nearby_bins'),
+    path('api/bins/full/clusters/', views.full_bin_clusters, name='full_bin_clusters'),
+    path('events/full-bins/', views.full_bin_events, name='full_bin_events'),
 ]
\ No newline at end of file
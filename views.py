@@ -2,11 +2,53 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.views.decorators.csrf import csrf_exempt
-from datetime import datetime, date
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from asgiref.sync import sync_to_async
+from datetime import datetime, date, timedelta
 import json
 
+from .models import *
+from .forms import *
+from .telemetry import parse_batch, parse_timestamp, apply_readings, clean_reading, get_buffer, store_levels
+from . import (
+    analytics, bulk, dashcache, database, events, exports, forecast, history, metrics, pricing, routing, spatial, wallet,
+)
+from .async_ingest import get_queue, QueueFull
+from . import codec
+
+# Rows per page of the dashboard pending lists
+PAGE_SIZE = 50
+
+# Default and longest date range of the analytics summary, in days
+ANALYTICS_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+
+def _keyset_page(request, queryset, param, size=PAGE_SIZE):
+    """Return one page of ``queryset`` after the id cursor in ``request.GET[param]``.
+    
+    Paging by ``id > cursor`` keeps every page a single indexed range scan,
+    unlike OFFSET which re-reads all earlier rows.
+    """
+    try:
+        after = int(request.GET.get(param, 0))
+    except ValueError:
+        after = 0
+    rows = list(queryset.filter(id__gt=after).order_by('id')[:size + 1])
+    next_cursor = rows[size - 1].id if len(rows) > size else None
+    return rows[:size], next_cursor
+
+def _count(queryset):
+    """Correlated COUNT(*) subquery of ``queryset`` for use in annotate()."""
+    counted = queryset.order_by().annotate(group=Value(1)).values('group').annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
 # Home and Authentication Views
 def home(request):
     return render(request, 'home.html')
@@ -72,17 +114,23 @@ def logout_view(request):
 
 # Customer Views
 @login_required
+@database.replica_reads
 def customer_dashboard(request):
     customer = request.user.customer
     bin = SmartBin.objects.filter(customer=customer).first()
-    collections = WasteCollection.objects.filter(customer=customer).order_by('-created_at')[:5]
-    recycler_bookings = RecyclerBooking.objects.filter(customer=customer).order_by('-created_at')[:5]
+    activity = dashcache.fetch('customer.activity', [f'customer:{customer.id}'], lambda: {
+        'collections': list(WasteCollection.objects.filter(customer=customer).select_related(
+            'collection_agent__user'
+        ).order_by('-created_at')[:5]),
+        'recycler_bookings': list(
+            RecyclerBooking.objects.filter(customer=customer).select_related('waste_type').order_by('-created_at')[:5]
+        ),
+    })
     
     context = {
         'customer': customer,
         'bin': bin,
-        'collections': collections,
-        'recycler_bookings': recycler_bookings,
+        **activity,
     }
     return render(request, 'customer_dashboard.html', context)
 
@@ -112,11 +160,16 @@ def customer_wallet(request):
     customer = request.user.customer
     
     if request.method == 'POST':
-        amount = float(request.POST.get('amount', 0))
-        if amount > 0:
-            customer.wallet_balance += amount
-            customer.save()
-            messages.success(request, f'₹{amount} added to wallet!')
+        try:
+            entry, created = wallet.top_up(
+                customer, request.POST.get('amount', 0), request.POST.get('idempotency_key') or None
+            )
+        except wallet.WalletError as e:
+            messages.error(request, str(e))
+        else:
+            if created:
+                messages.success(request, f'₹{entry.amount} added to wallet!')
+            customer.refresh_from_db(fields=['wallet_balance'])
     
     return render(request, 'customer_wallet.html', {'customer': customer})
 
@@ -124,49 +177,75 @@ def customer_wallet(request):
 def book_recycler(request):
     customer = request.user.customer
     
+    book = pricing.get_price_book(customer.municipality_id)
+    
     if request.method == 'POST':
-        form = RecyclerBookingForm(request.POST)
+        form = RecyclerBookingForm(request.POST, municipality=customer.municipality)
         if form.is_valid():
             booking = form.save(commit=False)
             booking.customer = customer
-            
-            # Calculate amount based on waste type and weight
-            recycler = booking.recycler
-            weight = booking.weight
-            if booking.waste_type == 'plastic':
-                booking.amount = weight * recycler.plastic_rate
-            elif booking.waste_type == 'paper':
-                booking.amount = weight * recycler.paper_rate
-            elif booking.waste_type == 'metal':
-                booking.amount = weight * recycler.metal_rate
-            
-            booking.save()
-            messages.success(request, 'Recycler booking created!')
-            return redirect('customer_dashboard')
+            booking.amount = pricing.price(book, booking.recycler_id, booking.waste_type_id, booking.weight)
+            if booking.amount is None:
+                # The recycler or type changed since the book was cached
+                pricing.invalidate(customer.municipality_id)
+                book = pricing.get_price_book(customer.municipality_id)
+                booking.amount = pricing.price(book, booking.recycler_id, booking.waste_type_id, booking.weight)
+            if booking.amount is not None:
+                booking.save()
+                messages.success(request, 'Recycler booking created!')
+                return redirect('customer_dashboard')
+            form.add_error('recycler', 'This recycler is not available')
     else:
-        form = RecyclerBookingForm()
+        form = RecyclerBookingForm(municipality=customer.municipality)
+    
+    recyclers = [{'id': pk, 'company_name': name} for pk, name in book['recyclers'].items()]
+    return render(request, 'book_recycler.html', {'form': form, 'recyclers': recyclers, 'price_book': book})
+
+@login_required
+def recycler_quote(request):
+    user = request.user
+    if hasattr(user, 'customer'):
+        municipality_id = user.customer.municipality_id
+    elif hasattr(user, 'municipality'):
+        municipality_id = user.municipality.id
+    else:
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    
+    form = QuoteForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    waste_type = form.cleaned_data['waste_type']
+    weight = form.cleaned_data['weight']
     
-    recyclers = Recycler.objects.filter(is_approved=True, municipality=customer.municipality)
-    return render(request, 'book_recycler.html', {'form': form, 'recyclers': recyclers})
+    book = pricing.get_price_book(municipality_id)
+    if waste_type not in book['waste_types']:
+        return JsonResponse({'status': 'error', 'message': f'Unknown waste type: {waste_type}'}, status=400)
+    return JsonResponse({
+        'status': 'success',
+        'waste_type': waste_type,
+        'weight': weight,
+        'quotes': pricing.quote(municipality_id, waste_type, weight),
+    })
 
 # Collection Agent Views
 @login_required
+@database.replica_reads
 def agent_dashboard(request):
     agent = request.user.collectionagent
-    tasks = WasteCollection.objects.filter(
-        collection_agent=agent,
-        status__in=['assigned', 'collected']
-    ).order_by('collection_date')
-    
-    recycler_tasks = RecyclerBooking.objects.filter(
-        collection_agent=agent,
-        status__in=['assigned']
-    ).order_by('collection_date')
+    tasks = dashcache.fetch('agent.tasks', [f'agent:{agent.id}'], lambda: {
+        'tasks': list(WasteCollection.objects.filter(
+            collection_agent=agent,
+            status__in=['assigned', 'collected']
+        ).select_related('customer__user', 'bin').order_by('collection_date', 'route_order')),
+        'recycler_tasks': list(RecyclerBooking.objects.filter(
+            collection_agent=agent,
+            status__in=['assigned']
+        ).select_related('customer__user', 'waste_type').order_by('collection_date')),
+    })
     
     context = {
         'agent': agent,
-        'tasks': tasks,
-        'recycler_tasks': recycler_tasks,
+        **tasks,
     }
     return render(request, 'agent_dashboard.html', context)
 
@@ -179,7 +258,7 @@ def collect_waste(request, collection_id):
         
         if collection.bin and collection.bin.bin_id == bin_id:
             collection.status = 'collected'
-            collection.collected_at = datetime.now()
+            collection.collected_at = timezone.now()
             collection.save()
             messages.success(request, 'Waste collected! Waiting for customer verification.')
         else:
@@ -195,45 +274,104 @@ def verify_collection(request, collection_id):
     customer = request.user.customer
     
     if collection.customer == customer and collection.status == 'collected':
-        if customer.wallet_balance >= collection.amount:
-            customer.wallet_balance -= collection.amount
-            customer.save()
-            
-            collection.municipality.wallet_balance += collection.amount
-            collection.municipality.save()
-            
-            collection.status = 'verified'
-            collection.save()
-            
-            messages.success(request, 'Collection verified and payment completed!')
+        try:
+            _, created = wallet.pay_collection(collection)
+        except wallet.WalletError as e:
+            messages.error(request, str(e))
         else:
-            messages.error(request, 'Insufficient wallet balance')
+            if created:
+                messages.success(request, 'Collection verified and payment completed!')
+            else:
+                messages.info(request, 'Collection was already verified.')
     
     return redirect('customer_dashboard')
 
 # Municipality Views
 @login_required
+@database.replica_reads
 def municipality_dashboard(request):
     municipality = request.user.municipality
+    m = municipality.id
+    tags = {
+        'accounts': f'municipality:{m}:accounts',
+        'bins': f'municipality:{m}:bins',
+        'collections': f'municipality:{m}:collections',
+    }
     
-    pending_customers = Customer.objects.filter(municipality=municipality, is_approved=False)
-    pending_agents = CollectionAgent.objects.filter(municipality=municipality, is_approved=False)
-    pending_recyclers = Recycler.objects.filter(municipality=municipality, is_approved=False)
+    def build_accounts():
+        pending_customers, next_customers = _keyset_page(
+            request, Customer.objects.filter(municipality=m, is_approved=False).select_related('user'),
+            'customers_after')
+        pending_agents, next_agents = _keyset_page(
+            request, CollectionAgent.objects.filter(municipality=m, is_approved=False).select_related('user'),
+            'agents_after')
+        pending_recyclers, next_recyclers = _keyset_page(
+            request, Recycler.objects.filter(municipality=m, is_approved=False).select_related('user'),
+            'recyclers_after')
+        return {
+            'pending_customers': pending_customers,
+            'pending_agents': pending_agents,
+            'pending_recyclers': pending_recyclers,
+            'next_customers': next_customers,
+            'next_agents': next_agents,
+            'next_recyclers': next_recyclers,
+        }
     
-    full_bins = SmartBin.objects.filter(municipality=municipality, is_full=True, customer__isnull=False)
+    def build_bins():
+        full_bins, next_full_bins = _keyset_page(
+            request,
+            SmartBin.objects.filter(municipality=m, is_full=True, customer__isnull=False)
+            .select_related('customer__user'),
+            'bins_after',
+        )
+        return {'full_bins': full_bins, 'next_full_bins': next_full_bins}
     
-    pending_collections = WasteCollection.objects.filter(
-        municipality=municipality,
-        status='pending'
-    )
+    def build_collections():
+        pending_collections, next_collections = _keyset_page(
+            request,
+            WasteCollection.objects.filter(municipality=m, status='pending')
+            .select_related('customer__user', 'collection_agent__user'),
+            'collections_after',
+        )
+        return {'pending_collections': pending_collections, 'next_collections': next_collections}
+    
+    cursor = request.GET.get
+    accounts = dashcache.fetch('municipality.accounts', [tags['accounts']], build_accounts,
+                               vary=[cursor('customers_after'), cursor('agents_after'), cursor('recyclers_after')])
+    bins = dashcache.fetch('municipality.bins', [tags['bins']], build_bins, vary=[cursor('bins_after')])
+    collections = dashcache.fetch('municipality.collections', [tags['collections']], build_collections,
+                                  vary=[cursor('collections_after')])
+    
+    def build_counts():
+        # All list sizes in one query
+        here = OuterRef('pk')
+        return Municipality.objects.filter(pk=m).annotate(
+            pending_customers=_count(Customer.objects.filter(municipality=here, is_approved=False)),
+            pending_agents=_count(CollectionAgent.objects.filter(municipality=here, is_approved=False)),
+            pending_recyclers=_count(Recycler.objects.filter(municipality=here, is_approved=False)),
+            full_bins=_count(SmartBin.objects.filter(municipality=here, is_full=True, customer__isnull=False)),
+            pending_collections=_count(WasteCollection.objects.filter(municipality=here, status='pending')),
+        ).values(
+            'pending_customers', 'pending_agents', 'pending_recyclers', 'full_bins', 'pending_collections'
+        ).get()
+    
+    counts = dashcache.fetch('municipality.counts', list(tags.values()), build_counts)
+    
+    soon_full_bins = [
+        bin for bin in forecast.bins_predicted_full_by(municipality, timezone.now() + timedelta(days=1))
+        if not bin.is_full
+    ]
     
     context = {
         'municipality': municipality,
-        'pending_customers': pending_customers,
-        'pending_agents': pending_agents,
-        'pending_recyclers': pending_recyclers,
-        'full_bins': full_bins,
-        'pending_collections': pending_collections,
+        'wallet_balance': wallet.municipality_balance(municipality),
+        'dispatch_form': DispatchForm(initial={'collection_date': date.today()}),
+        'soon_full_bins': soon_full_bins,
+        'counts': counts,
+        'page_size': PAGE_SIZE,
+        **accounts,
+        **bins,
+        **collections,
     }
     return render(request, 'municipality_dashboard.html', context)
 
@@ -256,44 +394,149 @@ def assign_collection_task(request, bin_id):
         
         agent = get_object_or_404(CollectionAgent, id=agent_id)
         
-        collection = WasteCollection.objects.create(
-            customer=bin.customer,
-            bin=bin,
-            municipality=municipality,
-            collection_agent=agent,
-            collection_date=collection_date,
-            amount=municipality.collection_rate,
-            status='assigned'
-        )
-        
-        bin.is_full = False
-        bin.save()
+        with transaction.atomic():
+            # The bin lock serializes this with the scheduler and bulk assignment
+            bin = SmartBin.objects.select_for_update().get(id=bin.id)
+            if WasteCollection.objects.filter(bin=bin, status__in=routing.OPEN_STATUSES).exists():
+                messages.error(request, 'This bin already has an open collection.')
+                return redirect('municipality_dashboard')
+            
+            collection = WasteCollection.objects.create(
+                customer=bin.customer,
+                bin=bin,
+                municipality=municipality,
+                collection_agent=agent,
+                collection_date=collection_date,
+                amount=municipality.collection_rate,
+                status='assigned'
+            )
+            
+            was_full = bin.is_full
+            bin.is_full = False
+            bin.save()
+            if was_full:
+                events.publish_flips([(bin.municipality_id, bin.id, bin.bin_id, bin.current_level, False)])
         
         messages.success(request, 'Task assigned successfully!')
         return redirect('municipality_dashboard')
     
-    agents = CollectionAgent.objects.filter(municipality=municipality, is_approved=True)
+    agents = list(CollectionAgent.objects.filter(municipality=municipality, is_approved=True))
+    # Nearest agents first; agents that never reported a position go last
+    distances = {}
+    if bin.latitude is not None and bin.longitude is not None:
+        index = spatial.get_index(municipality.id)
+        distances = dict(index.nearest_agents(bin.latitude, bin.longitude, k=len(agents)))
+    for agent in agents:
+        agent.distance_km = distances.get(agent.id)
+    agents.sort(key=lambda agent: (agent.distance_km is None, agent.distance_km or 0))
     return render(request, 'assign_task.html', {'bin': bin, 'agents': agents})
 
+@login_required
+def dispatch_routes(request):
+    municipality = request.user.municipality
+    
+    if request.method == 'POST':
+        form = DispatchForm(request.POST)
+        if form.is_valid():
+            horizon_hours = form.cleaned_data['horizon_hours'] or 0
+            summary = routing.dispatch(
+                municipality,
+                form.cleaned_data['collection_date'],
+                horizon=timedelta(hours=horizon_hours) if horizon_hours else None,
+            )
+            messages.success(
+                request,
+                f"Assigned {summary['assigned']} bin(s) across {len(summary['routes'])} route(s). "
+                f"{summary['unassigned']} over capacity, {summary['missing_location']} without location."
+            )
+        else:
+            messages.error(request, 'Invalid dispatch request')
+    
+    return redirect('municipality_dashboard')
+
+@login_required
+def bulk_approve(request):
+    if request.method != 'POST' or not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise bulk.BulkError('Expected a JSON object')
+        ids_by_kind = {
+            kind: bulk.clean_ids(data[kind], kind)
+            for kind in bulk.APPROVABLE if kind in data
+        }
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    summary = bulk.approve_accounts(request.user.municipality, ids_by_kind)
+    return JsonResponse({'status': 'success', **summary})
+
+@login_required
+def bulk_assign(request):
+    if request.method != 'POST' or not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise bulk.BulkError('Expected a JSON object')
+        collection_date = parse_date(str(data.get('collection_date', '')))
+        if collection_date is None:
+            raise bulk.BulkError('collection_date must be YYYY-MM-DD')
+        items = data.get('assignments')
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise bulk.BulkError('assignments must be a list of {"bin": id, "agent": id} objects')
+        bins = [item.get('bin') for item in items]
+        agents = [item.get('agent') for item in items]
+        bulk.clean_ids(bins, 'bins')
+        bulk.clean_ids(agents, 'agents')
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    summary = bulk.assign_bins(request.user.municipality, list(zip(bins, agents)), collection_date)
+    return JsonResponse({'status': 'success', **summary})
+
 # Recycler Views
 @login_required
+@database.replica_reads
 def recycler_dashboard(request):
     recycler = request.user.recycler
     
-    pending_bookings = RecyclerBooking.objects.filter(
-        recycler=recycler,
-        status='pending'
-    )
+    def build_bookings():
+        pending_bookings = RecyclerBooking.objects.filter(
+            recycler=recycler,
+            status='pending'
+        ).select_related('customer__user')
+        
+        assigned_bookings = RecyclerBooking.objects.filter(
+            recycler=recycler,
+            status='assigned'
+        ).select_related('customer__user', 'collection_agent__user')
+        
+        counts = RecyclerBooking.objects.filter(recycler=recycler).aggregate(
+            pending=Count('id', filter=Q(status='pending')),
+            assigned=Count('id', filter=Q(status='assigned')),
+            collected=Count('id', filter=Q(status='collected')),
+        )
+        
+        pending_bookings, next_pending = _keyset_page(request, pending_bookings, 'pending_after')
+        assigned_bookings, next_assigned = _keyset_page(request, assigned_bookings, 'assigned_after')
+        return {
+            'pending_bookings': pending_bookings,
+            'assigned_bookings': assigned_bookings,
+            'counts': counts,
+            'next_pending': next_pending,
+            'next_assigned': next_assigned,
+        }
     
-    assigned_bookings = RecyclerBooking.objects.filter(
-        recycler=recycler,
-        status='assigned'
-    )
+    bookings = dashcache.fetch('recycler.bookings', [f'recycler:{recycler.id}'], build_bookings,
+                               vary=[request.GET.get('pending_after'), request.GET.get('assigned_after')])
     
     context = {
         'recycler': recycler,
-        'pending_bookings': pending_bookings,
-        'assigned_bookings': assigned_bookings,
+        **bookings,
     }
     return render(request, 'recycler_dashboard.html', context)
 
@@ -318,29 +561,324 @@ def assign_recycler_task(request, booking_id):
 
 # Admin Views
 @login_required
+@database.replica_reads
 def admin_dashboard(request):
     if not request.user.is_superuser:
         return redirect('home')
     
-    municipalities = Municipality.objects.all()
-    return render(request, 'admin_dashboard.html', {'municipalities': municipalities})
+    municipalities = dashcache.fetch('admin.municipalities', ['municipalities'],
+                                     lambda: list(Municipality.objects.all()))
+    today = timezone.localdate()
+    return render(request, 'admin_dashboard.html', {
+        'municipalities': municipalities,
+        'analytics': analytics.summary(today - timedelta(days=ANALYTICS_DAYS - 1), today),
+    })
+
+@login_required
+@database.replica_reads
+def analytics_summary(request):
+    user = request.user
+    form = AnalyticsForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    end = form.cleaned_data['end'] or timezone.localdate()
+    start = form.cleaned_data['start'] or end - timedelta(days=ANALYTICS_DAYS - 1)
+    if start > end or (end - start).days >= ANALYTICS_MAX_DAYS:
+        return JsonResponse({'status': 'error', 'message': f'Pick a range of 1 to {ANALYTICS_MAX_DAYS} days'},
+                            status=400)
+    
+    if user.is_superuser:
+        municipality = form.cleaned_data['municipality']
+        municipality_ids = None if municipality is None else [municipality]
+    elif hasattr(user, 'municipality'):
+        municipality_ids = [user.municipality.id]
+    else:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    return JsonResponse({'status': 'success', **analytics.summary(start, end, municipality_ids)})
+
+@login_required
+@database.replica_reads
+def export_records(request, name):
+    if name not in exports.EXPORTS:
+        return JsonResponse({'status': 'error', 'message': 'Unknown export'}, status=404)
+    user = request.user
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    filters = form.cleaned_data
+    # Defaults to the current month, the statement period
+    end = filters['end'] or timezone.localdate()
+    start = filters['start'] or end.replace(day=1)
+    if start > end:
+        return JsonResponse({'status': 'error', 'message': 'start is after end'}, status=400)
+    
+    municipality, recycler = filters['municipality'], filters['recycler']
+    if user.is_superuser:
+        pass
+    elif hasattr(user, 'municipality'):
+        municipality = user.municipality.id
+    elif hasattr(user, 'recycler') and name == 'bookings':
+        municipality, recycler = None, user.recycler.id
+    else:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    
+    try:
+        return exports.stream(name, filters['format'] or 'csv', start, end, municipality=municipality,
+                              recycler=recycler, status=filters['status'])
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 # API for Smart Bin (IoT)
 @csrf_exempt
 def update_bin_status(request):
     if request.method == 'POST':
+        if request.content_type == codec.CONTENT_TYPE:
+            return update_bin_status_batch(request)
+        
         try:
-            data = json.loads(request.body)
-            bin_id = data.get('bin_id')
-            level = int(data.get('level', 0))
-            
-            bin = SmartBin.objects.get(bin_id=bin_id)
-            bin.current_level = level
-            bin.is_full = level >= 75
-            bin.save()
+            bin_id, level, ts = clean_reading(json.loads(request.body))
+        except ValueError as e:
+            metrics.count_readings(rejected=1)
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        
+        try:
+            if bin_id not in store_levels({bin_id: (level, ts)}):
+                raise SmartBin.DoesNotExist('SmartBin matching query does not exist.')
             
+            metrics.count_readings(accepted=1)
             return JsonResponse({'status': 'success', 'message': 'Bin status updated'})
         except Exception as e:
+            metrics.count_readings(rejected=1)
             return JsonResponse({'status': 'error', 'message': str(e)})
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request'})
+
+async def update_bin_status_async(request):
+    if request.method == 'POST':
+        try:
+            bin_id, level, ts = clean_reading(json.loads(request.body))
+        except ValueError as e:
+            metrics.count_readings(rejected=1)
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        
+        if not isinstance(request, ASGIRequest):
+            # Under WSGI each request runs on its own event loop, which would
+            # strand queued readings, so write straight through
+            found = await sync_to_async(store_levels)({bin_id: (level, ts)})
+            if bin_id not in found:
+                metrics.count_readings(rejected=1)
+                return JsonResponse({'status': 'error', 'message': 'SmartBin matching query does not exist.'},
+                                    status=404)
+            metrics.count_readings(accepted=1)
+            return JsonResponse({'status': 'success', 'message': 'Bin status updated'})
+        
+        try:
+            get_queue().put(bin_id, level, ts)
+        except QueueFull as e:
+            metrics.count_readings(rejected=1)
+            response = JsonResponse({'status': 'error', 'message': str(e)}, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        
+        metrics.count_readings(accepted=1)
+        return JsonResponse({'status': 'success', 'message': 'Bin status accepted'}, status=202)
+    
+    return JsonResponse({'status': 'error', 'message': 'Invalid request'})
+
+# csrf_exempt() would wrap the coroutine in a sync function on Django 3.2
+update_bin_status_async.csrf_exempt = True
+
+@csrf_exempt
+def update_bin_status_batch(request):
+    if request.method == 'POST':
+        try:
+            readings = parse_batch(request.body, request.content_type)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        
+        results = apply_readings(readings)
+        updated = sum(1 for r in results if r['status'] == 'success')
+        metrics.count_readings(accepted=updated, rejected=len(results) - updated)
+        return JsonResponse({
+            'status': 'success',
+            'updated': updated,
+            'errors': len(results) - updated,
+            'results': results,
+        })
+    
+    return JsonResponse({'status': 'error', 'message': 'Invalid request'})
+
+@login_required
+def bin_buffer_stats(request):
+    if not request.user.is_superuser:
+        return redirect('home')
+    
+    buffer = get_buffer()
+    if buffer is None:
+        return JsonResponse({'status': 'error', 'message': 'Write buffer is disabled'})
+    return JsonResponse({'status': 'success', 'stats': buffer.stats()})
+
+@login_required
+def dashboard_cache_stats(request):
+    if not request.user.is_superuser:
+        return redirect('home')
+    
+    return JsonResponse({'status': 'success', **dashcache.stats()})
+
+@login_required
+def agent_location(request):
+    if request.method != 'POST' or not hasattr(request.user, 'collectionagent'):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    
+    form = PositionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    spatial.update_agent_position(request.user.collectionagent, form.cleaned_data['latitude'],
+                                  form.cleaned_data['longitude'])
+    return JsonResponse({'status': 'success'})
+
+@login_required
+def nearest_agents(request, bin_id):
+    if not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    bin = get_object_or_404(SmartBin, bin_id=bin_id, municipality=request.user.municipality)
+    if bin.latitude is None or bin.longitude is None:
+        return JsonResponse({'status': 'error', 'message': 'Bin has no location'}, status=400)
+    try:
+        k = max(1, min(50, int(request.GET.get('k', 5))))
+    except ValueError:
+        k = 5
+    
+    index = spatial.get_index(bin.municipality_id)
+    return JsonResponse({
+        'status': 'success',
+        'agents': [
+            {'id': agent_id, 'distance_km': round(km, 3)}
+            for agent_id, km in index.nearest_agents(bin.latitude, bin.longitude, k)
+        ],
+    })
+
+@login_required
+def nearby_bins(request):
+    if not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    form = NearbyBinsForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    
+    index = spatial.get_index(request.user.municipality.id)
+    found = index.bins_within(form.cleaned_data['latitude'], form.cleaned_data['longitude'],
+                              form.cleaned_data['radius_km'], full_only=form.cleaned_data['full'])
+    return JsonResponse({
+        'status': 'success',
+        'bins': [{'id': bin_id, 'distance_km': round(km, 3)} for bin_id, km in found],
+    })
+
+@login_required
+def full_bin_clusters(request):
+    if not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    form = ClusterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    
+    index = spatial.get_index(request.user.municipality.id)
+    return JsonResponse({'status': 'success', 'clusters': index.full_clusters(form.cleaned_data['cell_km'])})
+
+def full_bin_events(request):
+    # events.EventStreamRouter answers this URL before Django under ASGI
+    return JsonResponse(
+        {'status': 'error', 'message': 'The event stream is served by events.EventStreamRouter under ASGI'},
+        status=503,
+    )
+
+def prometheus_metrics(request):
+    if not metrics.authorized(request):
+        return HttpResponse(status=403)
+    
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _history_time(value):
+    """Parse a history ``start``/``end``; a bare date means midnight UTC."""
+    day = parse_date(value) if value else None
+    return parse_timestamp(f'{day}T00:00:00' if day else value)
+
+def _history_range(request):
+    end = _history_time(request.GET.get('end'))
+    start = request.GET.get('start')
+    start = _history_time(start) if start else end - timedelta(days=1)
+    resolution = request.GET.get('resolution')
+    if resolution == 'raw':
+        resolution = None
+    elif resolution:
+        choices = ', '.join(str(res) for res in history.RESOLUTIONS)
+        if not resolution.isdigit() or int(resolution) not in history.RESOLUTIONS:
+            raise ValueError(f'resolution must be raw, {choices}')
+        resolution = int(resolution)
+    else:
+        resolution = history.pick_resolution(start, end)
+    return start, end, resolution
+
+@login_required
+@database.replica_reads
+def bin_history(request, bin_id):
+    bin = get_object_or_404(SmartBin, bin_id=bin_id)
+    user = request.user
+    allowed = (
+        user.is_superuser
+        or (hasattr(user, 'municipality') and bin.municipality_id == user.municipality.id)
+        or (hasattr(user, 'customer') and bin.customer_id == user.customer.id)
+    )
+    if not allowed:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    
+    try:
+        start, end, resolution = _history_range(request)
+        points = history.bin_history(bin, start, end, resolution)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    return JsonResponse({'status': 'success', 'bin_id': bin.bin_id, 'resolution': resolution, 'points': points})
+
+@login_required
+@database.replica_reads
+def municipality_forecast(request):
+    if not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    municipality = request.user.municipality
+    
+    try:
+        by = parse_timestamp(request.GET.get('by')) if request.GET.get('by') else timezone.now() + timedelta(days=1)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    bins = forecast.bins_predicted_full_by(municipality, by)
+    return JsonResponse({
+        'status': 'success',
+        'by': by,
+        'bins': [
+            {
+                'id': bin.id,
+                'bin_id': bin.bin_id,
+                'current_level': bin.current_level,
+                'fill_rate': round(bin.fill_rate, 2),
+                'predicted_full_at': bin.predicted_full_at,
+            }
+            for bin in bins
+        ],
+    })
+
+@login_required
+@database.replica_reads
+def municipality_history(request):
+    if not hasattr(request.user, 'municipality'):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    municipality = request.user.municipality
+    
+    try:
+        start, end, resolution = _history_range(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    points = history.municipality_history(municipality, start, end, resolution or 300)
+    return JsonResponse({'status': 'success', 'resolution': resolution or 300, 'points': points})
@@ -0,0 +1,186 @@
+"""Wallet ledger and balance updates.
+
+Every balance change appends a ``WalletTransaction`` and adjusts the
+cached ``wallet_balance`` column with a single ``F()`` update in the same
+transaction, so concurrent requests never overwrite each other. Debits
+are conditional updates (``wallet_balance >= amount``) rather than a
+read-then-write, and top-ups are conditional the same way on the result
+fitting the column (``MAX_BALANCE``).
+
+Municipalities are credited by every verified collection in their area,
+which would make their row the hottest lock in the database. Credits are
+therefore added to one of ``CREDIT_SHARDS`` ``MunicipalityCreditShard``
+rows picked at random and folded into ``wallet_balance`` by
+``settle_credits`` (the ``settle_wallets`` command). ``municipality_balance``
+includes the unsettled shards.
+
+Payments carry an idempotency key stored on their ledger entry; replaying
+a key is a no-op that returns the original transaction. Client keys are
+namespaced per customer (``topup:<customer>:<key>``) and the server's
+per-collection keys are ``collection:<pk>``, so one can never replay the
+other. A replay whose entry doesn't match what was asked for raises
+``WalletError``.
+"""
+from decimal import Decimal, InvalidOperation
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from . import analytics, dashcache
+from .models import Customer, Municipality, MunicipalityCreditShard, WalletTransaction, WasteCollection
+
+CREDIT_SHARDS = getattr(settings, 'SMARTBIN_WALLET', {}).get('CREDIT_SHARDS', 8)
+
+CENT = Decimal('0.01')
+
+# Longest client idempotency key; the stored key adds a namespace prefix
+KEY_LENGTH = 64
+
+# Largest value a wallet_balance column holds
+_balance = Customer._meta.get_field('wallet_balance')
+MAX_BALANCE = Decimal(10) ** (_balance.max_digits - _balance.decimal_places) - CENT
+
+
+class WalletError(ValueError):
+    pass
+
+
+class InsufficientFunds(WalletError):
+    pass
+
+
+def parse_amount(value):
+    """Parse a positive money amount no larger than ``MAX_BALANCE``, rounded to paise."""
+    try:
+        amount = Decimal(str(value)).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        raise WalletError('Invalid amount')
+    if not amount.is_finite() or amount <= 0:
+        raise WalletError('Amount must be positive')
+    if amount > MAX_BALANCE:
+        raise WalletError(f'Amount must be at most {MAX_BALANCE}')
+    return amount
+
+
+def _replayed(key, **expected):
+    """The entry stored under ``key``, which must have the ``expected`` fields."""
+    entry = WalletTransaction.objects.get(idempotency_key=key)
+    if any(getattr(entry, field) != value for field, value in expected.items()):
+        raise WalletError('Idempotency key already used for a different transaction')
+    return entry
+
+
+def top_up(customer, amount, idempotency_key=None):
+    """Credit a customer's wallet. Returns ``(transaction, created)``.
+
+    Raises ``WalletError`` if the balance would go past ``MAX_BALANCE``.
+    """
+    amount = parse_amount(amount)
+    key = None
+    if idempotency_key is not None:
+        if len(idempotency_key) > KEY_LENGTH:
+            raise WalletError(f'Idempotency key longer than {KEY_LENGTH} characters')
+        key = f'topup:{customer.pk}:{idempotency_key}'
+    try:
+        with transaction.atomic():
+            entry = WalletTransaction.objects.create(
+                customer=customer, kind='topup', amount=amount, idempotency_key=key,
+            )
+            credited = Customer.objects.filter(
+                pk=customer.pk, wallet_balance__lte=MAX_BALANCE - amount,
+            ).update(wallet_balance=F('wallet_balance') + amount)
+            if not credited:
+                raise WalletError(f'Wallet balance can be at most {MAX_BALANCE}')
+    except IntegrityError:
+        if key is None:
+            raise
+        return _replayed(key, kind='topup', customer_id=customer.pk, amount=amount), False
+    return entry, True
+
+
+def credit_municipality(municipality_id, amount):
+    """Add ``amount`` to a random credit shard of the municipality."""
+    shard = random.randrange(CREDIT_SHARDS)
+    shards = MunicipalityCreditShard.objects.filter(municipality_id=municipality_id, shard=shard)
+    if not shards.update(amount=F('amount') + amount):
+        MunicipalityCreditShard.objects.bulk_create(
+            [MunicipalityCreditShard(municipality_id=municipality_id, shard=i) for i in range(CREDIT_SHARDS)],
+            ignore_conflicts=True,
+        )
+        shards.update(amount=F('amount') + amount)
+
+
+def pay_collection(collection, idempotency_key=None):
+    """Move a collected WasteCollection's amount from customer to municipality.
+
+    Marks the collection verified. The key defaults to one per collection,
+    so a repeated verification is a no-op. Returns ``(transaction,
+    created)``; raises ``InsufficientFunds``, or ``WalletError`` also when
+    the key belongs to another transaction.
+    """
+    key = idempotency_key or f'collection:{collection.pk}'
+    amount = collection.amount
+    try:
+        with transaction.atomic():
+            debit = WalletTransaction.objects.create(
+                customer_id=collection.customer_id, collection=collection,
+                kind='collection_payment', amount=-amount, idempotency_key=key,
+            )
+            debited = Customer.objects.filter(
+                pk=collection.customer_id, wallet_balance__gte=amount,
+            ).update(wallet_balance=F('wallet_balance') - amount)
+            if not debited:
+                raise InsufficientFunds('Insufficient wallet balance')
+            verified = WasteCollection.objects.filter(
+                pk=collection.pk, status='collected',
+            ).update(status='verified')
+            if not verified:
+                raise WalletError('Collection is not awaiting verification')
+            WalletTransaction.objects.create(
+                municipality_id=collection.municipality_id, collection=collection,
+                kind='collection_credit', amount=amount,
+            )
+            credit_municipality(collection.municipality_id, amount)
+            analytics.record_verified(collection.municipality_id, amount)
+            dashcache.invalidate(*dashcache.collection_tags(
+                collection.municipality_id, collection.customer_id, collection.collection_agent_id))
+    except IntegrityError:
+        return _replayed(key, kind='collection_payment', collection_id=collection.pk), False
+    collection.status = 'verified'
+    return debit, True
+
+
+def settle_credits(municipality_ids=None):
+    """Fold credit shards into ``Municipality.wallet_balance``.
+
+    Returns the number of municipalities settled.
+    """
+    pending = MunicipalityCreditShard.objects.exclude(amount=0)
+    if municipality_ids is not None:
+        pending = pending.filter(municipality_id__in=municipality_ids)
+    settled = 0
+    for municipality_id in pending.values_list('municipality_id', flat=True).distinct():
+        with transaction.atomic():
+            shards = list(
+                MunicipalityCreditShard.objects.select_for_update()
+                .filter(municipality_id=municipality_id).exclude(amount=0)
+            )
+            total = Decimal(0)
+            for shard in shards:
+                # Subtract what was read so credits landing meanwhile survive
+                MunicipalityCreditShard.objects.filter(pk=shard.pk).update(amount=F('amount') - shard.amount)
+                total += shard.amount
+            Municipality.objects.filter(pk=municipality_id).update(wallet_balance=F('wallet_balance') + total)
+            dashcache.invalidate('municipalities')
+        settled += 1
+    return settled
+
+
+def municipality_balance(municipality):
+    """Settled balance plus credits still sitting in shards."""
+    pending = MunicipalityCreditShard.objects.filter(
+        municipality=municipality,
+    ).aggregate(total=Sum('amount'))['total']
+    return municipality.wallet_balance + (pending or 0)